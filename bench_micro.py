@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+import argparse
+import contextlib
+import csv
+import io
+import json
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+import zipfile
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import aggregate_by_node
+import enrich_hostingorg
+import gbif_sql_download
+import preload_nodes
+from recordedby_schemes import count_columns, stat_headers
+
+
+DEFAULT_SIZES = [2_500, 25_000, 250_000, 5_000_000]
+N_NODES = 170
+COUNT_COLS = count_columns()
+
+
+# Synthetic inputs, shaped like the real files
+
+def _keys(n: int, salt: str) -> List[str]:
+    rng = random.Random(salt)
+    return [str(uuid.UUID(int=rng.getrandbits(128), version=4)) for _ in range(n)]
+
+
+def _stat_values(rng: random.Random) -> List[str]:
+    total = rng.randint(1, 100000)
+    with_id = rng.randint(0, total)
+    valid = rng.randint(0, with_id)
+    counts = [with_id, valid, with_id - valid] + [rng.randint(0, valid) for _ in COUNT_COLS[4:]]
+    values = [str(total)]
+    for v in counts:
+        values.append(str(v))
+        values.append(f"{100.0 * v / total:.14f}")
+    return values
+
+
+def write_stats_tsv(path: Path, key_header: List[str], n: int, with_name: bool) -> List[str]:
+    rng = random.Random(n)
+    keys = _keys(n, f"stats-{n}")
+    with path.open("w", encoding="utf-8", newline="") as f:
+        f.write("\t".join(key_header + stat_headers()) + "\n")
+        for i, key in enumerate(keys):
+            lead = [key, f"Publisher {i}", f"https://www.gbif.org/publisher/{key}"] if with_name else [key]
+            f.write("\t".join(lead + _stat_values(rng)) + "\n")
+    return keys
+
+
+def make_nodes(org_keys: List[str]) -> tuple:
+    nodes = [{"key": k, "title": f"Node {j}"} for j, k in enumerate(_keys(N_NODES, "nodes"))]
+    node_orgs: Dict[str, List[dict]] = {n["key"]: [] for n in nodes}
+    for i, org in enumerate(org_keys):
+        node_orgs[nodes[i % N_NODES]["key"]].append({"key": org, "title": f"Publisher {i}"})
+    return nodes, node_orgs
+
+
+# Benchmarks: setup(n, tmp) returns the callable that is timed
+
+def bench_read_publisher_stats(n: int, tmp: Path) -> Callable[[], object]:
+    path = tmp / "publisher.tsv"
+    write_stats_tsv(path, ["publishingorgkey", "publishername", "publisherurl"], n, with_name=True)
+    return lambda: aggregate_by_node.read_publisher_stats(path)
+
+
+def bench_read_node_org_map(n: int, tmp: Path) -> Callable[[], object]:
+    path = tmp / "node-org-map.csv"
+    nodes, node_orgs = make_nodes(_keys(n, f"orgs-{n}"))
+    with path.open("w", encoding="utf-8", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(["nodeKey", "nodeTitle", "publishingOrgKey", "publisherName"])
+        for node in nodes:
+            for o in node_orgs[node["key"]]:
+                w.writerow([node["key"], node["title"], o["key"], o["title"]])
+    return lambda: aggregate_by_node.read_node_org_map(path)
+
+
+def bench_write_node_aggregates(n: int, tmp: Path) -> Callable[[], object]:
+    path = tmp / "publisher.tsv"
+    keys = write_stats_tsv(path, ["publishingorgkey", "publishername", "publisherurl"], n, with_name=True)
+    pub_stats = aggregate_by_node.read_publisher_stats(path)
+    nodes, node_orgs = make_nodes(keys)
+    node_to_orgs = {node["key"]: [(o["key"], node["title"]) for o in node_orgs[node["key"]]] for node in nodes}
+    nodes_json = tmp / "nodes.json"
+    nodes_json.write_text(json.dumps([{"nodeKey": nd["key"], "nodeTitle": nd["title"]} for nd in nodes]), encoding="utf-8")
+    out = tmp / "by-node.csv"
+    return lambda: aggregate_by_node.write_node_aggregates(node_to_orgs, pub_stats, nodes_json, out)
+
+
+def bench_enrich_csv(n: int, tmp: Path) -> Callable[[], object]:
+    src = tmp / "hosting.tsv"
+    write_stats_tsv(src, ["hostingorganizationkey"], n, with_name=False)
+    out = tmp / "hosting-enriched.csv"
+
+    def stub_fetch(org_key, session, timeout_s=20, cache=None):
+        return {"publisherName": f"Org {org_key[:8]}", "publisherCountry": "DE", "endorsingNodeKey": "", "publisherType": "OTHER"}
+
+    def run() -> None:
+        # Registry lookups are stubbed so only parsing, dispatch and writing are measured
+        original = enrich_hostingorg.fetch_org
+        enrich_hostingorg.fetch_org = stub_fetch
+        try:
+            with contextlib.redirect_stderr(io.StringIO()):
+                enrich_hostingorg.enrich_csv(src, out)
+        finally:
+            enrich_hostingorg.fetch_org = original
+    return run
+
+
+def bench_preload_write_outputs(n: int, tmp: Path) -> Callable[[], object]:
+    nodes, node_orgs = make_nodes(_keys(n, f"orgs-{n}"))
+    out_dir = tmp / "nodes"
+    return lambda: preload_nodes.write_outputs(nodes, node_orgs, out_dir)
+
+
+def bench_extract_zip(n: int, tmp: Path) -> Callable[[], object]:
+    tsv = tmp / "publisher.tsv"
+    write_stats_tsv(tsv, ["publishingorgkey", "publishername", "publisherurl"], n, with_name=True)
+    zip_path = tmp / "result.zip"
+    with zipfile.ZipFile(zip_path, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        zf.write(tsv, "0000000-000000000000000.csv")
+    tsv.unlink()
+    out_dir = tmp / "extracted"
+
+    def run() -> None:
+        shutil.rmtree(out_dir, ignore_errors=True)
+        gbif_sql_download.extract_zip(zip_path, out_dir)
+    return run
+
+
+BENCHMARKS: Dict[str, Callable[[int, Path], Callable[[], object]]] = {
+    "read_publisher_stats": bench_read_publisher_stats,
+    "read_node_org_map": bench_read_node_org_map,
+    "write_node_aggregates": bench_write_node_aggregates,
+    "enrich_csv": bench_enrich_csv,
+    "preload_write_outputs": bench_preload_write_outputs,
+    "extract_zip": bench_extract_zip,
+}
+
+
+def run_one(name: str, n: int, repeat: int) -> Dict[str, object]:
+    with tempfile.TemporaryDirectory(prefix=f"bench-{name}-") as d:
+        fn = BENCHMARKS[name](n, Path(d))
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            times.append(time.perf_counter() - start)
+        # Separate traced run: tracemalloc slows the code down, so it is not timed
+        tracemalloc.start()
+        fn()
+        _current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    median = statistics.median(times)
+    return {
+        "name": name,
+        "rows": n,
+        "repeat": repeat,
+        "min_s": round(min(times), 6),
+        "median_s": round(median, 6),
+        "rows_per_s": round(n / median, 1) if median > 0 else None,
+        "peak_mem_mb": round(peak / 1024 / 1024, 2),
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True, cwd=Path(__file__).parent).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: List[Dict[str, object]], baseline: Dict[str, object], threshold: float) -> List[str]:
+    base = {(r["name"], r["rows"]): r for r in baseline.get("results", [])}
+    regressions = []
+    for r in results:
+        b = base.get((r["name"], r["rows"]))
+        if not b or not b.get("median_s"):
+            continue
+        ratio = r["median_s"] / b["median_s"]
+        r["baseline_median_s"] = b["median_s"]
+        r["ratio"] = round(ratio, 3)
+        if ratio > 1 + threshold:
+            regressions.append(f"{r['name']} @ {r['rows']} rows: {b['median_s']:.4f}s -> {r['median_s']:.4f}s ({ratio:.2f}x)")
+    return regressions
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Micro-benchmarks of the parsing, aggregation and output hot paths on generated inputs")
+    p.add_argument("--sizes", default=",".join(str(s) for s in DEFAULT_SIZES), help="Comma-separated row counts (default: 2500,25000,250000,5000000)")
+    p.add_argument("--only", nargs="*", choices=sorted(BENCHMARKS), help="Run only these benchmarks")
+    p.add_argument("--repeat", type=int, default=5, help="Timed repetitions per case; inputs of 1M+ rows run once (default: 5)")
+    p.add_argument("--out", type=Path, help="Write results as JSON")
+    p.add_argument("--save-baseline", type=Path, help="Store these results as the baseline")
+    p.add_argument("--baseline", type=Path, help="Compare against a stored baseline")
+    p.add_argument("--threshold", type=float, default=0.2, help="Allowed median slowdown vs. the baseline before failing (default: 0.2 = 20%%)")
+    return p.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    names = args.only or list(BENCHMARKS)
+
+    results = []
+    print(f"{'benchmark':<24} {'rows':>9} {'median s':>10} {'rows/s':>12} {'peak MB':>9}")
+    for name in names:
+        for n in sizes:
+            r = run_one(name, n, args.repeat if n < 1_000_000 else 1)
+            results.append(r)
+            print(f"{name:<24} {n:>9} {r['median_s']:>10.4f} {r['rows_per_s'] or 0:>12.0f} {r['peak_mem_mb']:>9.1f}", flush=True)
+
+    regressions: List[str] = []
+    if args.baseline:
+        regressions = compare(results, json.loads(args.baseline.read_text(encoding="utf-8")), args.threshold)
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    for path in (args.out, args.save_baseline):
+        if path:
+            path.write_text(json.dumps(report, indent=2), encoding="utf-8")
+            print(f"Wrote {path}")
+
+    if regressions:
+        print(f"Regressions beyond {args.threshold:.0%}:", file=sys.stderr)
+        for line in regressions:
+            print(f"  {line}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import requests
+
+
+REPO = Path(__file__).resolve().parent
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_mock(port: int, scale: float, mock_args: List[str]) -> subprocess.Popen:
+    cmd = [sys.executable, str(REPO / "mock_gbif.py"), "--port", str(port), "--scale", str(scale), "--job-seconds", "1"] + mock_args
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        try:
+            requests.get(f"http://127.0.0.1:{port}/__stats", timeout=1)
+            return proc
+        except requests.RequestException:
+            if proc.poll() is not None:
+                raise RuntimeError("Mock server exited during startup")
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError("Mock server did not start")
+
+
+def mock_requests(port: int) -> int:
+    return int(requests.get(f"http://127.0.0.1:{port}/__stats", timeout=10).json()["requests"])
+
+
+def run_stage(name: str, cmd: List[str], env: Dict[str, str], port: int, log_dir: Path) -> Dict[str, object]:
+    before = mock_requests(port)
+    log = (log_dir / f"{name}.log").open("wb")
+    start = time.perf_counter()
+    proc = subprocess.Popen(cmd, cwd=str(REPO), env=env, stdout=log, stderr=subprocess.STDOUT)
+    # wait4 gives the resource usage of this child alone (ru_maxrss is KiB on Linux)
+    _pid, status, usage = os.wait4(proc.pid, 0)
+    wall = time.perf_counter() - start
+    log.close()
+    # The mock's own /__stats call is counted too; leave it out
+    reqs = mock_requests(port) - before - 1
+    return {
+        "stage": name,
+        "exit_code": os.waitstatus_to_exitcode(status),
+        "wall_s": round(wall, 3),
+        "requests": reqs,
+        "req_per_s": round(reqs / wall, 1) if wall > 0 else 0.0,
+        "peak_rss_mb": round(usage.ru_maxrss / 1024, 1),
+    }
+
+
+def pipeline(work: Path, base_url: str) -> List[tuple]:
+    # download -> enrich -> preload -> aggregate, as run for the checked-in outputs. The registry mirror
+    # stays in the work directory, so mock data never reaches out-nodes/
+    py = sys.executable
+    return [
+        ("download_publisher", [py, "gbif_sql_download.py", "recordedby-by-publishingorg.sql", "--strip-comments", "--poll", "--poll-interval", "1",
+                                "--download", "--output", str(work / "publisher.zip"), "--extract", str(work / "publisher"), "--no-cache"]),
+        ("download_hosting", [py, "gbif_sql_download.py", "recordedby-by-hostingorg.sql", "--strip-comments", "--poll", "--poll-interval", "1",
+                              "--download", "--output", str(work / "hosting.zip"), "--extract", str(work / "hosting"), "--no-cache"]),
+        ("enrich", lambda: [py, "enrich_hostingorg.py", str(first_csv(work / "hosting")), str(work / "hosting-enriched.csv"), "--no-cache"]),
+        ("preload", [py, "preload_nodes.py", "--base-url", base_url, "--out-dir", str(work / "nodes"), "--registry", str(work / "nodes" / "registry.sqlite"), "--no-cache"]),
+        ("aggregate", lambda: [py, "aggregate_by_node.py", "--node-org-map", str(work / "nodes" / "node-org-map.csv"),
+                               "--publisher-stats-tsv", str(first_csv(work / "publisher")), "--nodes-json", str(work / "nodes" / "nodes.json"),
+                               "--registry", str(work / "nodes" / "registry.sqlite"), "--out-csv", str(work / "by-node.csv")]),
+    ]
+
+
+def first_csv(directory: Path) -> Path:
+    found = sorted(directory.glob("*.csv"))
+    if not found:
+        raise FileNotFoundError(f"No CSV extracted into {directory}")
+    return found[0]
+
+
+def bench_scale(scale: float, work_root: Path, mock_args: List[str]) -> List[Dict[str, object]]:
+    work = work_root / f"scale-{scale:g}"
+    shutil.rmtree(work, ignore_errors=True)
+    work.mkdir(parents=True)
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}/v1"
+    env = dict(os.environ, GBIF_API_BASE=base_url, GBIF_USERNAME="bench", GBIF_PASSWORD="bench")
+    mock = start_mock(port, scale, mock_args)
+    results = []
+    try:
+        for name, cmd in pipeline(work, base_url):
+            res = run_stage(name, cmd() if callable(cmd) else cmd, env, port, work)
+            res["scale"] = scale
+            results.append(res)
+            print(format_row(res), flush=True)
+            if res["exit_code"] != 0:
+                print(f"  stage failed, see {work / (name + '.log')}", file=sys.stderr)
+                break
+    finally:
+        mock.terminate()
+        mock.wait()
+    return results
+
+
+HEADER = f"{'scale':>6}  {'stage':<20} {'exit':>4} {'wall s':>9} {'requests':>9} {'req/s':>9} {'peak MB':>8}"
+
+
+def format_row(r: Dict[str, object]) -> str:
+    return f"{r['scale']:>6g}  {r['stage']:<20} {r['exit_code']:>4} {r['wall_s']:>9.2f} {r['requests']:>9} {r['req_per_s']:>9.1f} {r['peak_rss_mb']:>8.1f}"
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Run download -> enrich -> preload -> aggregate against mock_gbif.py at several data scales")
+    p.add_argument("--scales", default="1,10,100", help="Comma-separated multipliers of today's sizes (default: 1,10,100)")
+    p.add_argument("--work-dir", type=Path, default=Path("bench_work"), help="Scratch directory for stage outputs and logs (default: bench_work)")
+    p.add_argument("--json", type=Path, help="Also write the results as JSON")
+    p.add_argument("--latency-ms", type=float, default=0.0, help="Mock latency per response")
+    p.add_argument("--jitter-ms", type=float, default=0.0, help="Mock latency jitter")
+    p.add_argument("--error-rate", type=float, default=0.0, help="Mock 503 probability")
+    p.add_argument("--error-endpoints", nargs="*", default=[], help="Endpoints the errors apply to (see mock_gbif.py)")
+    p.add_argument("--zip-extra-mb", type=float, default=0.0, help="Filler added to each result ZIP")
+    return p.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    mock_args = ["--latency-ms", str(args.latency_ms), "--jitter-ms", str(args.jitter_ms), "--error-rate", str(args.error_rate), "--zip-extra-mb", str(args.zip_extra_mb)]
+    if args.error_endpoints:
+        mock_args += ["--error-endpoints"] + args.error_endpoints
+    results: List[Dict[str, object]] = []
+    print(HEADER)
+    for scale in (float(s) for s in args.scales.split(",") if s.strip()):
+        results.extend(bench_scale(scale, args.work_dir.resolve(), mock_args))
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2), encoding="utf-8")
+        print(f"Wrote {args.json}")
+    return 0 if all(r["exit_code"] == 0 for r in results) else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
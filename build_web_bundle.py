@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+import argparse
+import gzip
+import json
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+import drilldown
+from manifest import artifact
+from recordedby_schemes import count_columns
+from rollup import iter_stats_rows, to_int
+
+try:
+    import brotli  # optional; only used to write a .br sibling for servers that negotiate it
+except ImportError:  # pragma: no cover
+    brotli = None
+
+
+BUNDLE_VERSION = 1
+COUNT_COLS = count_columns()
+# Name search index: n-grams of the lowercased name, queries shorter than this are scanned
+NGRAM = 3
+
+# Must match the <option> values of #sort-select in index.html
+SORT_OPTIONS = [
+    "pct_valid_recordedbyid-desc",
+    "pct_valid_recordedbyid-asc",
+    "records_with_valid_recordedbyid-desc",
+    "records_with_valid_recordedbyid-asc",
+    "total_records-desc",
+    "total_records-asc",
+]
+
+# Per tab: key column, name column (lowercased headers)
+TABS = {
+    "publisher": ("publishingorgkey", "publishername"),
+    "hosting": ("hostingorganizationkey", "publishername"),
+    "node": ("nodekey", "nodetitle"),
+}
+
+
+class StringTable:
+    def __init__(self) -> None:
+        self.index: Dict[str, int] = {}
+        self.strings: List[str] = []
+
+    def intern(self, s: str) -> int:
+        idx = self.index.get(s)
+        if idx is None:
+            idx = self.index[s] = len(self.strings)
+            self.strings.append(s)
+        return idx
+
+
+def pct(num: int, total: int) -> float:
+    return (100.0 * num / total) if total > 0 else 0.0
+
+
+def sort_orders(cols: Dict[str, List[int]]) -> Dict[str, List[int]]:
+    # Same ordering as sortRows in scripts/app.js: primary key in the chosen direction,
+    # ties by valid count desc, then total desc
+    total = cols["total_records"]
+    valid = cols["records_with_valid_recordedbyid"]
+    n = len(total)
+    values = {
+        "pct_valid_recordedbyid": [pct(valid[i], total[i]) for i in range(n)],
+        "records_with_valid_recordedbyid": valid,
+        "total_records": total,
+    }
+    orders = {}
+    for option in SORT_OPTIONS:
+        col, direction = option.rsplit("-", 1)
+        v = values[col]
+        sign = -1 if direction == "desc" else 1
+        orders[option] = sorted(range(n), key=lambda i: (sign * v[i], -valid[i], -total[i]))
+    return orders
+
+
+def build_tab(path: Path, key_col: str, name_col: str, strings: StringTable, extra_cols: Optional[List[str]] = None) -> dict:
+    keys: List[int] = []
+    names: List[int] = []
+    numeric = COUNT_COLS + (extra_cols or [])
+    cols: Dict[str, List[int]] = {c: [] for c in numeric}
+    for row in iter_stats_rows(path):
+        key = (row.get(key_col) or "").strip()
+        if not key:
+            continue
+        keys.append(strings.intern(key))
+        names.append(strings.intern(row.get(name_col) or key))
+        for c in numeric:
+            cols[c].append(to_int(row.get(c.lower())))
+    return {"key": keys, "name": names, "cols": cols, "order": sort_orders(cols)}
+
+
+def build_node_orgs(nodes_json: Path, strings: StringTable) -> List[list]:
+    nodes = json.loads(nodes_json.read_text(encoding="utf-8"))
+    return [[strings.intern(str(n.get("nodeKey"))), [strings.intern(str(o.get("key"))) for o in n.get("organizations", [])]] for n in nodes]
+
+
+def build_bundle(publisher: Path, hosting: Path, node: Path, nodes_json: Path) -> dict:
+    strings = StringTable()
+    tabs = {
+        "publisher": build_tab(publisher, *TABS["publisher"], strings),
+        "hosting": build_tab(hosting, *TABS["hosting"], strings),
+        "node": build_tab(node, *TABS["node"], strings, extra_cols=["orgCount"]),
+    }
+    return {
+        "version": BUNDLE_VERSION,
+        "countColumns": COUNT_COLS,
+        "tabs": tabs,
+        "nodeOrgs": build_node_orgs(nodes_json, strings) if nodes_json.exists() else [],
+        "strings": strings.strings,
+    }
+
+
+def ngrams(text: str, n: int = NGRAM) -> Set[str]:
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+def build_search_index(bundle: dict) -> dict:
+    # Per tab: n-gram -> ascending row ids, delta-encoded. Row ids index the bundle's columns,
+    # so "rows" lets the viewer detect an index built from a different bundle.
+    strings = bundle["strings"]
+    tabs = {}
+    for kind, tab in bundle["tabs"].items():
+        postings: Dict[str, List[int]] = {}
+        for row, name_idx in enumerate(tab["name"]):
+            for gram in ngrams(strings[name_idx].lower()):
+                postings.setdefault(gram, []).append(row)
+        grams = {}
+        for gram in sorted(postings):
+            rows = postings[gram]
+            grams[gram] = [rows[0]] + [b - a for a, b in zip(rows, rows[1:])]
+        tabs[kind] = {"rows": len(tab["name"]), "grams": grams}
+    return {"version": BUNDLE_VERSION, "n": NGRAM, "tabs": tabs}
+
+
+def write_json_variants(data: dict, out_dir: Path, name: str) -> List[Path]:
+    out_dir.mkdir(parents=True, exist_ok=True)
+    raw = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    written = []
+    plain = out_dir / name
+    plain.write_bytes(raw)
+    written.append(plain)
+    gz = out_dir / f"{name}.gz"
+    # mtime=0 keeps the output byte-stable across rebuilds
+    gz.write_bytes(gzip.compress(raw, compresslevel=9, mtime=0))
+    written.append(gz)
+    if brotli is not None:
+        br = out_dir / f"{name}.br"
+        br.write_bytes(brotli.compress(raw, quality=11))
+        written.append(br)
+    return written
+
+
+def write_bundle(bundle: dict, out_dir: Path) -> List[Path]:
+    written = write_json_variants(bundle, out_dir, "bundle.json")
+    # Loaded by the viewer's search worker only, so it stays out of the first-paint payload
+    written += write_json_variants(build_search_index(bundle), out_dir, "search.json")
+    return written
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Build the compact, precompressed data bundle loaded by the static viewer")
+    p.add_argument("--publisher", type=Path, default=artifact("publisher", Path("out-recordedby_publisher/0052593-251009101135966.csv")), help="Publisher stats TSV (default: from out-web/manifest.json)")
+    p.add_argument("--hosting", type=Path, default=artifact("hosting", Path("out-recordedby_hostingorg/0051475-251009101135966-enriched.csv")), help="Enriched hosting org CSV (default: from out-web/manifest.json)")
+    p.add_argument("--node", type=Path, default=artifact("nodeAgg", Path("out-by-node/recordedby_by_node.csv")), help="Node aggregate CSV")
+    p.add_argument("--nodes-json", type=Path, default=artifact("nodesMap", Path("out-nodes/nodes.json")), help="Nodes JSON with organizations")
+    p.add_argument("--datasets", type=Path, default=artifact("datasets", Path("out-recordedby_dataset/recordedby_by_dataset.csv")), help="Per-dataset stats from recordedby-by-dataset.sql (TSV or ZIP); adds top datasets to the drill-down when present")
+    p.add_argument("--out-dir", type=Path, default=Path("out-web"), help="Output directory (default: out-web)")
+    p.add_argument("--drilldown-prefix", type=int, default=drilldown.DEFAULT_PREFIX, help=f"Key characters per drill-down bucket (default: {drilldown.DEFAULT_PREFIX})")
+    p.add_argument("--no-drilldown", action="store_true", help="Only write the bundle and search index")
+    return p.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    for path in (args.publisher, args.hosting, args.node):
+        if not path.exists():
+            print(f"Input not found: {path}", file=sys.stderr)
+            return 2
+    bundle = build_bundle(args.publisher, args.hosting, args.node, args.nodes_json)
+    for path in write_bundle(bundle, args.out_dir):
+        print(f"Wrote {path} ({path.stat().st_size} bytes)")
+    if not args.no_drilldown:
+        # Fetched per entity on selection, so none of this is part of the first load
+        entries = drilldown.build_entries(bundle, args.datasets)
+        index, written = drilldown.write_shards(entries, args.out_dir / "drilldown", args.drilldown_prefix)
+        with_datasets = "with" if args.datasets.exists() else "without"
+        print(f"Wrote {index} and {written} new drill-down shards ({with_datasets} per-dataset stats)")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
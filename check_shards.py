@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import zipfile
+from pathlib import Path
+from typing import Dict, List
+
+from bench_pipeline import REPO, free_port, start_mock
+from sql_shards import STRATEGIES
+
+
+def download(sql_file: Path, output: Path, env: Dict[str, str], extra: List[str]) -> bytes:
+    cmd = [sys.executable, str(REPO / "gbif_sql_download.py"), str(sql_file), "--strip-comments", "--poll-interval", "1",
+           "--download", "--output", str(output), "--no-cache"] + extra
+    subprocess.run(cmd, cwd=str(REPO), env=env, check=True, stdout=subprocess.DEVNULL)
+    with zipfile.ZipFile(output) as zf:
+        members = [i for i in zf.infolist() if i.filename.endswith(".csv")]
+        return zf.read(members[0])
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Check that sharded downloads merge to exactly the unsharded result, against mock_gbif.py")
+    p.add_argument("--sql", type=Path, nargs="+", default=[REPO / "recordedby-by-publishingorg.sql", REPO / "recordedby-by-hostingorg.sql"])
+    p.add_argument("--by", choices=STRATEGIES, nargs="+", default=list(STRATEGIES))
+    p.add_argument("--shards", type=int, nargs="+", default=[2, 5])
+    p.add_argument("--scale", type=float, default=1.0)
+    p.add_argument("--keep", action="store_true", help="Keep the work directory")
+    return p.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    port = free_port()
+    mock = start_mock(port, args.scale, [])
+    work = Path(tempfile.mkdtemp(prefix="check-shards-"))
+    env = dict(os.environ, GBIF_API_BASE=f"http://127.0.0.1:{port}/v1", GBIF_USERNAME="mock", GBIF_PASSWORD="mock")
+    failures = 0
+    try:
+        for sql_file in args.sql:
+            expected = download(sql_file, work / f"{sql_file.stem}.zip", env, [])
+            for by in args.by:
+                for shards in args.shards:
+                    out = work / f"{sql_file.stem}.{by}-{shards}.zip"
+                    got = download(sql_file, out, env, ["--shards", str(shards), "--shard-by", by, "--shard-years", "1900:2025"])
+                    same = got == expected
+                    failures += not same
+                    print(f"{sql_file.name:36} {by:6} {shards:3} shards  {len(expected.splitlines()) - 1:6} rows  {'identical' if same else 'MISMATCH'}")
+    finally:
+        mock.terminate()
+        mock.wait()
+        if args.keep:
+            print(f"Work directory: {work}")
+        else:
+            shutil.rmtree(work, ignore_errors=True)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
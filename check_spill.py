@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+import argparse
+import filecmp
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, List
+
+from bench_pipeline import REPO
+
+
+ID_VALUES = [
+    "",
+    "https://orcid.org/0000-0002-1825-0097",
+    "http://www.wikidata.org/entity/Q42",
+    "https://scholar.google.com/citations?user=abcDEF123456",
+    "https://www.researcherid.com/rid/A-1234-2008",
+    "not an id",
+    "https://orcid.org/0000-0002-1825-0097|https://www.linkedin.com/in/someone",
+]
+
+
+def write_occurrences(path: Path, rows: int, datasets: int, names: int, seed: int) -> None:
+    # Synthetic occurrence.txt with a high-cardinality datasetKey and an even wider recordedBy
+    rng = random.Random(seed)
+    dataset_keys = [str(uuid.UUID(int=rng.getrandbits(128))) for _ in range(datasets)]
+    with path.open("w", encoding="utf-8", newline="") as f:
+        f.write("datasetKey\tpublishingOrgKey\trecordedBy\trecordedByID\n")
+        for _ in range(rows):
+            ds = rng.choice(dataset_keys)
+            f.write(f"{ds}\t{ds[:8]}\tCollector {rng.randrange(names)}\t{rng.choice(ID_VALUES)}\n")
+
+
+def count_rows(path: Path) -> int:
+    with path.open("rb") as f:
+        return sum(1 for _line in f) - 1
+
+
+def run(cmd: List[str]) -> Dict[str, float]:
+    start = time.perf_counter()
+    proc = subprocess.Popen(cmd, cwd=str(REPO), stdout=subprocess.DEVNULL)
+    # wait4 covers the child and the worker processes it waited for (ru_maxrss is KiB on Linux). A forked
+    # child starts from this process's high-water mark, so outputs are compared without reading them whole
+    _pid, status, usage = os.wait4(proc.pid, 0)
+    if os.waitstatus_to_exitcode(status) != 0:
+        raise RuntimeError(f"Command failed: {' '.join(cmd)}")
+    return {"wall_s": time.perf_counter() - start, "peak_rss_mb": usage.ru_maxrss / 1024}
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Check that local_stats.py gives identical output with and without spilling to disk, and compare peak RSS")
+    p.add_argument("--rows", type=int, default=2_000_000)
+    p.add_argument("--datasets", type=int, default=100_000)
+    p.add_argument("--names", type=int, default=1_000_000, help="Distinct recordedBy strings")
+    p.add_argument("--group-by", nargs="+", default=["datasetKey", "recordedBy", "recordedByID"], help="Columns to group by, one run each")
+    p.add_argument("--memory-mb", type=float, nargs="+", default=[16, 64])
+    p.add_argument("--workers", type=int, nargs="+", default=[1, 4])
+    p.add_argument("--chunk-mb", type=int, default=2)
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--keep", action="store_true", help="Keep the work directory")
+    return p.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    work = Path(tempfile.mkdtemp(prefix="check-spill-"))
+    occurrences = work / "occurrence.txt"
+    write_occurrences(occurrences, args.rows, args.datasets, args.names, args.seed)
+    failures = 0
+    try:
+        for column in args.group_by:
+            base = [sys.executable, str(REPO / "local_stats.py"), str(occurrences)]
+            common = ["--group-by", column, "--chunk-mb", str(args.chunk_mb), "--spill-dir", str(work / "spill")]
+            expected_path = work / f"{column}.csv"
+            r = run(base + [str(expected_path), "--workers", "1"] + common)
+            rows = count_rows(expected_path)
+            print(f"{column:14} {'in memory':>10} {1:3} workers  {rows:9} rows  {r['wall_s']:7.2f} s  {r['peak_rss_mb']:8.1f} MB")
+            for budget in args.memory_mb:
+                for workers in args.workers:
+                    out = work / f"{column}.{budget:g}mb-{workers}.csv"
+                    r = run(base + [str(out), "--workers", str(workers), "--memory-mb", str(budget)] + common)
+                    same = filecmp.cmp(out, expected_path, shallow=False)
+                    failures += not same
+                    print(f"{column:14} {f'{budget:g} MB':>10} {workers:3} workers  {rows:9} rows  {r['wall_s']:7.2f} s  {r['peak_rss_mb']:8.1f} MB  {'identical' if same else 'MISMATCH'}")
+                    out.unlink()
+    finally:
+        if args.keep:
+            print(f"Work directory: {work}")
+        else:
+            shutil.rmtree(work, ignore_errors=True)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+
+DEFAULT_CACHE_DIR = Path(".gbif_cache")
+
+_SQL_TOKEN = re.compile(r"'(?:[^']|'')*'|--[^\n]*|/\*.*?\*/|\s+|[^'\s/-]+|.", re.DOTALL)
+
+
+def _normalize_code(code: str) -> str:
+    code = re.sub(r"\s+", " ", code.upper())
+    # Whitespace around punctuation is not significant either
+    return re.sub(r" ?([(),;=<>*+]) ?", r"\1", code)
+
+
+def normalize_sql(sql_text: str) -> str:
+    # Drop comments, collapse whitespace and uppercase everything outside string literals,
+    # so formatting-only edits of a query map to the same cache entry
+    parts = []
+    code = []
+    for token in _SQL_TOKEN.findall(sql_text):
+        if token.startswith("'"):
+            parts.append(_normalize_code("".join(code)))
+            parts.append(token)
+            code = []
+        elif token.startswith("--") or token.startswith("/*"):
+            code.append(" ")
+        else:
+            code.append(token)
+    parts.append(_normalize_code("".join(code)))
+    return "".join(parts).strip().rstrip(";").rstrip()
+
+
+def cache_key(sql_text: str, download_format: str) -> str:
+    payload = f"{download_format.upper()}\n{normalize_sql(sql_text)}"
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# Maps normalized SQL + format to the GBIF download that answered it, plus a bounded local ZIP store
+class DownloadCache:
+    def __init__(self, cache_dir: Path = DEFAULT_CACHE_DIR, max_bytes: Optional[int] = None) -> None:
+        self.cache_dir = cache_dir
+        self.zip_dir = cache_dir / "zips"
+        self.index_file = cache_dir / "index.json"
+        self.max_bytes = max_bytes
+        self.entries: Dict[str, Dict[str, Any]] = self._load()
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        if self.index_file.exists():
+            try:
+                return json.loads(self.index_file.read_text(encoding="utf-8")).get("entries", {})
+            except Exception:
+                return {}
+        return {}
+
+    def save(self) -> None:
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp = self.index_file.with_name(self.index_file.name + ".tmp")
+        tmp.write_text(json.dumps({"entries": self.entries}, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, self.index_file)
+
+    def lookup(self, sql_text: str, download_format: str, max_age_s: float) -> Optional[Dict[str, Any]]:
+        digest = cache_key(sql_text, download_format)
+        entry = self.entries.get(digest)
+        if not entry:
+            return None
+        # Age counts from completion, or from submission while the download is still pending
+        stamp = entry.get("completed") or entry.get("submitted") or 0
+        if time.time() - stamp > max_age_s:
+            return None
+        zip_path = entry.get("zip_path")
+        if zip_path and not Path(zip_path).exists():
+            entry["zip_path"] = None
+        entry["last_used"] = time.time()
+        self.save()
+        return dict(entry, digest=digest)
+
+    def record_submitted(self, sql_text: str, download_format: str, key: str) -> None:
+        digest = cache_key(sql_text, download_format)
+        self.entries[digest] = {"key": key, "format": download_format, "submitted": time.time(), "completed": None, "zip_path": None, "size": 0, "last_used": time.time()}
+        self.save()
+
+    def store_zip(self, sql_text: str, download_format: str, key: str, zip_path: Path) -> Path:
+        digest = cache_key(sql_text, download_format)
+        self.zip_dir.mkdir(parents=True, exist_ok=True)
+        target = self.zip_dir / f"{key}.zip"
+        if not target.exists():
+            _link_or_copy(zip_path, target)
+        entry = self.entries.setdefault(digest, {"key": key, "format": download_format, "submitted": None})
+        entry.update({"key": key, "completed": time.time(), "zip_path": str(target), "size": target.stat().st_size, "last_used": time.time()})
+        self.evict()
+        self.save()
+        return target
+
+    def invalidate(self, digest: str) -> None:
+        entry = self.entries.pop(digest, None)
+        if entry and entry.get("zip_path"):
+            Path(entry["zip_path"]).unlink(missing_ok=True)
+        self.save()
+
+    def evict(self) -> None:
+        # LRU over local ZIPs only; the entry stays so its remote key can still be reused
+        if self.max_bytes is None:
+            return
+        stored = [e for e in self.entries.values() if e.get("zip_path")]
+        total = sum(int(e.get("size") or 0) for e in stored)
+        for entry in sorted(stored, key=lambda e: e.get("last_used") or 0):
+            if total <= self.max_bytes:
+                break
+            Path(entry["zip_path"]).unlink(missing_ok=True)
+            total -= int(entry.get("size") or 0)
+            entry["zip_path"] = None
+            entry["size"] = 0
+
+
+def _link_or_copy(src: Path, dst: Path) -> None:
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def materialize(cached_zip: Path, destination: Path) -> Path:
+    if destination.exists() and destination.resolve() == cached_zip.resolve():
+        return destination
+    destination.unlink(missing_ok=True)
+    _link_or_copy(cached_zip, destination)
+    return destination
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Inspect or trim the local GBIF SQL download cache")
+    p.add_argument("--cache-dir", type=Path, default=DEFAULT_CACHE_DIR, help="Cache directory (default: .gbif_cache)")
+    p.add_argument("--max-gb", type=float, help="Evict least recently used ZIPs until the store fits this size")
+    return p.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    cache = DownloadCache(args.cache_dir, max_bytes=int(args.max_gb * 1024 ** 3) if args.max_gb is not None else None)
+    if args.max_gb is not None:
+        cache.evict()
+        cache.save()
+    for digest, entry in sorted(cache.entries.items(), key=lambda kv: kv[1].get("last_used") or 0, reverse=True):
+        completed = time.strftime("%Y-%m-%d %H:%M", time.localtime(entry["completed"])) if entry.get("completed") else "pending"
+        print(f"{digest[:12]}  {entry.get('key')}  {completed}  {entry.get('size') or 0:>12}  {entry.get('zip_path') or '-'}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
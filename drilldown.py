@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+import hashlib
+import json
+import re
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from recordedby_schemes import SCHEME_NAMES
+from rollup import iter_stats_rows, to_int
+
+
+DRILLDOWN_VERSION = 1
+# Leading key characters that pick an entity's shard; UUID keys give 256 buckets per tab at 2
+DEFAULT_PREFIX = 2
+TOP_DATASETS = 20
+TOP_PUBLISHERS = 20
+
+_BUCKET = re.compile(r"[0-9a-z]+")
+
+# WHERE clause of each tab's entities, as in updateActionLinks in scripts/app.js
+_WHERE = {
+    "publisher": "publishingOrgKey = '{key}'",
+    "hosting": "hostingOrganizationKey = '{key}'",
+}
+
+SAMPLE_SQL = """SELECT datasetKey, datasetName, COUNT(*) AS total_records,
+  SUM(CASE WHEN recordedByID IS NOT NULL THEN 1 ELSE 0 END) AS records_with_recordedByID
+FROM occurrence
+WHERE {where}
+GROUP BY datasetKey, datasetName
+ORDER BY total_records DESC"""
+
+
+def bucket_of(key: str, prefix: int) -> str:
+    # Must match bucketOf in scripts/app.js
+    bucket = key[:prefix].lower()
+    return bucket if len(bucket) == prefix and _BUCKET.fullmatch(bucket) else "_"
+
+
+def entity_where(kind: str, key: str, org_keys: Optional[List[str]] = None) -> str:
+    if kind == "node":
+        quoted = ", ".join(f"'{k}'" for k in org_keys or ())
+        return f"publishingOrgKey IN ({quoted})" if quoted else "1 = 0"
+    return _WHERE[kind].format(key=key)
+
+
+class TopRows:
+    # Children of one entity (datasets, or a node's publishers): [name, total, with ID, valid] per key
+    __slots__ = ("rows",)
+
+    def __init__(self) -> None:
+        self.rows: Dict[str, list] = {}
+
+    def add(self, key: str, name: str, total: int, with_id: int, valid: int) -> None:
+        row = self.rows.get(key)
+        if row is None:
+            self.rows[key] = [name, total, with_id, valid]
+            return
+        # datasetName is part of the GROUP BY, so one dataset can span rows; keep the first non-empty name
+        row[0] = row[0] or name
+        row[1] += total
+        row[2] += with_id
+        row[3] += valid
+
+    def top(self, k: int) -> dict:
+        ranked = sorted(self.rows.items(), key=lambda kv: (-kv[1][1], kv[0]))[:k]
+        return {"count": len(self.rows), "top": [[key, *row] for key, row in ranked]}
+
+
+def _tab_rows(bundle: dict, kind: str) -> Iterable[Tuple[str, str, Dict[str, int]]]:
+    strings = bundle["strings"]
+    tab = bundle["tabs"][kind]
+    cols = tab["cols"]
+    for i, (key_idx, name_idx) in enumerate(zip(tab["key"], tab["name"])):
+        yield strings[key_idx], strings[name_idx], {c: v[i] for c, v in cols.items()}
+
+
+def build_entries(bundle: dict, datasets: Optional[Path] = None, top_datasets: int = TOP_DATASETS, top_publishers: int = TOP_PUBLISHERS) -> Dict[str, Dict[str, dict]]:
+    # tab -> key -> drill-down entry, from the bundle's tables plus the optional per-dataset table
+    strings = bundle["strings"]
+    node_orgs = {strings[n]: [strings[o] for o in orgs] for n, orgs in bundle.get("nodeOrgs", [])}
+    org_nodes: Dict[str, List[str]] = {}
+    for node, orgs in node_orgs.items():
+        for org in orgs:
+            org_nodes.setdefault(org, []).append(node)
+
+    children: Dict[str, Dict[str, TopRows]] = {"publisher": {}, "hosting": {}, "node": {}}
+    if datasets is not None and datasets.exists():
+        for row in iter_stats_rows(datasets):
+            key = (row.get("datasetkey") or "").strip()
+            if not key:
+                continue
+            counts = (to_int(row.get("total_records")), to_int(row.get("records_with_recordedbyid")), to_int(row.get("records_with_valid_recordedbyid")))
+            name = row.get("datasetname") or ""
+            publisher = (row.get("publishingorgkey") or "").strip()
+            hosting = (row.get("hostingorganizationkey") or "").strip()
+            targets = [("publisher", publisher), ("hosting", hosting)] + [("node", n) for n in org_nodes.get(publisher, ())]
+            for kind, entity in targets:
+                if entity:
+                    children[kind].setdefault(entity, TopRows()).add(key, name, *counts)
+
+    publishers = {key: (name, c) for key, name, c in _tab_rows(bundle, "publisher")}
+    entries: Dict[str, Dict[str, dict]] = {}
+    for kind in ("publisher", "hosting", "node"):
+        out = entries[kind] = {}
+        for key, _name, c in _tab_rows(bundle, kind):
+            entry = {
+                "total": c["total_records"],
+                "withId": c["records_with_recordedbyid"],
+                "schemes": {name: c.get(f"records_with_{name}", 0) for name in SCHEME_NAMES},
+            }
+            top = children[kind].get(key)
+            if top is not None:
+                entry["datasets"] = top.top(top_datasets)
+            if kind == "node":
+                members = TopRows()
+                for org in node_orgs.get(key, ()):
+                    if org in publishers:
+                        name, pc = publishers[org]
+                        members.add(org, name, pc["total_records"], pc["records_with_recordedbyid"], pc["records_with_valid_recordedbyid"])
+                entry["publishers"] = members.top(top_publishers)
+            entry["sql"] = SAMPLE_SQL.format(where=entity_where(kind, key, node_orgs.get(key)))
+            out[key] = entry
+    return entries
+
+
+def write_shards(entries: Dict[str, Dict[str, dict]], out_dir: Path, prefix: int = DEFAULT_PREFIX) -> Tuple[Path, int]:
+    # <out_dir>/<tab>/<bucket>.<content hash>.json plus index.json naming the current file of each bucket.
+    # Hashed names can be cached forever; files from earlier builds are removed.
+    index = {"version": DRILLDOWN_VERSION, "prefix": prefix, "tabs": {}}
+    written = 0
+    for kind, by_key in entries.items():
+        buckets: Dict[str, Dict[str, dict]] = {}
+        for key in sorted(by_key):
+            buckets.setdefault(bucket_of(key, prefix), {})[key] = by_key[key]
+        tab_dir = out_dir / kind
+        tab_dir.mkdir(parents=True, exist_ok=True)
+        current = {}
+        for bucket, shard in sorted(buckets.items()):
+            raw = json.dumps(shard, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            name = f"{bucket}.{hashlib.sha256(raw).hexdigest()[:10]}.json"
+            path = tab_dir / name
+            if not path.exists():
+                path.write_bytes(raw)
+                written += 1
+            current[bucket] = f"{kind}/{name}"
+        keep = {Path(p).name for p in current.values()}
+        for stale in tab_dir.glob("*.json"):
+            if stale.name not in keep:
+                stale.unlink()
+        index["tabs"][kind] = current
+    index_path = out_dir / "index.json"
+    index_path.write_text(json.dumps(index, separators=(",", ":")), encoding="utf-8")
+    return index_path, written
@@ -1,90 +1,216 @@
 #!/usr/bin/env python3
 import argparse
 import csv
+import os
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Dict, Iterable, Optional
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
+import http_cache
+import registry_db
+import tracing
+from http_cache import HttpCache, cached_get
+from stats_reader import count_rows, iter_batches, read_header
 
-GBIF_API_BASE = "https://api.gbif.org/v1"
 
+# Overridable so the scripts can run against mock_gbif.py
+GBIF_API_BASE = os.environ.get("GBIF_API_BASE", "https://api.gbif.org/v1")
 
-def fetch_org_title(org_key: str, cache: Dict[str, Optional[str]], timeout_s: int = 20) -> Optional[str]:
-    if org_key in cache:
-        return cache[org_key]
+# Registry fields copied onto each row, keyed by output column
+ORG_FIELDS = {
+    "publisherName": "title",
+    "publisherCountry": "country",
+    "endorsingNodeKey": "endorsingNodeKey",
+    "publisherType": "type",
+}
+
+
+def make_session(pool_size: int = 8, retries: int = 4, backoff: float = 0.8) -> requests.Session:
+    # Keep-alive connections shared by all workers; transient errors and 429/5xx retried with backoff
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(["GET"]),
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+# Shared by fetch_org_title calls made without a session, built on first use
+_default_session: Optional[requests.Session] = None
+_default_session_lock = threading.Lock()
+
+
+def default_session() -> requests.Session:
+    global _default_session
+    with _default_session_lock:
+        if _default_session is None:
+            _default_session = make_session()
+        return _default_session
+
+
+def fetch_org(org_key: str, session: requests.Session, timeout_s: int = 20, cache: Optional[HttpCache] = None) -> Optional[Dict[str, str]]:
     url = f"{GBIF_API_BASE}/organization/{org_key}"
     try:
-        resp = requests.get(url, timeout=timeout_s)
+        resp = cached_get(cache, url, lambda headers: session.get(url, headers=headers, timeout=timeout_s))
+        if not resp.from_cache:
+            # urllib3 records each retried attempt in the history of the final Retry object
+            retry_state = getattr(resp.raw, "retries", None)
+            retried = len(retry_state.history) if retry_state is not None else 0
+            tracing.add(http_calls=1 + retried, retries=retried)
         if resp.status_code != 200:
-            cache[org_key] = None
             return None
         data = resp.json()
-        title = data.get("title") or data.get("name")
-        cache[org_key] = title
-        return title
     except Exception:
-        cache[org_key] = None
         return None
+    info = {col: str(data.get(field) or "") for col, field in ORG_FIELDS.items()}
+    info["publisherName"] = data.get("title") or data.get("name") or ""
+    return info
+
+
+def fetch_org_title(org_key: str, cache: Dict[str, Optional[str]], timeout_s: int = 20, session: Optional[requests.Session] = None, http: Optional[HttpCache] = None) -> Optional[str]:
+    if org_key in cache:
+        return cache[org_key]
+    info = fetch_org(org_key, session or default_session(), timeout_s=timeout_s, cache=http)
+    title = info["publisherName"] if info else None
+    cache[org_key] = title or None
+    return cache[org_key]
+
+
+def resolve_orgs(org_keys: Iterable[str], max_workers: int = 8, timeout_s: int = 20, session: Optional[requests.Session] = None, cache: Optional[HttpCache] = None) -> Dict[str, Optional[Dict[str, str]]]:
+    keys = sorted(set(org_keys))
+    session = session or make_session(pool_size=max_workers)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as ex:
+        results = dict(zip(keys, ex.map(tracing.bind(lambda k: fetch_org(k, session, timeout_s, cache=cache)), keys)))
+    elapsed = time.perf_counter() - started
+    rate = len(keys) / elapsed if elapsed > 0 else 0.0
+    failed = sum(1 for v in results.values() if v is None)
+    print(f"Resolved {len(keys)} organizations in {elapsed:.1f}s ({rate:.1f} lookups/s, {failed} failed)", file=sys.stderr)
+    return results
+
+
+def collect_org_keys(input_csv: Path, key_col: str) -> set:
+    if key_col not in [h.lower() for h in read_header(input_csv)]:
+        raise ValueError(f"Column '{key_col}' not found in {input_csv}")
+    keys = set()
+    for batch in count_rows(iter_batches(input_csv, columns=[key_col])):
+        keys.update(k.strip() for k in batch.column(key_col))
+    keys.discard("")
+    return keys
 
 
-def enrich_csv(input_csv: Path, output_csv: Path, timeout_s: int = 20) -> None:
+def mirrored_orgs(conn, keys: Iterable[str]) -> Dict[str, Dict[str, str]]:
+    return {key: {col: rec.get(field, "") for col, field in ORG_FIELDS.items()} for key, rec in registry_db.lookup_orgs(conn, keys).items()}
+
+
+def remember_orgs(conn, orgs: Dict[str, Optional[Dict[str, str]]]) -> None:
+    # Write-through, so the next run finds these in the mirror too
+    registry_db.upsert_orgs(conn, ({"key": key, **{field: info.get(col, "") for col, field in ORG_FIELDS.items()}} for key, info in orgs.items() if info))
+
+
+def enrich_csv(input_csv: Path, output_csv: Path, timeout_s: int = 20, max_workers: int = 8, registry: Optional[Path] = None, cache: Optional[HttpCache] = None) -> None:
+    # input_csv may also be the downloaded result ZIP; the table is streamed out of it
     if not input_csv.exists():
         raise FileNotFoundError(f"Input CSV not found: {input_csv}")
 
-    with input_csv.open("r", encoding="utf-8", newline="") as infile:
-        reader = csv.DictReader(infile, delimiter="\t")
-        fieldnames = list(reader.fieldnames or [])
-        # print(fieldnames)
-        # Required column
-        key_col = "hostingorganizationkey"
-        if key_col not in fieldnames:
-            raise ValueError(f"Column '{key_col}' not found in {input_csv}")
-
-        # Add enrichment columns (append if not present)
-        add_cols = ["publisherName", "publisherUrl"]
-        for c in add_cols:
-            if c not in fieldnames:
-                fieldnames.append(c)
-
-        output_csv.parent.mkdir(parents=True, exist_ok=True)
-        with output_csv.open("w", encoding="utf-8", newline="") as outfile:
-            writer = csv.DictWriter(outfile, fieldnames=fieldnames)
-            writer.writeheader()
-
-            cache: Dict[str, Optional[str]] = {}
-            for row in reader:
-                org_key = (row.get(key_col) or "").strip()
-                if org_key:
-                    title = fetch_org_title(org_key, cache=cache, timeout_s=timeout_s)
-                    row["publisherName"] = title or ""
-                    row["publisherUrl"] = f"https://www.gbif.org/publisher/{org_key}"
-                else:
-                    row["publisherName"] = ""
-                    row["publisherUrl"] = ""
+    # Required column
+    key_col = "hostingorganizationkey"
+
+    # First pass: resolve every distinct organization once, concurrently
+    with tracing.span("collect_keys") as sp:
+        keys = collect_org_keys(input_csv, key_col)
+        sp.set(distinct_keys=len(keys))
+    # Organizations known to the local registry mirror need no network call
+    orgs: Dict[str, Optional[Dict[str, str]]] = {}
+    conn = registry_db.open_readonly(registry)
+    if conn is not None:
+        try:
+            with tracing.span("registry_mirror") as sp:
+                orgs = mirrored_orgs(conn, keys)
+                sp.add(cache_hits=len(orgs))
+        finally:
+            conn.close()
+        print(f"Found {len(orgs)} of {len(keys)} organizations in {registry}", file=sys.stderr)
+    missing = keys.difference(orgs)
+    if missing:
+        with tracing.span("registry_lookups", workers=max_workers):
+            fetched = resolve_orgs(missing, max_workers=max_workers, timeout_s=timeout_s, cache=cache)
+        # Only a run that fetched something opens the mirror for writing
+        conn = registry_db.open_existing(registry) if fetched else None
+        if conn is not None:
+            try:
+                remember_orgs(conn, fetched)
+            finally:
+                registry_db.close(conn)
+        orgs.update(fetched)
+
+    # Second pass: stream the rows out in batches with the resolved fields
+    header = read_header(input_csv)
+    fieldnames = list(header)
+
+    # Add enrichment columns (append if not present)
+    add_cols = ["publisherName", "publisherUrl", "publisherCountry", "endorsingNodeKey", "publisherType"]
+    for c in add_cols:
+        if c not in fieldnames:
+            fieldnames.append(c)
+    pos = {c: fieldnames.index(c) for c in add_cols}
+    source_cols = [h.lower() for h in header]
+    padding = [""] * (len(fieldnames) - len(header))
+
+    output_csv.parent.mkdir(parents=True, exist_ok=True)
+    with tracing.span("write_rows"), output_csv.open("w", encoding="utf-8", newline="") as outfile:
+        writer = csv.writer(outfile)
+        writer.writerow(fieldnames)
+
+        for batch in count_rows(iter_batches(input_csv)):
+            cols = [batch.column(c) for c in source_cols]
+            for i, org_key in enumerate(batch.column(key_col)):
+                org_key = org_key.strip()
+                info = (orgs.get(org_key) if org_key else None) or {}
+                row = [col[i] for col in cols] + padding
+                for col in ORG_FIELDS:
+                    row[pos[col]] = info.get(col, "")
+                row[pos["publisherUrl"]] = f"https://www.gbif.org/publisher/{org_key}" if org_key else ""
                 writer.writerow(row)
 
 
 def parse_args(argv=None) -> argparse.Namespace:
     p = argparse.ArgumentParser(description="Enrich GBIF SQL results with publisher name and link via Registry API")
-    p.add_argument("input_csv", type=Path, help="Path to CSV produced by the SQL download")
+    p.add_argument("input_csv", type=Path, help="Path to CSV produced by the SQL download, or the result ZIP itself")
     p.add_argument("output_csv", type=Path, help="Where to write the enriched CSV")
     p.add_argument("--timeout", type=int, default=20, help="HTTP timeout seconds (default: 20)")
+    p.add_argument("--max-workers", type=int, default=8, help="Concurrent registry lookups (default: 8)")
+    p.add_argument("--registry", type=Path, help="SQLite registry mirror from preload_nodes.py (e.g. out-nodes/registry.sqlite); only organizations missing from it are looked up. Without it every organization is looked up via the API")
+    http_cache.add_cache_arguments(p)
+    tracing.add_trace_argument(p)
     return p.parse_args(argv)
 
 
 def main(argv=None) -> int:
     args = parse_args(argv)
+    tracing.configure(args.trace, "enrich_hostingorg")
     try:
-        enrich_csv(args.input_csv, args.output_csv, timeout_s=args.timeout)
+        enrich_csv(args.input_csv, args.output_csv, timeout_s=args.timeout, max_workers=args.max_workers, registry=args.registry,
+                   cache=http_cache.from_args(args))
     except Exception as exc:
         print(f"Error: {exc}", file=sys.stderr)
         return 1
+    finally:
+        tracing.finish()
     return 0
 
 
 if __name__ == "__main__":
     raise SystemExit(main())
-
-
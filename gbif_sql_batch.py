@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from gbif_sql_download import (
+    FINAL_STATUSES,
+    build_request_body,
+    download_zip,
+    extract_zip,
+    get_download_info,
+    read_sql_file,
+    submit_download,
+    validate_sql,
+)
+
+
+# Local states on top of GBIF's own download statuses
+PENDING = "PENDING"
+INVALID = "INVALID"
+DOWNLOADED = "DOWNLOADED"
+# Succeeded at GBIF, but the ZIP could not be fetched within --download-retries attempts
+DOWNLOAD_FAILED = "DOWNLOAD_FAILED"
+# End states that --retry-failed starts over
+RETRYABLE = ("FAILED", "KILLED", "CANCELLED", INVALID, DOWNLOAD_FAILED)
+
+
+@dataclass
+class BatchJob:
+    sql_path: str
+    # Run id and SQL file hash the record belongs to; a different run or an edited file is a new job
+    run: str = ""
+    digest: Optional[str] = None
+    key: Optional[str] = None
+    status: str = PENDING
+    zip_path: Optional[str] = None
+    message: Optional[str] = None
+    updated: float = 0.0
+    # Scheduling only; not persisted
+    next_poll: float = field(default=0.0, repr=False)
+    interval: float = field(default=0.0, repr=False)
+    downloading: bool = field(default=False, repr=False)
+    failures: int = field(default=0, repr=False)
+
+    def record(self) -> dict:
+        data = asdict(self)
+        for name in ("next_poll", "interval", "downloading", "failures"):
+            data.pop(name)
+        return data
+
+    @property
+    def submitted(self) -> bool:
+        return self.key is not None
+
+    @property
+    def active(self) -> bool:
+        # Queued or running at GBIF
+        return self.submitted and self.status not in FINAL_STATUSES and not self.done
+
+    @property
+    def done(self) -> bool:
+        return self.status in (INVALID, DOWNLOADED, DOWNLOAD_FAILED) or (self.status in FINAL_STATUSES and self.status != "SUCCEEDED")
+
+
+def collect_sql_files(source: Path) -> List[Path]:
+    if source.is_dir():
+        return sorted(source.glob("*.sql"))
+    # Manifest: one .sql path per line, relative to the manifest; '#' starts a comment
+    paths = []
+    for line in source.read_text(encoding="utf-8").splitlines():
+        line = line.split("#", 1)[0].strip()
+        if line:
+            paths.append((source.parent / line).resolve() if not Path(line).is_absolute() else Path(line))
+    return paths
+
+
+def sql_digest(path: Path) -> str:
+    return hashlib.sha256(path.read_bytes()).hexdigest()[:16]
+
+
+def load_state(state_file: Path, run_id: str = "") -> Dict[str, BatchJob]:
+    # Append-only JSONL; the last record of the run for each .sql file wins
+    jobs: Dict[str, BatchJob] = {}
+    if not state_file.exists():
+        return jobs
+    with state_file.open("r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                data = json.loads(line)
+            except ValueError:
+                # Torn last line after a crash
+                continue
+            if data.get("run", "") == run_id:
+                jobs[data["sql_path"]] = BatchJob(**data)
+    return jobs
+
+
+def append_state(state_file: Path, job: BatchJob) -> None:
+    job.updated = time.time()
+    state_file.parent.mkdir(parents=True, exist_ok=True)
+    with state_file.open("a", encoding="utf-8") as f:
+        f.write(json.dumps(job.record(), ensure_ascii=False) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+class BatchRunner:
+    def __init__(self, args: argparse.Namespace, username: str, password: str) -> None:
+        self.args = args
+        self.username = username
+        self.password = password
+        # ZIP downloads run here, so a large result doesn't hold up polling or the other downloads
+        self.pool = ThreadPoolExecutor(max_workers=args.download_workers)
+        self.downloads: Dict[Future, BatchJob] = {}
+
+    def submit(self, job: BatchJob) -> None:
+        # Transient validation or submission errors raise and go through attempt()'s backoff; only a
+        # rejection by GBIF marks the query INVALID
+        args = self.args
+        sql_text = read_sql_file(Path(job.sql_path), strip_comments=args.strip_comments)
+        body = build_request_body(sql_text, args.send_notification, args.email, args.format)
+        is_valid, error_message = validate_sql(body, timeout_s=args.timeout)
+        if not is_valid:
+            job.status = INVALID
+            job.message = error_message or "Unknown error"
+            print(f"[{job.sql_path}] Validation failed: {job.message}")
+            return
+        job.key = submit_download(body, username=self.username, password=self.password, timeout_s=args.timeout)
+        job.status = "PREPARING"
+        job.next_poll = time.time() + args.poll_min
+        job.interval = args.poll_min
+        print(f"[{job.sql_path}] Submitted: {job.key}")
+
+    def backoff(self, job: BatchJob) -> None:
+        args = self.args
+        job.interval = min(args.poll_max, max(args.poll_min, job.interval * args.poll_backoff))
+        job.next_poll = time.time() + job.interval
+
+    def attempt(self, job: BatchJob, what: str, step: Callable[[BatchJob], object]) -> bool:
+        # Transient API/download errors: the job keeps its state and is retried after a growing interval,
+        # without affecting the other jobs
+        try:
+            step(job)
+        except Exception as exc:
+            job.message = f"{what} failed: {exc}"
+            print(f"[{job.sql_path}] {job.key + ': ' if job.key else ''}{job.message}", file=sys.stderr)
+            self.backoff(job)
+            return False
+        return True
+
+    def poll(self, job: BatchJob) -> None:
+        args = self.args
+        info = get_download_info(job.key, timeout_s=args.timeout)
+        status = (info.get("status") or "").upper()
+        if status != job.status:
+            print(f"[{job.sql_path}] {job.key}: {status}")
+            job.status = status
+        if status == "SUCCEEDED":
+            self.start_download(job, info)
+        else:
+            # Back off while the job sits in GBIF's queue
+            self.backoff(job)
+
+    def start_download(self, job: BatchJob, info: Optional[dict] = None) -> None:
+        job.downloading = True
+        self.downloads[self.pool.submit(self.fetch, job, info)] = job
+
+    def fetch(self, job: BatchJob, info: Optional[dict] = None) -> Path:
+        # Runs in the download pool: only reads the job, collect() records the outcome
+        args = self.args
+        if not info:
+            # Resumed or retried download: fetch the metadata again so size and checksum are still checked
+            info = get_download_info(job.key, timeout_s=args.timeout)
+        destination = args.out_dir / f"{Path(job.sql_path).stem}-{job.key}.zip"
+        print(f"[{job.sql_path}] Downloading {job.key} -> {destination}")
+        download_zip(
+            job.key,
+            destination=destination,
+            timeout_s=max(args.timeout, 120),
+            parts=args.parts,
+            expected_size=info.get("size") or None,
+            expected_md5=info.get("checksum") or None,
+        )
+        if args.extract:
+            extract_zip(destination, destination.with_suffix(""))
+        return destination
+
+    def collect(self, timeout_s: Optional[float] = 0) -> None:
+        # Record finished downloads, waiting up to timeout_s (None: indefinitely) for the first one
+        if not self.downloads:
+            return
+        finished, _ = wait(self.downloads, timeout=timeout_s, return_when=FIRST_COMPLETED)
+        for fut in finished:
+            job = self.downloads.pop(fut)
+            job.downloading = False
+            try:
+                job.zip_path = str(fut.result())
+            except Exception as exc:
+                job.failures += 1
+                job.message = f"download failed: {exc}"
+                print(f"[{job.sql_path}] {job.key}: {job.message}", file=sys.stderr)
+                if job.failures >= self.args.download_retries:
+                    job.status = DOWNLOAD_FAILED
+                else:
+                    # Stays SUCCEEDED; run() starts it again after the backoff
+                    self.backoff(job)
+            else:
+                job.status = DOWNLOADED
+                job.message = None
+                print(f"[{job.sql_path}] {job.key}: {DOWNLOADED} {job.zip_path}")
+            append_state(self.args.state_file, job)
+
+    def run(self, jobs: List[BatchJob]) -> int:
+        try:
+            return self._run(jobs)
+        finally:
+            self.pool.shutdown(wait=True, cancel_futures=True)
+
+    def _run(self, jobs: List[BatchJob]) -> int:
+        args = self.args
+        deadline = time.time() + args.max_wait
+        while True:
+            self.collect()
+            # Succeeded but not downloaded yet: left over from a crash, or an earlier attempt failed
+            now = time.time()
+            for job in jobs:
+                if job.status == "SUCCEEDED" and not job.downloading and job.next_poll <= now:
+                    self.start_download(job)
+
+            running = sum(1 for j in jobs if j.active)
+            for job in jobs:
+                if running >= args.max_running:
+                    break
+                if job.submitted or job.done or job.next_poll > now:
+                    continue
+                if not self.attempt(job, "submit", self.submit):
+                    continue
+                append_state(args.state_file, job)
+                if job.submitted:
+                    running += 1
+
+            now = time.time()
+            for job in jobs:
+                if job.active and job.next_poll <= now:
+                    status = job.status
+                    self.attempt(job, "poll", self.poll)
+                    if job.status != status:
+                        append_state(args.state_file, job)
+
+            remaining = [j for j in jobs if not j.done]
+            if not remaining:
+                break
+            if time.time() > deadline:
+                print(f"Timed out after {args.max_wait}s with {len(remaining)} downloads outstanding; re-run to resume", file=sys.stderr)
+                # Downloads already running are finished and recorded, so a re-run doesn't repeat them
+                while self.downloads:
+                    self.collect(None)
+                return 3
+
+            # Jobs waiting to be polled, or to retry a failed download or submission
+            waits = [
+                j.next_poll for j in jobs
+                if j.active or (j.status == "SUCCEEDED" and not j.downloading) or (not j.submitted and not j.done and j.next_poll > time.time())
+            ]
+            timeout_s = max(0.0, min(waits) - time.time()) if waits else None
+            if self.downloads:
+                # Wakes early when a download finishes
+                self.collect(timeout_s)
+            elif timeout_s is not None:
+                time.sleep(timeout_s)
+
+        failed = [j for j in jobs if j.status != DOWNLOADED]
+        for job in failed:
+            print(f"[{job.sql_path}] Not downloaded: {job.status} {job.message or ''}".rstrip())
+        return 1 if failed else 0
+
+
+def parse_args(argv: Optional[list] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Submit many GBIF SQL downloads, poll them from one scheduler, and download each result as soon as it succeeds."
+    )
+    parser.add_argument("source", type=Path, help="Directory of .sql files, or a manifest listing one .sql path per line")
+    parser.add_argument("--username", "-u", help="GBIF.org username. Can also be set via GBIF_USERNAME env var")
+    parser.add_argument("--password", "-p", help="GBIF.org password. Can also be set via GBIF_PASSWORD env var")
+
+    parser.add_argument("--send-notification", action="store_true", help="Request GBIF to send an email notification when ready")
+    parser.add_argument("--email", help="Notification email address (used only if --send-notification is set)")
+    parser.add_argument("--format", default="SQL_TSV_ZIP", help="Download format. Default: SQL_TSV_ZIP")
+    parser.add_argument("--strip-comments", action="store_true", help="Strip '--' SQL comment lines before submission")
+
+    parser.add_argument("--state-file", type=Path, default=Path("gbif_sql_batch.jsonl"), help="Durable JSONL job state. Default: gbif_sql_batch.jsonl")
+    parser.add_argument("--run-id", default="", help="Name of this cycle in the state file; a new id submits every query again (e.g. a date). Default: ''")
+    parser.add_argument("--retry-failed", action="store_true", help="Resubmit queries that ended FAILED, KILLED, CANCELLED or INVALID, and re-fetch DOWNLOAD_FAILED results")
+    parser.add_argument("--out-dir", type=Path, default=Path("downloads"), help="Where result ZIPs are written. Default: downloads")
+    parser.add_argument("--extract", action="store_true", help="Extract each ZIP next to it after download")
+    parser.add_argument("--parts", type=int, default=4, help="Parallel HTTP Range requests per ZIP download. Default: 4")
+    parser.add_argument("--download-workers", type=int, default=2, help="ZIPs downloaded at once, alongside polling. Default: 2")
+    parser.add_argument("--download-retries", type=int, default=3, help="Attempts per ZIP before the job is recorded as DOWNLOAD_FAILED. Default: 3")
+
+    parser.add_argument("--max-running", type=int, default=3, help="Max downloads queued/running at GBIF at once. Default: 3")
+    parser.add_argument("--poll-min", type=float, default=30, help="Initial seconds between polls of a key. Default: 30")
+    parser.add_argument("--poll-max", type=float, default=600, help="Upper bound for the poll interval. Default: 600")
+    parser.add_argument("--poll-backoff", type=float, default=1.5, help="Poll interval growth factor. Default: 1.5")
+    parser.add_argument("--max-wait", type=int, default=6 * 3600, help="Max seconds to run before giving up (state is kept). Default: 21600")
+
+    parser.add_argument("--timeout", type=int, default=60, help="HTTP timeout (seconds) for API requests. Default: 60")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[list] = None) -> int:
+    args = parse_args(argv)
+
+    if not args.source.exists():
+        print(f"Source not found: {args.source}", file=sys.stderr)
+        return 2
+    sql_files = collect_sql_files(args.source)
+    missing = [p for p in sql_files if not p.exists()]
+    if missing:
+        print(f"SQL file not found: {missing[0]}", file=sys.stderr)
+        return 2
+    if not sql_files:
+        print(f"No .sql files found in {args.source}", file=sys.stderr)
+        return 2
+
+    username = args.username or os.environ.get("GBIF_USERNAME")
+    password = args.password or os.environ.get("GBIF_PASSWORD")
+    if not username or not password:
+        print("Missing credentials. Provide --username/--password or set GBIF_USERNAME/GBIF_PASSWORD.", file=sys.stderr)
+        return 2
+
+    known = load_state(args.state_file, args.run_id)
+    jobs = []
+    for p in sql_files:
+        digest = sql_digest(p)
+        job = known.get(str(p))
+        if job is None or (job.digest or digest) != digest:
+            job = BatchJob(sql_path=str(p), run=args.run_id, digest=digest)
+        elif args.retry_failed and job.status == DOWNLOAD_FAILED:
+            # GBIF still holds the result; fetch it again without resubmitting
+            job.status, job.message = "SUCCEEDED", None
+        elif args.retry_failed and job.status in RETRYABLE:
+            job = BatchJob(sql_path=str(p), run=args.run_id, digest=digest)
+        job.digest = digest
+        jobs.append(job)
+    resumed = [j for j in jobs if j.active]
+    if resumed:
+        print(f"Resuming {len(resumed)} outstanding download(s) from {args.state_file}")
+
+    return BatchRunner(args, username, password).run(jobs)
+
+
+if __name__ == "__main__":  # pragma: no cover
+    sys.exit(main())
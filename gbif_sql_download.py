@@ -1,21 +1,32 @@
 #!/usr/bin/env python3
 import argparse
+import hashlib
+import json
 import os
 import sys
+import threading
 import time
 import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from typing import Optional, Tuple
 
+import tracing
+from download_cache import DEFAULT_CACHE_DIR, DownloadCache, cache_key, materialize
+from http_cache import HttpCache
+from sql_shards import DEFAULT_YEARS, STRATEGIES, merge_tables, parse_years, shard_predicates, with_predicate, write_table
+
 try:
     import requests
+    from requests.adapters import HTTPAdapter
     from requests.auth import HTTPBasicAuth
 except Exception as exc:  # pragma: no cover
     print("Missing dependency: requests. Please run 'pip install -r requirements.txt'", file=sys.stderr)
     raise
 
 
-GBIF_API_BASE = "https://api.gbif.org/v1"
+# Overridable so the scripts can run against mock_gbif.py
+GBIF_API_BASE = os.environ.get("GBIF_API_BASE", "https://api.gbif.org/v1")
 
 
 def read_sql_file(sql_path: Path, strip_comments: bool) -> str:
@@ -42,15 +53,28 @@ def build_request_body(sql_text: str, send_notification: bool, notification_emai
     return body
 
 
-def validate_sql(body: dict, timeout_s: int) -> Tuple[bool, Optional[str]]:
+def validate_sql(body: dict, timeout_s: int, cache: Optional[HttpCache] = None) -> Tuple[bool, Optional[str]]:
     url = f"{GBIF_API_BASE}/occurrence/download/request/validate"
+    # A POST, so stored under the normalized query rather than the URL alone; only passes are kept
+    cache_url = f"{url}#{cache_key(body['sql'], body['format'])}"
+    entry = cache.get(cache_url) if cache else None
+    if entry is not None and cache.fresh(entry[0]):
+        tracing.add(cache_hits=1)
+        return True, None
+    # (False, message) only when GBIF rejects the query; network errors, timeouts, 429 and 5xx say nothing
+    # about it and raise RuntimeError, so callers can retry instead of marking the query invalid
     try:
         resp = requests.post(url, json=body, headers={"Content-Type": "application/json"}, timeout=timeout_s)
-    except Exception as exc:  # pragma: no cover
-        return False, f"Validation request failed: {exc}"
+    except requests.RequestException as exc:
+        raise RuntimeError(f"Validation request failed: {exc}") from exc
+    tracing.add(http_calls=1)
+    if resp.status_code in (408, 429) or resp.status_code >= 500:
+        raise RuntimeError(f"Validation request failed ({resp.status_code}): {resp.text}")
 
     # Treat any 2xx as a successful validation (GBIF may return 200/201/etc.)
     if 200 <= resp.status_code < 300:
+        if cache:
+            cache.put(cache_url, resp.content, resp.headers)
         return True, None
     # GBIF returns an error message in JSON or text when invalid
     try:
@@ -68,6 +92,7 @@ def submit_download(body: dict, username: str, password: str, timeout_s: int) ->
         auth=HTTPBasicAuth(username, password),
         timeout=timeout_s,
     )
+    tracing.add(http_calls=1)
     if resp.status_code not in (201, 202):
         raise RuntimeError(f"Request failed ({resp.status_code}): {resp.text}")
     # API returns the download key as plain text body
@@ -77,24 +102,46 @@ def submit_download(body: dict, username: str, password: str, timeout_s: int) ->
     return key
 
 
-def poll_until_done(key: str, poll_interval_s: int, max_wait_s: int) -> dict:
+FINAL_STATUSES = ("SUCCEEDED", "CANCELLED", "KILLED", "FAILED")
+
+
+def get_download_info(key: str, timeout_s: int = 30, cache: Optional[HttpCache] = None) -> dict:
     url = f"{GBIF_API_BASE}/occurrence/download/{key}"
+    # Metadata of a finished download never changes, so a stored copy is used regardless of age
+    entry = cache.get(url) if cache else None
+    if entry is not None:
+        tracing.add(cache_hits=1)
+        return json.loads(entry[1])
+    resp = requests.get(url, timeout=timeout_s)
+    tracing.add(http_calls=1)
+    if resp.status_code != 200:
+        raise RuntimeError(f"Polling failed ({resp.status_code}): {resp.text}")
+    info = resp.json()
+    if cache and (info.get("status") or "").upper() in FINAL_STATUSES:
+        cache.put(url, resp.content, resp.headers)
+    return info
+
+
+def poll_until_done(key: str, poll_interval_s: int, max_wait_s: int, cache: Optional[HttpCache] = None, stop: Optional[threading.Event] = None,
+                    label: str = "") -> dict:
     start_time = time.time()
     last_status = None
     while True:
-        resp = requests.get(url, timeout=30)
-        if resp.status_code != 200:
-            raise RuntimeError(f"Polling failed ({resp.status_code}): {resp.text}")
-        info = resp.json()
+        if stop is not None and stop.is_set():
+            raise RuntimeError(f"Stopped waiting for download {key}")
+        info = get_download_info(key, cache=cache)
         status = (info.get("status") or "").upper()
         if status != last_status:
-            print(f"Status: {status}")
+            print(f"{label}Status: {status}")
             last_status = status
-        if status in ("SUCCEEDED", "CANCELLED", "KILLED", "FAILED"):
+        if status in FINAL_STATUSES:
             return info
         if time.time() - start_time > max_wait_s:
             raise TimeoutError(f"Timed out after {max_wait_s}s waiting for download {key}")
-        time.sleep(poll_interval_s)
+        if stop is not None:
+            stop.wait(poll_interval_s)
+        else:
+            time.sleep(poll_interval_s)
 
 
 def compute_zip_url(key: str) -> str:
@@ -102,15 +149,165 @@ def compute_zip_url(key: str) -> str:
     return f"{GBIF_API_BASE}/occurrence/download/request/{key}.zip"
 
 
-def download_zip(key: str, destination: Path, timeout_s: int) -> Path:
-    url = compute_zip_url(key)
+DOWNLOAD_CHUNK_BYTES = 1024 * 1024
+# How much each part may download between progress sidecar writes
+PROGRESS_SAVE_BYTES = 16 * 1024 * 1024
+
+
+def _progress_path(destination: Path) -> Path:
+    return destination.with_name(destination.name + ".progress.json")
+
+
+def _partial_path(destination: Path) -> Path:
+    return destination.with_name(destination.name + ".part")
+
+
+def _save_progress(progress_file: Path, state: dict) -> None:
+    tmp = progress_file.with_name(progress_file.name + ".tmp")
+    tmp.write_text(json.dumps(state), encoding="utf-8")
+    os.replace(tmp, progress_file)
+
+
+def _probe_download(session: requests.Session, url: str, timeout_s: int) -> Tuple[str, Optional[int], bool, Optional[str]]:
+    # Follow GBIF's redirect once so every ranged request goes straight to the file host. Also returns
+    # the file's validator (ETag, else Last-Modified) when the host sends one
+    resp = session.head(url, allow_redirects=True, timeout=timeout_s)
+    tracing.add(http_calls=1 + len(resp.history))
+    resp.raise_for_status()
+    length = resp.headers.get("Content-Length")
+    size = int(length) if length and length.isdigit() else None
+    accepts_ranges = resp.headers.get("Accept-Ranges", "").lower() == "bytes"
+    return resp.url, size, accepts_ranges, resp.headers.get("ETag") or resp.headers.get("Last-Modified")
+
+
+def _plan_parts(size: int, parts: int) -> list:
+    part_size = max(DOWNLOAD_CHUNK_BYTES, -(-size // max(1, parts)))
+    plan = []
+    start = 0
+    while start < size:
+        end = min(start + part_size, size) - 1
+        plan.append({"start": start, "end": end, "done": 0})
+        start = end + 1
+    return plan
+
+
+def _fetch_part(session: requests.Session, url: str, partial: Path, part: dict, save, timeout_s: int, retries: int = 4) -> None:
+    attempt = 0
+    while True:
+        pos = part["start"] + part["done"]
+        if pos > part["end"]:
+            return
+        try:
+            headers = {"Range": f"bytes={pos}-{part['end']}"}
+            tracing.add(http_calls=1)
+            with session.get(url, headers=headers, stream=True, timeout=timeout_s) as r:
+                if r.status_code != 206:
+                    raise RuntimeError(f"Range request not honoured ({r.status_code}) for {url}")
+                # Unbuffered so recorded progress never runs ahead of bytes handed to the OS
+                with open(partial, "r+b", buffering=0) as f:
+                    f.seek(pos)
+                    unsaved = 0
+                    try:
+                        for chunk in r.iter_content(chunk_size=DOWNLOAD_CHUNK_BYTES):
+                            if not chunk:
+                                continue
+                            f.write(chunk)
+                            part["done"] += len(chunk)
+                            unsaved += len(chunk)
+                            tracing.add(bytes=len(chunk))
+                            if unsaved >= PROGRESS_SAVE_BYTES:
+                                save()
+                                unsaved = 0
+                    finally:
+                        save()
+            if part["start"] + part["done"] <= part["end"]:
+                raise RuntimeError(f"Connection closed early for bytes {pos}-{part['end']}")
+            return
+        except (requests.RequestException, RuntimeError):
+            attempt += 1
+            if attempt > retries:
+                raise
+            tracing.add(retries=1)
+            time.sleep(0.8 * (2 ** (attempt - 1)))
+
+
+def verify_download(path: Path, expected_size: Optional[int] = None, expected_md5: Optional[str] = None) -> None:
+    actual_size = path.stat().st_size
+    if expected_size is not None and actual_size != expected_size:
+        raise RuntimeError(f"Size mismatch for {path}: expected {expected_size} bytes, got {actual_size}")
+    if expected_md5:
+        digest = hashlib.md5()
+        with path.open("rb") as f:
+            for block in iter(lambda: f.read(DOWNLOAD_CHUNK_BYTES), b""):
+                digest.update(block)
+        if digest.hexdigest().lower() != expected_md5.lower():
+            raise RuntimeError(f"Checksum mismatch for {path}: expected {expected_md5}, got {digest.hexdigest()}")
+
+
+def download_zip(key: str, destination: Path, timeout_s: int, parts: int = 4, expected_size: Optional[int] = None, expected_md5: Optional[str] = None, url: Optional[str] = None) -> Path:
+    url = url or compute_zip_url(key)
     destination.parent.mkdir(parents=True, exist_ok=True)
-    with requests.get(url, stream=True, timeout=timeout_s) as r:
-        r.raise_for_status()
-        with open(destination, "wb") as f:
-            for chunk in r.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
+    partial = _partial_path(destination)
+    progress_file = _progress_path(destination)
+
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(pool_maxsize=max(1, parts)))
+    session.mount("http://", HTTPAdapter(pool_maxsize=max(1, parts)))
+    file_url, size, accepts_ranges, validator = _probe_download(session, url, timeout_s)
+    if size is None:
+        size = expected_size
+
+    if accepts_ranges and size:
+        state = None
+        if progress_file.exists() and partial.exists():
+            try:
+                state = json.loads(progress_file.read_text(encoding="utf-8"))
+            except Exception:
+                state = None
+            # Only resume the same file: another download written to this path may have the same size
+            if state and (state.get("key"), state.get("size"), state.get("validator")) != (key, size, validator):
+                state = None
+        if state is None:
+            state = {"key": key, "size": size, "validator": validator, "parts": _plan_parts(size, parts)}
+            # Preallocate so parts can be written at their offsets in any order
+            with open(partial, "wb") as f:
+                f.truncate(size)
+            _save_progress(progress_file, state)
+        else:
+            done = sum(p["done"] for p in state["parts"])
+            print(f"Resuming download at {done}/{size} bytes")
+
+        lock = threading.Lock()
+
+        def save() -> None:
+            with lock:
+                _save_progress(progress_file, state)
+
+        with ThreadPoolExecutor(max_workers=max(1, len(state["parts"]))) as ex:
+            futures = [ex.submit(tracing.bind(_fetch_part), session, file_url, partial, part, save, timeout_s) for part in state["parts"]]
+            for fut in futures:
+                fut.result()
+    else:
+        # Server can't do ranges: single stream, restarted from zero on failure
+        tracing.add(http_calls=1)
+        with session.get(file_url, stream=True, timeout=timeout_s) as r:
+            r.raise_for_status()
+            with open(partial, "wb") as f:
+                for chunk in r.iter_content(chunk_size=DOWNLOAD_CHUNK_BYTES):
+                    if chunk:
+                        f.write(chunk)
+                        tracing.add(bytes=len(chunk))
+
+    try:
+        verify_download(partial, expected_size=size if expected_size is None else expected_size, expected_md5=expected_md5)
+    except RuntimeError:
+        # Never resume from bytes that failed verification; the next attempt starts over
+        partial.unlink(missing_ok=True)
+        progress_file.unlink(missing_ok=True)
+        raise
+    os.replace(partial, destination)
+    if progress_file.exists():
+        progress_file.unlink()
     return destination
 
 
@@ -118,6 +315,7 @@ def extract_zip(zip_path: Path, extract_dir: Path) -> None:
     extract_dir.mkdir(parents=True, exist_ok=True)
     with zipfile.ZipFile(zip_path, "r") as zf:
         zf.extractall(extract_dir)
+        tracing.add(bytes=sum(info.file_size for info in zf.infolist()))
 
 
 def parse_args(argv: Optional[list] = None) -> argparse.Namespace:
@@ -142,25 +340,58 @@ def parse_args(argv: Optional[list] = None) -> argparse.Namespace:
     parser.add_argument("--download", action="store_true", help="Download the resulting ZIP when ready")
     parser.add_argument("--output", type=Path, default=Path("gbif_sql_download.zip"), help="Output ZIP path. Default: gbif_sql_download.zip")
     parser.add_argument("--extract", type=Path, help="If set, extract the ZIP into this directory after download")
+    parser.add_argument("--parts", type=int, default=4, help="Parallel HTTP Range requests for the ZIP download. Default: 4")
+
+    parser.add_argument("--shards", type=int, default=1, help="Split the query into this many shard downloads, run them in parallel and merge the results locally. Needs --download or --extract. Default: 1 (no sharding)")
+    parser.add_argument("--shard-by", choices=STRATEGIES, default="key", help="Shard on year ranges, basisOfRecord values, or ranges of the first GROUP BY column. Default: key")
+    parser.add_argument("--shard-years", type=parse_years, default=DEFAULT_YEARS, help="FIRST:LAST years spread over --shard-by year shards; earlier, later and NULL years go to the outer shards. Default: 1900:this year")
 
     parser.add_argument("--timeout", type=int, default=60, help="HTTP timeout (seconds) for API requests. Default: 60")
 
+    parser.add_argument("--cache-dir", type=Path, default=DEFAULT_CACHE_DIR, help="Result cache keyed by normalized SQL. Default: .gbif_cache")
+    parser.add_argument("--cache-max-age", type=float, default=48, help="Hours a cached download (local ZIP or remote key) or validation may be reused. Default: 48")
+    parser.add_argument("--cache-max-gb", type=float, default=20, help="Size bound of the local ZIP store (LRU eviction). Default: 20")
+    parser.add_argument("--no-cache", action="store_true", help="Always validate and submit a fresh download, without the result or HTTP cache")
+    tracing.add_trace_argument(parser)
+
     return parser.parse_args(argv)
 
 
 def main(argv: Optional[list] = None) -> int:
     args = parse_args(argv)
+    tracing.configure(args.trace, "gbif_sql_download")
+    try:
+        return run(args)
+    finally:
+        tracing.finish()
 
+
+def http_cache_for(args: argparse.Namespace) -> Optional[HttpCache]:
+    # Validations and finished-download metadata, in the shared HTTP cache under --cache-dir
+    if args.no_cache:
+        return None
+    return HttpCache(args.cache_dir / "http", ttl_s=args.cache_max_age * 3600)
+
+
+def run(args: argparse.Namespace) -> int:
     if not args.sql_file.exists():
         print(f"SQL file not found: {args.sql_file}", file=sys.stderr)
         return 2
 
     sql_text = read_sql_file(args.sql_file, strip_comments=args.strip_comments)
+    http = http_cache_for(args)
+    if args.shards > 1:
+        return run_sharded(args, sql_text, http)
     body = build_request_body(sql_text, args.send_notification, args.email, args.format)
 
     # Validate first unless user chooses to skip
     print("Validating SQL...")
-    is_valid, error_message = validate_sql(body, timeout_s=args.timeout)
+    try:
+        with tracing.span("validate"):
+            is_valid, error_message = validate_sql(body, timeout_s=args.timeout, cache=http)
+    except RuntimeError as exc:
+        print(f"{exc}; the query was not checked, try again later", file=sys.stderr)
+        return 1
     if not is_valid:
         print("Validation failed:")
         print(error_message or "Unknown error")
@@ -170,38 +401,201 @@ def main(argv: Optional[list] = None) -> int:
     if args.validate_only:
         return 0
 
-    username = args.username or os.environ.get("GBIF_USERNAME")
-    password = args.password or os.environ.get("GBIF_PASSWORD")
-    if not username or not password:
-        print("Missing credentials. Provide --username/--password or set GBIF_USERNAME/GBIF_PASSWORD.", file=sys.stderr)
-        return 2
+    with tracing.span("cache_lookup") as sp:
+        cache = None if args.no_cache else DownloadCache(args.cache_dir, max_bytes=int(args.cache_max_gb * 1024 ** 3))
+        cached = cache.lookup(sql_text, args.format, max_age_s=args.cache_max_age * 3600) if cache else None
+        sp.add(cache_hits=1 if cached else 0)
+    wants_zip = args.download or args.extract
+
+    if cached and cached.get("zip_path") and wants_zip:
+        print(f"Cache hit: reusing local ZIP of download {cached['key']}")
+        zip_path = materialize(Path(cached["zip_path"]), args.output)
+        print(f"Saved: {zip_path}")
+        if args.extract:
+            print(f"Extracting into: {args.extract}")
+            with tracing.span("extract"):
+                extract_zip(zip_path, args.extract)
+            print("Extraction complete")
+        return 0
 
-    print("Submitting download request...")
-    key = submit_download(body, username=username, password=password, timeout_s=args.timeout)
+    if cached:
+        key = cached["key"]
+        print(f"Cache hit: reusing download key {key} without resubmitting")
+    else:
+        username = args.username or os.environ.get("GBIF_USERNAME")
+        password = args.password or os.environ.get("GBIF_PASSWORD")
+        if not username or not password:
+            print("Missing credentials. Provide --username/--password or set GBIF_USERNAME/GBIF_PASSWORD.", file=sys.stderr)
+            return 2
+
+        print("Submitting download request...")
+        with tracing.span("submit"):
+            key = submit_download(body, username=username, password=password, timeout_s=args.timeout)
+        if cache:
+            cache.record_submitted(sql_text, args.format, key)
     print(f"Download key: {key}")
 
-    if not args.poll and not args.download and not args.extract:
+    if not args.poll and not wants_zip:
         print("Hint: use --poll to wait for completion, and --download to fetch the ZIP.")
         return 0
 
-    info = poll_until_done(key, poll_interval_s=args.poll_interval, max_wait_s=args.max_wait)
+    # Time spent here is GBIF queueing and running the query
+    with tracing.span("poll", key=key):
+        info = poll_until_done(key, poll_interval_s=args.poll_interval, max_wait_s=args.max_wait, cache=http)
     status = (info.get("status") or "").upper()
     if status != "SUCCEEDED":
+        if cached:
+            # Don't hand out a failed key again
+            cache.invalidate(cached["digest"])
         print(f"Download did not succeed. Final status: {status}")
         return 3
 
-    if args.download or args.extract:
+    if wants_zip:
         print("Downloading ZIP...")
-        zip_path = download_zip(key, destination=args.output, timeout_s=max(args.timeout, 120))
+        with tracing.span("download", parts=args.parts):
+            zip_path = download_zip(
+                key,
+                destination=args.output,
+                timeout_s=max(args.timeout, 120),
+                parts=args.parts,
+                expected_size=info.get("size") or None,
+                expected_md5=info.get("checksum") or None,
+            )
         print(f"Saved: {zip_path}")
+        if cache:
+            cache.store_zip(sql_text, args.format, key, zip_path)
         if args.extract:
             print(f"Extracting into: {args.extract}")
-            extract_zip(zip_path, args.extract)
+            with tracing.span("extract"):
+                extract_zip(zip_path, args.extract)
             print("Extraction complete")
 
     return 0
 
 
+def shard_path(output: Path, index: int) -> Path:
+    return output.with_name(f"{output.stem}.shard-{index:02d}{output.suffix}")
+
+
+def fetch_shard(args: argparse.Namespace, index: int, sql_text: str, cached: Optional[dict], cache: Optional[DownloadCache], lock: threading.Lock,
+                credentials: Tuple[Optional[str], Optional[str]], http: Optional[HttpCache] = None, stop: Optional[threading.Event] = None) -> Path:
+    # One shard end to end: reuse a cached ZIP or key, else submit; then poll and download to its own file
+    destination = shard_path(args.output, index)
+    if cached and cached.get("zip_path"):
+        print(f"Shard {index}: cache hit, reusing local ZIP of download {cached['key']}")
+        return materialize(Path(cached["zip_path"]), destination)
+    if cached:
+        key = cached["key"]
+    else:
+        if stop is not None and stop.is_set():
+            raise RuntimeError(f"Shard {index} not submitted: another shard failed")
+        body = build_request_body(sql_text, args.send_notification, args.email, args.format)
+        with tracing.span("submit", shard=index):
+            key = submit_download(body, username=credentials[0], password=credentials[1], timeout_s=args.timeout)
+        if cache:
+            with lock:
+                cache.record_submitted(sql_text, args.format, key)
+    print(f"Shard {index}: download key {key}")
+    with tracing.span("poll", key=key, shard=index):
+        info = poll_until_done(key, poll_interval_s=args.poll_interval, max_wait_s=args.max_wait, cache=http, stop=stop, label=f"Shard {index}: ")
+    status = (info.get("status") or "").upper()
+    if status != "SUCCEEDED":
+        if cached:
+            with lock:
+                cache.invalidate(cached["digest"])
+        raise RuntimeError(f"Shard {index} download {key} did not succeed. Final status: {status}")
+    with tracing.span("download", shard=index, parts=args.parts):
+        zip_path = download_zip(key, destination=destination, timeout_s=max(args.timeout, 120), parts=args.parts,
+                                expected_size=info.get("size") or None, expected_md5=info.get("checksum") or None)
+    if cache:
+        with lock:
+            cache.store_zip(sql_text, args.format, key, zip_path)
+    return zip_path
+
+
+def run_sharded(args: argparse.Namespace, sql_text: str, http: Optional[HttpCache] = None) -> int:
+    # Each shard sees a disjoint slice of the occurrences, so summing its counters per group and
+    # recomputing the percentages gives exactly the single query's table
+    if not args.validate_only and not (args.download or args.extract):
+        print("--shards needs --download or --extract: shard results are merged locally", file=sys.stderr)
+        return 2
+    try:
+        predicates = shard_predicates(sql_text, args.shard_by, args.shards, years=args.shard_years)
+    except ValueError as exc:
+        print(f"Cannot shard {args.sql_file}: {exc}", file=sys.stderr)
+        return 2
+    queries = [with_predicate(sql_text, p) for p in predicates]
+
+    print(f"Validating {len(queries)} shard queries (by {args.shard_by})...")
+    bodies = [build_request_body(q, args.send_notification, args.email, args.format) for q in queries]
+    try:
+        with tracing.span("validate", shards=len(queries)):
+            with ThreadPoolExecutor(max_workers=len(queries)) as ex:
+                checks = list(ex.map(tracing.bind(lambda b: validate_sql(b, timeout_s=args.timeout, cache=http)), bodies))
+    except RuntimeError as exc:
+        print(f"{exc}; the shard queries were not checked, try again later", file=sys.stderr)
+        return 1
+    for index, (is_valid, error_message) in enumerate(checks):
+        if not is_valid:
+            print(f"Validation failed for shard {index}:")
+            print(error_message or "Unknown error")
+            return 1
+    print("Validation OK")
+    if args.validate_only:
+        return 0
+
+    with tracing.span("cache_lookup") as sp:
+        cache = None if args.no_cache else DownloadCache(args.cache_dir, max_bytes=int(args.cache_max_gb * 1024 ** 3))
+        cached = [cache.lookup(q, args.format, max_age_s=args.cache_max_age * 3600) if cache else None for q in queries]
+        sp.add(cache_hits=sum(1 for c in cached if c))
+    username = args.username or os.environ.get("GBIF_USERNAME")
+    password = args.password or os.environ.get("GBIF_PASSWORD")
+    if not all(cached) and (not username or not password):
+        print("Missing credentials. Provide --username/--password or set GBIF_USERNAME/GBIF_PASSWORD.", file=sys.stderr)
+        return 2
+
+    lock = threading.Lock()
+    stop = threading.Event()
+    with tracing.span("shards", shards=len(queries)):
+        ex = ThreadPoolExecutor(max_workers=len(queries))
+        futures = {ex.submit(tracing.bind(fetch_shard), args, i, q, cached[i], cache, lock, (username, password), http, stop): i for i, q in enumerate(queries)}
+        shard_zips = [Path()] * len(queries)
+        try:
+            # The merge needs every shard, so the first failure stops the others' polling and
+            # submissions instead of waiting for them to finish
+            for fut in as_completed(futures):
+                index = futures[fut]
+                try:
+                    shard_zips[index] = fut.result()
+                except Exception as exc:
+                    print(f"Shard {index} ({predicates[index]}) failed: {type(exc).__name__}: {exc}", file=sys.stderr)
+                    return 3
+        finally:
+            stop.set()
+            ex.shutdown(wait=False, cancel_futures=True)
+
+    with tracing.span("merge", shards=len(shard_zips)) as sp:
+        try:
+            header, rows = merge_tables(shard_zips)
+        except (ValueError, zipfile.BadZipFile) as exc:
+            print(f"Cannot merge the shard results: {exc}", file=sys.stderr)
+            return 3
+        merged = args.output.with_name(f"{args.output.stem}.csv")
+        write_table(header, rows, merged)
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        with zipfile.ZipFile(args.output, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+            zf.write(merged, merged.name)
+        merged.unlink()
+        sp.add(rows=len(rows))
+    print(f"Merged {len(shard_zips)} shards into {len(rows)} rows: {args.output}")
+    if args.extract:
+        print(f"Extracting into: {args.extract}")
+        with tracing.span("extract"):
+            extract_zip(args.output, args.extract)
+        print("Extraction complete")
+    return 0
+
+
 if __name__ == "__main__":  # pragma: no cover
     sys.exit(main())
 
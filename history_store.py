@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from array import array
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from recordedby_schemes import count_columns, pct_column
+from stats_reader import iter_batches
+
+
+COUNT_COLS = count_columns()
+WIDTH = len(COUNT_COLS)
+
+# Entity level -> key column of its stats table (lowercased), as in rollup.py's levels
+LEVEL_KEYS = {
+    "publisher": "publishingorgkey",
+    "hostingorg": "hostingorganizationkey",
+    "node": "nodekey",
+    "country": "country",
+    "dataset": "datasetkey",
+}
+
+
+def _read_array(path: Path, typecode: str) -> array:
+    arr = array(typecode)
+    if path.exists():
+        with path.open("rb") as f:
+            arr.frombytes(f.read())
+    return arr
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    with tmp.open("wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+class HistoryStore:
+    # Layout of one level directory:
+    #   meta.json         counter columns the binary files were written with, in order
+    #   keys.txt          key dictionary, append-only; line number = entity id
+    #   snapshots.jsonl   one record per snapshot, append-only
+    #   delta-<n>.bin     changed entities of snapshot n: int32 count, int32 ids, int64 counters
+    #   state.bin         counters of the latest snapshot, WIDTH int64 per entity id
+    #   pending.json      present only while an ingest is writing delta, state and snapshot record
+    def __init__(self, root: Path) -> None:
+        self.root = root
+        self.meta_file = root / "meta.json"
+        self.keys_file = root / "keys.txt"
+        self.snapshots_file = root / "snapshots.jsonl"
+        self.state_file = root / "state.bin"
+        self.pending_file = root / "pending.json"
+        self.keys: List[str] = []
+        self.key_ids: Dict[str, int] = {}
+        self.snapshots: List[dict] = []
+        self._load()
+
+    def _load(self) -> None:
+        if self.keys_file.exists():
+            self.keys = self.keys_file.read_text(encoding="utf-8").splitlines()
+            self.key_ids = {k: i for i, k in enumerate(self.keys)}
+        if self.snapshots_file.exists():
+            with self.snapshots_file.open("r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        self.snapshots.append(json.loads(line))
+                    except ValueError:
+                        # Blank, or torn by a crash during an ingest; _recover() rewrites the log
+                        continue
+        self._check_columns()
+        self._recover()
+
+    def _check_columns(self) -> None:
+        # The binary files have no self-describing width; reading them with another column list would
+        # silently shift every counter
+        if self.meta_file.exists():
+            columns = json.loads(self.meta_file.read_text(encoding="utf-8")).get("columns")
+            if columns != COUNT_COLS:
+                raise ValueError(
+                    f"{self.root} was written with {len(columns or [])} counter columns ({', '.join(columns or [])}), "
+                    f"this version uses {WIDTH} ({', '.join(COUNT_COLS)}); re-ingest into a new store"
+                )
+        elif self.state_file.exists() and self.state_file.stat().st_size != len(self.keys) * WIDTH * 8:
+            # Store from before meta.json: only the width can be checked
+            raise ValueError(f"{self.root} does not hold {WIDTH} counters per entity; re-ingest into a new store")
+
+    def _recover(self) -> None:
+        # An ingest interrupted before its snapshot record was appended may already have replaced
+        # state.bin: rebuild it from the recorded snapshots' deltas and drop the unrecorded delta
+        if not self.pending_file.exists():
+            return
+        n = json.loads(self.pending_file.read_text(encoding="utf-8"))["n"]
+        if len(self.snapshots) <= n:
+            state = self.state_at(self.snapshots[-1]["id"]) if self.snapshots else array("q")
+            _write_atomic(self.state_file, state.tobytes())
+            self._delta_path(n).unlink(missing_ok=True)
+            _write_atomic(self.snapshots_file, "".join(json.dumps(s) + "\n" for s in self.snapshots).encode("utf-8"))
+        self.pending_file.unlink()
+
+    def _delta_path(self, n: int) -> Path:
+        return self.root / f"delta-{n}.bin"
+
+    def snapshot_index(self, snapshot_id: str) -> int:
+        for n, snap in enumerate(self.snapshots):
+            if snap["id"] == snapshot_id:
+                return n
+        raise KeyError(f"Unknown snapshot: {snapshot_id}")
+
+    def ingest(self, rows: Dict[str, List[int]], snapshot_id: str, source: str = "") -> int:
+        if any(s["id"] == snapshot_id for s in self.snapshots):
+            raise ValueError(f"Snapshot {snapshot_id} already ingested")
+        self.root.mkdir(parents=True, exist_ok=True)
+        if not self.meta_file.exists():
+            _write_atomic(self.meta_file, json.dumps({"columns": COUNT_COLS}).encode("utf-8"))
+
+        new_keys = [k for k in rows if k not in self.key_ids]
+        if new_keys:
+            with self.keys_file.open("a", encoding="utf-8") as f:
+                for k in new_keys:
+                    self.key_ids[k] = len(self.keys)
+                    self.keys.append(k)
+                    f.write(k + "\n")
+
+        state = _read_array(self.state_file, "q")
+        state.extend([0] * (len(self.keys) * WIDTH - len(state)))
+        present = set()
+        changed_ids = array("i")
+        changed_vals = array("q")
+        for key, counts in rows.items():
+            i = self.key_ids[key]
+            present.add(i)
+            base = i * WIDTH
+            if state[base:base + WIDTH].tolist() != counts:
+                changed_ids.append(i)
+                changed_vals.extend(counts)
+                state[base:base + WIDTH] = array("q", counts)
+        # Entities missing from this snapshot drop to zero
+        zero = [0] * WIDTH
+        for i in range(len(self.keys)):
+            base = i * WIDTH
+            if i not in present and state[base] != 0:
+                changed_ids.append(i)
+                changed_vals.extend(zero)
+                state[base:base + WIDTH] = array("q", zero)
+
+        n = len(self.snapshots)
+        header = array("i", [len(changed_ids)])
+        # The snapshot record commits the ingest; until then pending.json lets _recover() undo it
+        _write_atomic(self.pending_file, json.dumps({"n": n, "id": snapshot_id}).encode("utf-8"))
+        _write_atomic(self._delta_path(n), header.tobytes() + changed_ids.tobytes() + changed_vals.tobytes())
+        _write_atomic(self.state_file, state.tobytes())
+        record = {"id": snapshot_id, "source": source, "created": time.time(), "entities": len(rows), "changed": len(changed_ids)}
+        with self.snapshots_file.open("a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.snapshots.append(record)
+        self.pending_file.unlink()
+        return len(changed_ids)
+
+    def read_delta(self, n: int) -> Tuple[array, array]:
+        raw = self._delta_path(n).read_bytes()
+        count = array("i", raw[:4])[0]
+        ids = array("i", raw[4:4 + 4 * count])
+        vals = array("q", raw[4 + 4 * count:])
+        return ids, vals
+
+    def state_at(self, snapshot_id: str) -> array:
+        # Replay the (small) deltas up to and including the snapshot
+        upto = self.snapshot_index(snapshot_id)
+        state = array("q", [0] * (len(self.keys) * WIDTH))
+        for n in range(upto + 1):
+            ids, vals = self.read_delta(n)
+            for j, i in enumerate(ids):
+                state[i * WIDTH:(i + 1) * WIDTH] = vals[j * WIDTH:(j + 1) * WIDTH]
+        return state
+
+    def current_state(self) -> array:
+        state = _read_array(self.state_file, "q")
+        state.extend([0] * (len(self.keys) * WIDTH - len(state)))
+        return state
+
+    def series(self) -> List[array]:
+        # Full state after every snapshot, for time-series export
+        states = []
+        state = array("q", [0] * (len(self.keys) * WIDTH))
+        for n in range(len(self.snapshots)):
+            ids, vals = self.read_delta(n)
+            for j, i in enumerate(ids):
+                state[i * WIDTH:(i + 1) * WIDTH] = vals[j * WIDTH:(j + 1) * WIDTH]
+            states.append(array("q", state))
+        return states
+
+
+def pct_of(state: array, i: int, col: int) -> Optional[float]:
+    total = state[i * WIDTH]
+    if total <= 0:
+        return None
+    return 100.0 * state[i * WIDTH + col] / total
+
+
+def read_stats_table(path: Path, level: str) -> Dict[str, List[int]]:
+    # Rows sharing a key are summed, so a finer table (e.g. per dataset) can feed a coarser level
+    key_col = LEVEL_KEYS[level]
+    rows: Dict[str, List[int]] = {}
+    for batch in iter_batches(path, columns=[key_col] + COUNT_COLS):
+        if key_col not in batch:
+            raise ValueError(f"{path} has no {key_col} column, which the {level} level is keyed by")
+        for key, *counts in zip(batch.column(key_col), *(batch.column(c) for c in COUNT_COLS)):
+            key = key.strip()
+            if not key:
+                continue
+            acc = rows.get(key)
+            if acc is None:
+                rows[key] = counts
+            else:
+                for j, v in enumerate(counts):
+                    acc[j] += v
+    return rows
+
+
+def write_delta_csv(store: HistoryStore, since: str, metric: str, out_csv: Optional[Path]) -> None:
+    count_col = next((c for c in COUNT_COLS if pct_column(c) == metric or c == metric), None)
+    if count_col is None or count_col == "total_records":
+        raise ValueError(f"Unknown metric: {metric}")
+    col = COUNT_COLS.index(count_col)
+    before = store.state_at(since)
+    after = store.current_state()
+    f = out_csv.open("w", encoding="utf-8", newline="") if out_csv else sys.stdout
+    try:
+        w = csv.writer(f)
+        w.writerow(["key", f"{metric}_before", f"{metric}_after", "change"])
+        for i, key in enumerate(store.keys):
+            b = pct_of(before, i, col)
+            a = pct_of(after, i, col)
+            if a is None and b is None:
+                continue
+            change = (a or 0.0) - (b or 0.0)
+            w.writerow([key, "" if b is None else b, "" if a is None else a, change])
+    finally:
+        if out_csv:
+            f.close()
+
+
+def export_series(store: HistoryStore, out_json: Path) -> None:
+    # Per-entity time series of the headline counters; the viewer derives percentages
+    cols = ["total_records", "records_with_recordedbyid", "records_with_valid_recordedbyid"]
+    idx = [COUNT_COLS.index(c) for c in cols]
+    states = store.series()
+    data = {
+        "snapshots": [{"id": s["id"], "created": s["created"]} for s in store.snapshots],
+        "keys": store.keys,
+        "columns": cols,
+        "series": [[[state[i * WIDTH + j] for j in idx] for state in states] for i in range(len(store.keys))],
+    }
+    out_json.parent.mkdir(parents=True, exist_ok=True)
+    out_json.write_text(json.dumps(data, separators=(",", ":")), encoding="utf-8")
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Append-only history of stats snapshots with delta queries")
+    p.add_argument("--store", type=Path, default=Path("history"), help="Store root (default: history)")
+    p.add_argument("--level", choices=sorted(LEVEL_KEYS), default="publisher", help="Entity level, one sub-store each, keyed by its own column (default: publisher)")
+    sub = p.add_subparsers(dest="command", required=True)
+
+    ing = sub.add_parser("ingest", help="Add a stats table as a new snapshot")
+    ing.add_argument("stats", type=Path, help="Stats TSV/CSV or result ZIP (publisher, hosting org, node, ...)")
+    ing.add_argument("--snapshot-id", help="Snapshot id (default: file name stem, e.g. the download key)")
+
+    dl = sub.add_parser("delta", help="Change of a pct_* metric since a snapshot, for all entities")
+    dl.add_argument("--since", required=True, help="Snapshot id to compare against")
+    dl.add_argument("--metric", default="pct_valid_recordedbyid", help="pct_* column (default: pct_valid_recordedbyid)")
+    dl.add_argument("--out", type=Path, help="Output CSV (default: stdout)")
+
+    ex = sub.add_parser("export", help="Write the time series JSON for the viewer")
+    ex.add_argument("--out", type=Path, help="Output JSON (default: out-history/<level>.json)")
+
+    sub.add_parser("list", help="List snapshots")
+    return p.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    try:
+        store = HistoryStore(args.store / args.level)
+        if args.command == "ingest":
+            snapshot_id = args.snapshot_id or args.stats.stem
+            changed = store.ingest(read_stats_table(args.stats, args.level), snapshot_id, source=str(args.stats))
+            print(f"Ingested {snapshot_id}: {changed} changed entities")
+        elif args.command == "delta":
+            write_delta_csv(store, args.since, args.metric, args.out)
+        elif args.command == "export":
+            out = args.out or Path("out-history") / f"{args.level}.json"
+            export_series(store, out)
+            print(f"Wrote {out}")
+        elif args.command == "list":
+            for s in store.snapshots:
+                print(f"{s['id']}\t{time.strftime('%Y-%m-%d %H:%M', time.localtime(s['created']))}\t{s['entities']} entities\t{s['changed']} changed")
+    except (KeyError, ValueError) as exc:
+        print(f"Error: {exc}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+import tracing
+
+
+# Shared by preload_nodes.py, enrich_hostingorg.py and gbif_sql_download.py, next to the download cache
+DEFAULT_HTTP_CACHE = Path(".gbif_cache/http")
+DEFAULT_TTL_HOURS = 6.0
+DEFAULT_MAX_MB = 512.0
+
+# Response headers kept with each entry
+_KEPT_HEADERS = ("ETag", "Last-Modified", "Content-Type")
+
+
+class HttpCache:
+    # One zlib-compressed file per URL: a JSON metadata line, then the body. Files are replaced
+    # atomically, so worker threads and concurrent processes only ever see whole entries; a file's
+    # mtime is its last use, which drives the LRU eviction once the store exceeds max_bytes
+    def __init__(self, root: Path = DEFAULT_HTTP_CACHE, ttl_s: float = DEFAULT_TTL_HOURS * 3600, max_bytes: Optional[int] = int(DEFAULT_MAX_MB * 1024 ** 2)) -> None:
+        self.root = root
+        self.ttl_s = ttl_s
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self._size: Optional[int] = None
+
+    def path(self, url: str) -> Path:
+        digest = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return self.root / digest[:2] / f"{digest}.z"
+
+    def get(self, url: str) -> Optional[Tuple[dict, bytes]]:
+        path = self.path(url)
+        try:
+            raw = zlib.decompress(path.read_bytes())
+            meta_line, _, body = raw.partition(b"\n")
+            meta = json.loads(meta_line)
+        except FileNotFoundError:
+            return None
+        except (OSError, zlib.error, ValueError):
+            path.unlink(missing_ok=True)
+            return None
+        if meta.get("url") != url:
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return meta, body
+
+    def put(self, url: str, body: bytes, headers: Optional[Dict[str, str]] = None, fetched: Optional[float] = None) -> None:
+        meta = {"url": url, "fetched": fetched if fetched is not None else time.time()}
+        for name in _KEPT_HEADERS:
+            if headers and headers.get(name):
+                meta[name] = headers[name]
+        data = zlib.compress(json.dumps(meta, ensure_ascii=False).encode("utf-8") + b"\n" + body, 6)
+        path = self.path(url)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_bytes(data)
+        # Stat, replace and accounting as one step, so two threads replacing the same entry can't both
+        # subtract the old size; other processes' writes are only picked up by the rescan in _evict
+        with self.lock:
+            try:
+                old = path.stat().st_size
+            except OSError:
+                old = 0
+            os.replace(tmp, path)
+            if self._size is None:
+                self._size = self._scan_size()
+            else:
+                self._size += len(data) - old
+            if self.max_bytes is not None and self._size > self.max_bytes:
+                self._evict()
+
+    def revalidated(self, url: str, meta: dict, body: bytes) -> None:
+        # 304: the stored body is current again; restart its TTL
+        self.put(url, body, meta)
+
+    def fresh(self, meta: dict) -> bool:
+        return time.time() - float(meta.get("fetched") or 0) < self.ttl_s
+
+    def _entries(self):
+        if not self.root.exists():
+            return
+        for sub in self.root.iterdir():
+            if sub.is_dir():
+                for path in sub.glob("*.z"):
+                    try:
+                        yield path, path.stat()
+                    except OSError:
+                        continue
+
+    def _scan_size(self) -> int:
+        return sum(st.st_size for _path, st in self._entries())
+
+    def _evict(self) -> None:
+        # Least recently used first, down to 90% of the bound so eviction doesn't run on every write
+        entries = sorted(self._entries(), key=lambda e: e[1].st_mtime)
+        total = sum(st.st_size for _path, st in entries)
+        target = int(self.max_bytes * 0.9)
+        for path, st in entries:
+            if total <= target:
+                break
+            path.unlink(missing_ok=True)
+            total -= st.st_size
+        self._size = total
+
+    def stats(self) -> Dict[str, int]:
+        entries = list(self._entries())
+        return {"entries": len(entries), "bytes": sum(st.st_size for _path, st in entries)}
+
+
+def cached_response(url: str, meta: dict, body: bytes) -> requests.Response:
+    resp = requests.Response()
+    resp.status_code = 200
+    resp.url = url
+    resp._content = body
+    resp.headers = CaseInsensitiveDict({name: meta[name] for name in _KEPT_HEADERS if name in meta})
+    resp.encoding = "utf-8"
+    resp.from_cache = True
+    return resp
+
+
+def cached_get(cache: Optional[HttpCache], url: str, send: Callable[[Dict[str, str]], requests.Response]) -> requests.Response:
+    # `send(headers)` performs the actual GET. Fresh entries are served without a request, stale ones
+    # are revalidated with If-None-Match / If-Modified-Since, and only 200 responses are stored
+    if cache is None:
+        resp = send({})
+        resp.from_cache = False
+        return resp
+    entry = cache.get(url)
+    headers: Dict[str, str] = {}
+    if entry is not None:
+        meta, body = entry
+        if cache.fresh(meta):
+            tracing.add(cache_hits=1)
+            return cached_response(url, meta, body)
+        if meta.get("ETag"):
+            headers["If-None-Match"] = meta["ETag"]
+        if meta.get("Last-Modified"):
+            headers["If-Modified-Since"] = meta["Last-Modified"]
+    resp = send(headers)
+    if resp.status_code == 304 and entry is not None:
+        tracing.add(cache_hits=1)
+        cache.revalidated(url, *entry)
+        return cached_response(url, *entry)
+    if resp.status_code == 200:
+        cache.put(url, resp.content, resp.headers)
+    resp.from_cache = False
+    return resp
+
+
+def add_cache_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--http-cache", type=Path, default=DEFAULT_HTTP_CACHE, help="Shared on-disk HTTP response cache (default: .gbif_cache/http)")
+    parser.add_argument("--cache-ttl", type=float, default=DEFAULT_TTL_HOURS, help=f"Hours a cached response is used without asking the server; older ones are revalidated with ETag/Last-Modified (default: {DEFAULT_TTL_HOURS:g})")
+    parser.add_argument("--cache-max-mb", type=float, default=DEFAULT_MAX_MB, help=f"Size bound of the HTTP cache, least recently used entries evicted first (default: {DEFAULT_MAX_MB:g})")
+    parser.add_argument("--no-cache", action="store_true", help="Neither read nor write the HTTP cache")
+
+
+def from_args(args: argparse.Namespace) -> Optional[HttpCache]:
+    if args.no_cache:
+        return None
+    return HttpCache(args.http_cache, ttl_s=args.cache_ttl * 3600, max_bytes=int(args.cache_max_mb * 1024 ** 2))
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Inspect or clear the shared HTTP response cache")
+    p.add_argument("--http-cache", type=Path, default=DEFAULT_HTTP_CACHE)
+    p.add_argument("--clear", action="store_true", help="Remove every entry")
+    return p.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    cache = HttpCache(args.http_cache)
+    if args.clear:
+        for path, _st in list(cache._entries()):
+            path.unlink(missing_ok=True)
+    stats = cache.stats()
+    print(f"{args.http_cache}: {stats['entries']} entries, {stats['bytes'] / 1024 ** 2:.1f} MB")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import sys
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from decimal import ROUND_HALF_UP, Decimal
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from recordedby_schemes import (DEFAULT_SYNTAX_CACHE, HAS_ID, MALFORMED, PRESETS, SCHEMES, SYNTAX_SCHEMES, VALID_MASK, classify_batch,
+                                iter_scheme_hits, malformed_batch, malformed_columns, pct_column, scheme_bit, set_syntax_cache_size, stat_headers)
+from spill_agg import SpillingAggregator
+
+
+# Counter slots per group: total, with id, valid, invalid, then one per scheme
+N_COUNTERS = 4 + len(SCHEMES)
+# With --check-syntax: any malformed, then one per checked scheme
+N_MALFORMED = 1 + len(SYNTAX_SCHEMES)
+_SYNTAX_BITS = [scheme_bit([name for name, _label, _prefixes in SCHEMES].index(name)) for name in SYNTAX_SCHEMES]
+
+
+def mask_increments(mask: int) -> List[int]:
+    inc = [0] * N_COUNTERS
+    inc[0] = 1
+    if mask & HAS_ID:
+        inc[1] = 1
+        if mask & VALID_MASK:
+            inc[2] = 1
+            for i in iter_scheme_hits(mask):
+                inc[4 + i] = 1
+        else:
+            inc[3] = 1
+    return inc
+
+
+def malformed_increments(mask: int) -> List[int]:
+    return [1 if mask & MALFORMED else 0] + [1 if mask & bit else 0 for bit in _SYNTAX_BITS]
+
+
+def format_pct(num: int, total: int) -> str:
+    # Hive computes 100.0 * SUM(...) / COUNT(*) as a decimal with 14 places, rounding half up
+    if total <= 0:
+        return format(Decimal(0).quantize(Decimal("1e-14")), "f")
+    value = (Decimal(100) * num / total).quantize(Decimal("1e-14"), rounding=ROUND_HALF_UP)
+    return format(value, "f")
+
+
+def read_header(path: Path) -> Tuple[List[str], int]:
+    with path.open("rb") as f:
+        line = f.readline()
+    columns = line.decode("utf-8").rstrip("\r\n").split("\t")
+    return columns, len(line)
+
+
+def resolve_columns(columns: Sequence[str], wanted: Sequence[str]) -> List[int]:
+    by_lower = {c.strip().lower(): i for i, c in enumerate(columns)}
+    indexes = []
+    for name in wanted:
+        idx = by_lower.get(name.lower())
+        if idx is None:
+            raise ValueError(f"Column '{name}' not found in occurrence header")
+        indexes.append(idx)
+    return indexes
+
+
+def split_ranges(path: Path, data_start: int, chunk_bytes: int) -> List[Tuple[int, int]]:
+    # Byte ranges aligned to line boundaries so each worker parses whole records only
+    size = path.stat().st_size
+    ranges: List[Tuple[int, int]] = []
+    with path.open("rb") as f:
+        start = data_start
+        while start < size:
+            end = min(start + chunk_bytes, size)
+            if end < size:
+                f.seek(end)
+                f.readline()
+                end = f.tell()
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def aggregate_range(path: str, start: int, end: int, key_idx: List[int], id_idx: int, check_syntax: bool = False) -> Dict[Tuple[str, ...], List[int]]:
+    with open(path, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+
+    keys: List[Tuple[str, ...]] = []
+    raws: List[str] = []
+    width = max(key_idx + [id_idx]) + 1
+    for line in data.decode("utf-8", errors="replace").split("\n"):
+        if not line:
+            continue
+        fields = line.rstrip("\r").split("\t", width)
+        if len(fields) < width:
+            continue
+        key = tuple(fields[i] for i in key_idx)
+        if not key[0]:
+            # WHERE <first group column> IS NOT NULL
+            continue
+        keys.append(key)
+        raws.append(fields[id_idx])
+
+    # Classify the whole recordedByID column at once, then tally distinct (key, mask) pairs
+    masks = classify_batch(raws)
+    width = N_COUNTERS
+    if check_syntax:
+        # Syntax bits ride above the scheme bits so one mask still identifies the increment row
+        shift = len(SCHEMES) + 1
+        masks = [m | (b << shift) for m, b in zip(masks, malformed_batch(raws))]
+        width += N_MALFORMED
+    groups: Dict[Tuple[str, ...], List[int]] = {}
+    increments: Dict[int, List[int]] = {}
+    for (key, mask), n in Counter(zip(keys, masks)).items():
+        inc = increments.get(mask)
+        if inc is None:
+            inc = mask_increments(mask)
+            if check_syntax:
+                inc += malformed_increments(mask >> shift)
+            increments[mask] = inc
+        counts = groups.get(key)
+        if counts is None:
+            counts = groups[key] = [0] * width
+        for i, hit in enumerate(inc):
+            if hit:
+                counts[i] += n
+    return groups
+
+
+def aggregate_stats(occurrence_path: Path, group_by: Sequence[str], workers: int, chunk_bytes: int, id_column: str = "recordedByID",
+                    check_syntax: bool = False, syntax_cache: int = DEFAULT_SYNTAX_CACHE, budget_bytes: Optional[int] = None,
+                    spill_dir: Optional[Path] = None) -> SpillingAggregator:
+    columns, data_start = read_header(occurrence_path)
+    key_idx = resolve_columns(columns, group_by)
+    id_idx = resolve_columns(columns, [id_column])[0]
+    ranges = split_ranges(occurrence_path, data_start, chunk_bytes)
+
+    # Groups beyond budget_bytes are spilled to disk partitions; without a budget everything stays in memory
+    agg = SpillingAggregator(N_COUNTERS + (N_MALFORMED if check_syntax else 0), budget_bytes, spill_dir=spill_dir)
+    if workers <= 1 or len(ranges) <= 1:
+        set_syntax_cache_size(syntax_cache)
+        for start, end in ranges:
+            agg.merge(aggregate_range(str(occurrence_path), start, end, key_idx, id_idx, check_syntax))
+        return agg
+
+    # Each worker memoizes identifiers across all the chunks it processes. Only workers + 1 chunks are in
+    # flight, so finished chunk results don't pile up in the parent while it merges
+    with ProcessPoolExecutor(max_workers=workers, initializer=set_syntax_cache_size, initargs=(syntax_cache,)) as ex:
+        pending = deque()
+        for start, end in ranges:
+            pending.append(ex.submit(aggregate_range, str(occurrence_path), start, end, key_idx, id_idx, check_syntax))
+            if len(pending) > workers:
+                agg.merge(pending.popleft().result())
+        while pending:
+            agg.merge(pending.popleft().result())
+    return agg
+
+
+def compute_stats(occurrence_path: Path, group_by: Sequence[str], workers: int, chunk_bytes: int, id_column: str = "recordedByID",
+                  check_syntax: bool = False, syntax_cache: int = DEFAULT_SYNTAX_CACHE) -> Dict[Tuple[str, ...], List[int]]:
+    return aggregate_stats(occurrence_path, group_by, workers, chunk_bytes, id_column, check_syntax, syntax_cache).groups
+
+
+def row_order(item: Tuple[Tuple[str, ...], List[int]]) -> Tuple[Decimal, Tuple[str, ...]]:
+    # ORDER BY pct_with_recordedByID DESC; ties broken by key so output is deterministic
+    key, counts = item
+    return -Decimal(counts[1]) / counts[0], key
+
+
+def iter_rows(ordered: Iterable[Tuple[Tuple[str, ...], List[int]]], url_prefix: Optional[str]) -> Iterable[List[str]]:
+    for key, counts in ordered:
+        total = counts[0]
+        row = list(key)
+        if url_prefix is not None:
+            row.append(f"{url_prefix}{key[0]}")
+        row.append(str(total))
+        for num in counts[1:]:
+            row.append(str(num))
+            row.append(format_pct(num, total))
+        yield row
+
+
+def build_rows(groups: Dict[Tuple[str, ...], List[int]], url_prefix: Optional[str]) -> List[List[str]]:
+    return list(iter_rows(sorted(groups.items(), key=row_order), url_prefix))
+
+
+def write_stats(rows: Iterable[List[str]], headers: List[str], out_path: Path, check_syntax: bool = False) -> int:
+    # Same layout as GBIF SQL_TSV_ZIP results: tab separated, unquoted, LF line endings
+    extra = [h for col in malformed_columns() for h in (col, pct_column(col))] if check_syntax else []
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    with out_path.open("w", encoding="utf-8", newline="") as f:
+        f.write("\t".join(headers + stat_headers() + extra) + "\n")
+        n = 0
+        for row in rows:
+            f.write("\t".join(row) + "\n")
+            n += 1
+    return n
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Compute recordedByID stats locally from a raw occurrence export (TSV / DwC-A occurrence.txt)")
+    p.add_argument("occurrence_file", type=Path, help="Tab-separated occurrence file with a header row")
+    p.add_argument("output_csv", type=Path, help="Where to write the stats TSV")
+    p.add_argument("--preset", choices=sorted(PRESETS), help="Reproduce one of the checked-in .sql queries")
+    p.add_argument("--group-by", help="Comma-separated occurrence columns to group by (instead of --preset)")
+    p.add_argument("--id-column", default="recordedByID", help="Column holding the pipe-delimited identifier array")
+    p.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes (default: all cores)")
+    p.add_argument("--chunk-mb", type=int, default=64, help="Bytes per worker task in MiB (default: 64)")
+    p.add_argument("--check-syntax", action="store_true", help="Also check identifier syntax (ORCID check digit, Wikidata Q-id, Scholar user id, ResearcherID) and add records_with_malformed_* columns")
+    p.add_argument("--memory-mb", type=float, help="Approximate memory for groups per process; beyond it groups are spilled to disk partitions and merged at the end (default: no limit)")
+    p.add_argument("--spill-dir", type=Path, help="Directory for spilled partitions (default: the system temp directory)")
+    p.add_argument("--syntax-cache", type=int, default=DEFAULT_SYNTAX_CACHE, help=f"Distinct identifiers memoized per worker by --check-syntax (default: {DEFAULT_SYNTAX_CACHE})")
+    return p.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    if not args.occurrence_file.exists():
+        print(f"Occurrence file not found: {args.occurrence_file}", file=sys.stderr)
+        return 2
+
+    if args.preset:
+        preset = PRESETS[args.preset]
+        group_by = list(preset["group_by"])
+        headers = list(preset["headers"])
+        url_prefix = preset["url_prefix"]
+    elif args.group_by:
+        group_by = [c.strip() for c in args.group_by.split(",") if c.strip()]
+        headers = [c.lower() for c in group_by]
+        url_prefix = None
+    else:
+        print("Provide --preset or --group-by", file=sys.stderr)
+        return 2
+
+    budget = int(args.memory_mb * 1024 * 1024) if args.memory_mb else None
+    try:
+        agg = aggregate_stats(args.occurrence_file, group_by, workers=args.workers, chunk_bytes=args.chunk_mb * 1024 * 1024, id_column=args.id_column,
+                              check_syntax=args.check_syntax, syntax_cache=args.syntax_cache, budget_bytes=budget, spill_dir=args.spill_dir)
+    except ValueError as exc:
+        print(f"Error: {exc}", file=sys.stderr)
+        return 1
+    try:
+        spills = agg.spills
+        n = write_stats(iter_rows(agg.sorted_items(row_order, args.workers), url_prefix), headers, args.output_csv, args.check_syntax)
+    finally:
+        agg.close()
+    print(f"Wrote {n} groups to {args.output_csv}" + (f" ({spills} spills to disk)" if spills else ""))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+import json
+import os
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+# Written by pipeline.py and read by the viewer (scripts/app.js) and the CLI defaults; paths are
+# relative to the repo root, which is also the web root
+DEFAULT_MANIFEST = Path("out-web/manifest.json")
+
+
+def load_manifest(path: Path = DEFAULT_MANIFEST) -> dict:
+    if not path.exists():
+        return {}
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def artifact(name: str, fallback: Path, path: Path = DEFAULT_MANIFEST) -> Path:
+    value = load_manifest(path).get("paths", {}).get(name)
+    return Path(value) if value else fallback
+
+
+def write_manifest(path: Path, paths: Dict[str, str], downloads: Optional[Dict[str, str]] = None) -> None:
+    data = {
+        "generated": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "paths": {k: Path(v).as_posix() for k, v in sorted(paths.items())},
+        "downloads": dict(sorted((downloads or {}).items())),
+    }
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(data, indent=2) + "\n", encoding="utf-8")
+    os.replace(tmp, path)
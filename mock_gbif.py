@@ -0,0 +1,573 @@
+#!/usr/bin/env python3
+import argparse
+import hashlib
+import io
+import json
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+import zipfile
+from collections import Counter
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from local_stats import format_pct
+from recordedby_schemes import PRESETS, count_columns, stat_headers
+
+
+# Roughly today's registry and result sizes; --scale multiplies the organizations while the
+# node count stays fixed, so per-node organization lists grow (and paginate) instead
+BASE_PUBLISHERS = 2500
+BASE_HOSTING_ORGS = 390
+BASE_NODES = 170
+
+_NAMESPACE = uuid.UUID("6a3c1f0e-2b7d-4c8e-9f10-5d4e3c2b1a00")
+_COUNTRIES = ["DE", "US", "GB", "FR", "NL", "SE", "DK", "BR", "AU", "ZA", "CO", "JP", "SK", "ES", "NO"]
+_ORG_TYPES = ["OTHER", "UNIVERSITY", "MUSEUM", "GOVERNMENT", "NGO"]
+_BASIS_OF_RECORD = ["PRESERVED_SPECIMEN", "HUMAN_OBSERVATION", "MACHINE_OBSERVATION", "MATERIAL_SAMPLE", "OCCURRENCE", "FOSSIL_SPECIMEN"]
+
+
+class SyntheticRegistry:
+    # Deterministic organizations, nodes and stats tables, consistent across all endpoints
+    def __init__(self, scale: float = 1.0, seed: int = 0) -> None:
+        self.n_publishers = max(1, int(BASE_PUBLISHERS * scale))
+        self.n_hosting = max(1, int(BASE_HOSTING_ORGS * scale))
+        self.n_nodes = BASE_NODES
+        self.seed = seed
+        self.org_keys = [str(uuid.uuid5(_NAMESPACE, f"org-{i}")) for i in range(self.n_publishers)]
+        self.org_index = {k: i for i, k in enumerate(self.org_keys)}
+        self.node_keys = [str(uuid.uuid5(_NAMESPACE, f"node-{j}")) for j in range(self.n_nodes)]
+        self._cells: Dict[str, list] = {}
+        self.node_index = {k: j for j, k in enumerate(self.node_keys)}
+        # Every org belongs to one node; every fourth also to a second one, like the real map
+        self.node_orgs: List[List[int]] = [[] for _ in range(self.n_nodes)]
+        for i in range(self.n_publishers):
+            first = i % self.n_nodes
+            self.node_orgs[first].append(i)
+            second = (i * 7 + 3) % self.n_nodes
+            if i % 4 == 0 and second != first:
+                self.node_orgs[second].append(i)
+
+    def organization(self, i: int) -> dict:
+        return {
+            "key": self.org_keys[i],
+            "title": f"Synthetic Organization {i}",
+            "country": _COUNTRIES[i % len(_COUNTRIES)],
+            "endorsingNodeKey": self.node_keys[i % self.n_nodes],
+            "type": _ORG_TYPES[i % len(_ORG_TYPES)],
+            "modified": "2025-01-01T00:00:00.000+00:00",
+        }
+
+    def node(self, j: int) -> dict:
+        return {"key": self.node_keys[j], "title": f"Synthetic Node {j}", "type": "COUNTRY"}
+
+    def cells(self, preset: str) -> List[Tuple[int, Optional[int], Optional[str], List[int]]]:
+        # Finer-grained (org, year, basisOfRecord, counters) partial counts; tables are sums over these,
+        # so a WHERE on year or basisOfRecord yields the partial aggregates a sharded query would get
+        cached = self._cells.get(preset)
+        if cached is not None:
+            return cached
+        n_counters = len(count_columns())
+        out = []
+        n = self.n_publishers if preset == "publisher" else self.n_hosting
+        for i in range(n):
+            rng = random.Random(f"{self.seed}-{preset}-{i}")
+            for _c in range(rng.randint(1, 6)):
+                year = None if rng.random() < 0.1 else rng.randint(1850, 2025)
+                basis = None if rng.random() < 0.05 else rng.choice(_BASIS_OF_RECORD)
+                total = rng.randint(1, 40000)
+                with_id = rng.randint(0, total)
+                valid = rng.randint(0, with_id)
+                schemes = [0] * (n_counters - 4)
+                left = valid
+                for s in range(len(schemes)):
+                    schemes[s] = rng.randint(0, left)
+                    left -= schemes[s]
+                out.append((i, year, basis, [total, with_id, valid, with_id - valid] + schemes))
+        self._cells[preset] = out
+        return out
+
+    def stats_tsv(self, preset: str, where: Optional[Callable[[dict], Optional[bool]]] = None) -> bytes:
+        # Same columns, number formatting and row order as the GBIF SQL TSV results
+        headers = list(PRESETS[preset]["headers"])
+        key_col = PRESETS[preset]["group_by"][0].lower()
+        groups: Dict[int, List[int]] = {}
+        for i, year, basis, counts in self.cells(preset):
+            if where is not None and where({key_col: self.org_keys[i], "year": year, "basisofrecord": basis}) is not True:
+                continue
+            acc = groups.get(i)
+            if acc is None:
+                groups[i] = list(counts)
+            else:
+                for c, v in enumerate(counts):
+                    acc[c] += v
+        rows = []
+        for i, counts in groups.items():
+            key = self.org_keys[i]
+            row = [key]
+            if preset == "publisher":
+                row += [f"Synthetic Organization {i}", f"{PRESETS[preset]['url_prefix']}{key}"]
+            row.append(str(counts[0]))
+            for v in counts[1:]:
+                row.append(str(v))
+                row.append(format_pct(v, counts[0]))
+            rows.append((-Decimal(counts[1]) / counts[0], row[:2 if preset == "publisher" else 1], row))
+        rows.sort(key=lambda r: (r[0], r[1]))
+        out = io.StringIO()
+        out.write("\t".join(headers + stat_headers()) + "\n")
+        for _pct, _key, row in rows:
+            out.write("\t".join(row) + "\n")
+        return out.getvalue().encode("utf-8")
+
+
+# Just enough of the WHERE clause to filter the synthetic cells: AND / OR / NOT, parentheses,
+# comparisons, IS [NOT] NULL and [NOT] IN, with SQL's three-valued logic (None = unknown)
+_WHERE_TOKEN = re.compile(r"\s*(?:('(?:[^']|'')*')|(\d+(?:\.\d+)?)|([A-Za-z_][A-Za-z0-9_]*)|(<>|!=|<=|>=|[=<>(),]))")
+_CLAUSE_END = {"GROUP", "ORDER", "HAVING", "LIMIT"}
+
+
+def _tokens(sql: str) -> List[Tuple[str, object]]:
+    out: List[Tuple[str, object]] = []
+    pos = 0
+    sql = re.sub(r"--[^\n]*|/\*.*?\*/", " ", sql, flags=re.DOTALL).rstrip().rstrip(";")
+    while pos < len(sql):
+        m = _WHERE_TOKEN.match(sql, pos)
+        if not m:
+            pos += 1
+            continue
+        pos = m.end()
+        string, number, ident, op = m.groups()
+        if string is not None:
+            out.append(("value", string[1:-1].replace("''", "'")))
+        elif number is not None:
+            out.append(("value", float(number) if "." in number else int(number)))
+        elif ident is not None:
+            out.append(("word", ident))
+        elif op is not None:
+            out.append(("op", op))
+    return out
+
+
+def _where_tokens(sql: str) -> Optional[List[Tuple[str, object]]]:
+    tokens = _tokens(sql)
+    depth = 0
+    start = None
+    for n, (kind, value) in enumerate(tokens):
+        if kind == "op" and value == "(":
+            depth += 1
+        elif kind == "op" and value == ")":
+            depth -= 1
+        elif kind == "word" and depth == 0:
+            word = str(value).upper()
+            if word == "WHERE":
+                start = n + 1
+            elif start is not None and word in _CLAUSE_END:
+                return tokens[start:n]
+    return tokens[start:] if start is not None else None
+
+
+class _Unsupported(Exception):
+    pass
+
+
+def _and(a, b):
+    if a is False or b is False:
+        return False
+    return None if a is None or b is None else True
+
+
+def _or(a, b):
+    if a is True or b is True:
+        return True
+    return None if a is None or b is None else False
+
+
+def _not(a):
+    return None if a is None else not a
+
+
+def compile_where(sql: str, columns: Sequence[str]) -> Optional[Callable[[dict], Optional[bool]]]:
+    # None means "no filter": no WHERE clause, or one using columns or syntax the mock doesn't model
+    tokens = _where_tokens(sql)
+    if not tokens:
+        return None
+    known = {c.lower() for c in columns}
+    pos = 0
+
+    def peek_word(*words: str) -> bool:
+        return pos < len(tokens) and tokens[pos][0] == "word" and str(tokens[pos][1]).upper() in words
+
+    def take(kind: str, value: Optional[str] = None):
+        nonlocal pos
+        if pos >= len(tokens) or tokens[pos][0] != kind or (value is not None and str(tokens[pos][1]).upper() != value):
+            raise _Unsupported(tokens[pos:pos + 1])
+        pos += 1
+        return tokens[pos - 1][1]
+
+    def operand():
+        nonlocal pos
+        if pos >= len(tokens):
+            raise _Unsupported("end")
+        kind, value = tokens[pos]
+        pos += 1
+        if kind == "value":
+            return lambda row, v=value: v
+        if kind == "word" and str(value).lower() in known:
+            return lambda row, c=str(value).lower(): row.get(c)
+        raise _Unsupported(value)
+
+    def predicate():
+        nonlocal pos
+        if pos < len(tokens) and tokens[pos] == ("op", "("):
+            pos += 1
+            inner = disjunction()
+            take("op", ")")
+            return inner
+        left = operand()
+        negate = False
+        if peek_word("IS"):
+            pos += 1
+            if peek_word("NOT"):
+                pos += 1
+                negate = True
+            take("word", "NULL")
+            return lambda row: (left(row) is None) != negate
+        if peek_word("NOT"):
+            pos += 1
+            negate = True
+        if peek_word("IN"):
+            pos += 1
+            take("op", "(")
+            items = [operand()]
+            while tokens[pos] == ("op", ","):
+                pos += 1
+                items.append(operand())
+            take("op", ")")
+            values = {item({}) for item in items}
+            return lambda row: None if left(row) is None else (left(row) in values) != negate
+        if negate:
+            raise _Unsupported("NOT")
+        op = take("op")
+        if op not in _COMPARE:
+            raise _Unsupported(op)
+        right = operand()
+        cmp = _COMPARE[op]
+        return lambda row: None if left(row) is None or right(row) is None else cmp(left(row), right(row))
+
+    def negation():
+        nonlocal pos
+        if peek_word("NOT"):
+            pos += 1
+            inner = negation()
+            return lambda row: _not(inner(row))
+        return predicate()
+
+    def conjunction():
+        nonlocal pos
+        terms = [negation()]
+        while peek_word("AND"):
+            pos += 1
+            terms.append(negation())
+        if len(terms) == 1:
+            return terms[0]
+
+        def run(row):
+            result = True
+            for t in terms:
+                result = _and(result, t(row))
+                if result is False:
+                    return False
+            return result
+        return run
+
+    def disjunction():
+        nonlocal pos
+        terms = [conjunction()]
+        while peek_word("OR"):
+            pos += 1
+            terms.append(conjunction())
+        if len(terms) == 1:
+            return terms[0]
+
+        def run(row):
+            result = False
+            for t in terms:
+                result = _or(result, t(row))
+                if result is True:
+                    return True
+            return result
+        return run
+
+    try:
+        where = disjunction()
+        if pos != len(tokens):
+            raise _Unsupported(tokens[pos])
+    except (_Unsupported, IndexError):
+        return None
+    return where
+
+
+_COMPARE = {
+    "=": lambda a, b: a == b,
+    "<>": lambda a, b: a != b,
+    "!=": lambda a, b: a != b,
+    "<": lambda a, b: a < b,
+    "<=": lambda a, b: a <= b,
+    ">": lambda a, b: a > b,
+    ">=": lambda a, b: a >= b,
+}
+
+
+class Job:
+    def __init__(self, key: str, preset: str, created: float, where: Optional[Callable[[dict], Optional[bool]]] = None) -> None:
+        self.key = key
+        self.preset = preset
+        self.where = where
+        self.created = created
+        self.zip_bytes: Optional[bytes] = None
+        self.lock = threading.Lock()
+
+
+class MockState:
+    def __init__(self, args: argparse.Namespace) -> None:
+        self.args = args
+        self.registry = SyntheticRegistry(args.scale, args.seed)
+        self.jobs: Dict[str, Job] = {}
+        self.lock = threading.Lock()
+        self.counter = 0
+        self.requests: Counter = Counter()
+        self.bytes_sent = 0
+        self.rng = random.Random(args.seed)
+
+    def new_job(self, sql: str) -> Job:
+        preset = "hosting" if "hostingorganizationkey" in sql.lower() and "publishingorgkey" not in sql.lower() else "publisher"
+        with self.lock:
+            self.counter += 1
+            key = f"{self.counter:07d}-{int(time.time())}"
+            job = self.jobs[key] = Job(key, preset, time.time(), compile_where(sql, ["year", "basisOfRecord", PRESETS[preset]["group_by"][0]]))
+        return job
+
+    def job_zip(self, job: Job) -> bytes:
+        with job.lock:
+            if job.zip_bytes is None:
+                buf = io.BytesIO()
+                with zipfile.ZipFile(buf, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+                    zf.writestr(f"{job.key}.csv", self.registry.stats_tsv(job.preset, job.where))
+                    if self.args.zip_extra_mb:
+                        # Incompressible filler to exercise download throughput independently of the table
+                        filler = random.Random(job.key).randbytes(int(self.args.zip_extra_mb * 1024 * 1024))
+                        zf.writestr("filler.bin", filler, compress_type=zipfile.ZIP_STORED)
+                job.zip_bytes = buf.getvalue()
+            return job.zip_bytes
+
+    def record(self, endpoint: str, sent: int) -> None:
+        with self.lock:
+            self.requests[endpoint] += 1
+            self.bytes_sent += sent
+
+    def should_fail(self, endpoint: str) -> bool:
+        if self.args.error_rate <= 0 or endpoint.startswith("__"):
+            return False
+        if self.args.error_endpoints and endpoint not in self.args.error_endpoints:
+            return False
+        with self.lock:
+            return self.rng.random() < self.args.error_rate
+
+
+def paginate(items: List[dict], query: Dict[str, List[str]]) -> dict:
+    limit = int((query.get("limit") or ["20"])[0])
+    offset = int((query.get("offset") or ["0"])[0])
+    page = items[offset:offset + limit]
+    return {"offset": offset, "limit": limit, "endOfRecords": offset + len(page) >= len(items), "count": len(items), "results": page}
+
+
+_RANGE = re.compile(r"bytes=(\d*)-(\d*)$")
+
+
+def make_handler(state: MockState):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        server_version = "MockGBIF/1"
+
+        def log_message(self, fmt, *args) -> None:
+            if state.args.verbose:
+                sys.stderr.write("%s - %s\n" % (self.address_string(), fmt % args))
+
+        def _delay(self) -> None:
+            delay = state.args.latency_ms + random.uniform(0, state.args.jitter_ms)
+            if delay > 0:
+                time.sleep(delay / 1000.0)
+
+        def _send(self, endpoint: str, code: int, body: bytes = b"", ctype: str = "application/json", headers: Optional[Dict[str, str]] = None) -> None:
+            self.send_response(code)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(body)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            if self.command != "HEAD" and body:
+                self.wfile.write(body)
+            state.record(endpoint, len(body) if self.command != "HEAD" else 0)
+
+        def _send_json(self, endpoint: str, data: object, code: int = 200) -> None:
+            body = json.dumps(data).encode("utf-8")
+            etag = '"' + hashlib.md5(body).hexdigest()[:16] + '"'
+            if self.headers.get("If-None-Match") == etag:
+                return self._send(endpoint, 304, headers={"ETag": etag})
+            self._send(endpoint, code, body, headers={"ETag": etag})
+
+        def _fault(self, endpoint: str) -> bool:
+            self._delay()
+            if state.should_fail(endpoint):
+                self._send(endpoint, 503, b'{"message":"injected failure"}')
+                return True
+            return False
+
+        def _read_body(self) -> bytes:
+            n = int(self.headers.get("Content-Length") or 0)
+            return self.rfile.read(n) if n else b""
+
+        def do_POST(self) -> None:
+            path = urlsplit(self.path).path
+            raw = self._read_body()
+            if path.endswith("/occurrence/download/request/validate"):
+                if self._fault("validate"):
+                    return
+                sql = (json.loads(raw or b"{}").get("sql") or "").strip()
+                if not re.match(r"select\b", sql, re.IGNORECASE):
+                    return self._send_json("validate", {"message": "Only SELECT queries are supported"}, 400)
+                return self._send_json("validate", {"sql": sql})
+            if path.endswith("/occurrence/download/request"):
+                if self._fault("request"):
+                    return
+                if not self.headers.get("Authorization"):
+                    return self._send("request", 401, b"Unauthorized", "text/plain")
+                job = state.new_job(json.loads(raw or b"{}").get("sql") or "")
+                return self._send("request", 201, job.key.encode(), "text/plain")
+            self._send("other", 404, b'{"message":"not found"}')
+
+        def do_HEAD(self) -> None:
+            self.do_GET()
+
+        def do_GET(self) -> None:
+            parts = urlsplit(self.path)
+            path = parts.path
+            query = parse_qs(parts.query)
+            reg = state.registry
+
+            if path == "/__stats":
+                with state.lock:
+                    data = {"requests": sum(state.requests.values()), "by_endpoint": dict(state.requests), "bytes_sent": state.bytes_sent}
+                return self._send("__stats", 200, json.dumps(data).encode())
+
+            m = re.search(r"/occurrence/download/request/([^/]+)\.zip$", path)
+            if m:
+                return self._get_zip(m.group(1))
+
+            m = re.search(r"/occurrence/download/([^/]+)$", path)
+            if m:
+                if self._fault("download_info"):
+                    return
+                job = state.jobs.get(m.group(1))
+                if job is None:
+                    return self._send("download_info", 404, b'{"message":"unknown download"}')
+                done = time.time() - job.created >= state.args.job_seconds
+                info = {"key": job.key, "status": "SUCCEEDED" if done else "RUNNING"}
+                if done:
+                    data = state.job_zip(job)
+                    info.update({"size": len(data), "checksum": hashlib.md5(data).hexdigest(), "downloadLink": f"http://{self.headers.get('Host')}{state.args.base_path}/occurrence/download/request/{job.key}.zip"})
+                return self._send_json("download_info", info)
+
+            m = re.search(r"/organization/([^/]+)$", path)
+            if m:
+                if self._fault("organization"):
+                    return
+                i = reg.org_index.get(m.group(1))
+                if i is None:
+                    return self._send("organization", 404, b'{"message":"not found"}')
+                return self._send_json("organization", reg.organization(i))
+
+            m = re.search(r"/node/([^/]+)/organization$", path)
+            if m:
+                if self._fault("node_organization"):
+                    return
+                j = reg.node_index.get(m.group(1))
+                if j is None:
+                    return self._send("node_organization", 404, b'{"message":"not found"}')
+                orgs = [reg.organization(i) for i in reg.node_orgs[j]]
+                return self._send_json("node_organization", paginate(orgs, query))
+
+            if path.endswith("/node"):
+                if self._fault("node"):
+                    return
+                return self._send_json("node", paginate([reg.node(j) for j in range(reg.n_nodes)], query))
+
+            self._send("other", 404, b'{"message":"not found"}')
+
+        def _get_zip(self, key: str) -> None:
+            if self._fault("zip"):
+                return
+            job = state.jobs.get(key)
+            if job is None or time.time() - job.created < state.args.job_seconds:
+                return self._send("zip", 404, b"not ready", "text/plain")
+            data = state.job_zip(job)
+            size = len(data)
+            rng = _RANGE.match(self.headers.get("Range") or "")
+            if rng and (rng.group(1) or rng.group(2)):
+                if rng.group(1):
+                    start = int(rng.group(1))
+                    end = min(int(rng.group(2)) if rng.group(2) else size - 1, size - 1)
+                else:
+                    start, end = max(0, size - int(rng.group(2))), size - 1
+                if start >= size or start > end:
+                    return self._send("zip", 416, b"", "application/zip", {"Content-Range": f"bytes */{size}"})
+                return self._send("zip", 206, data[start:end + 1], "application/zip", {"Accept-Ranges": "bytes", "Content-Range": f"bytes {start}-{end}/{size}"})
+            self._send("zip", 200, data, "application/zip", {"Accept-Ranges": "bytes"})
+
+    return Handler
+
+
+def make_server(args: argparse.Namespace) -> Tuple[ThreadingHTTPServer, MockState]:
+    state = MockState(args)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(state))
+    server.daemon_threads = True
+    return server, state
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Local stand-in for the GBIF API endpoints used by the scripts, serving synthetic data")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8765)
+    p.add_argument("--base-path", default="/v1", help="Path prefix the clients use (default: /v1)")
+    p.add_argument("--scale", type=float, default=1.0, help="Multiplier on today's publisher and hosting org counts (default: 1)")
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--latency-ms", type=float, default=0.0, help="Added to every response")
+    p.add_argument("--jitter-ms", type=float, default=0.0, help="Uniform random extra latency")
+    p.add_argument("--error-rate", type=float, default=0.0, help="Probability of an injected 503")
+    p.add_argument("--error-endpoints", nargs="*", default=[], help="Limit injected errors to these endpoints (validate, request, download_info, zip, organization, node, node_organization)")
+    p.add_argument("--job-seconds", type=float, default=2.0, help="Time from submission until a download succeeds (default: 2)")
+    p.add_argument("--zip-extra-mb", type=float, default=0.0, help="Incompressible filler added to every result ZIP")
+    p.add_argument("--verbose", action="store_true", help="Log every request")
+    return p.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    server, _state = make_server(args)
+    print(f"Mock GBIF API on http://{args.host}:{server.server_address[1]}{args.base_path} (scale {args.scale})", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+import argparse
+import ast
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import registry_db
+from manifest import DEFAULT_MANIFEST, write_manifest
+from stats_reader import zip_member
+
+
+REPO = Path(__file__).resolve().parent
+
+# Artifact name -> path, shared by the stages and written to the manifest
+Artifacts = Dict[str, str]
+
+
+@dataclass
+class Stage:
+    name: str
+    deps: List[str]
+    # Scripts the stage runs; they and the repo modules they import make up the stage's code version
+    code: List[str]
+    # Input files, resolved from the upstream artifacts once the deps have finished
+    inputs: Callable[[Artifacts], List[Path]]
+    run: Callable[[Artifacts, Path], Artifacts]
+    # Stages reading from GBIF have no local inputs to hash; they go stale after this many seconds
+    max_age_s: Optional[float] = None
+
+
+def sha256_file(path: Path, h: "hashlib._Hash") -> None:
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+
+
+def local_imports(name: str) -> List[str]:
+    # Repo modules imported anywhere in a script (including function-level imports), without following them
+    tree = ast.parse((REPO / name).read_text(encoding="utf-8"), filename=name)
+    modules = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            modules.update(alias.name.split(".")[0] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            modules.add(node.module.split(".")[0])
+    return sorted(f"{m}.py" for m in modules if (REPO / f"{m}.py").is_file())
+
+
+def code_files(scripts: List[str]) -> List[str]:
+    # The scripts plus every repo module they reach through imports
+    seen = set()
+    todo = list(scripts)
+    while todo:
+        name = todo.pop()
+        if name not in seen:
+            seen.add(name)
+            todo.extend(local_imports(name))
+    return sorted(seen)
+
+
+def stage_hash(stage: Stage, artifacts: Artifacts) -> str:
+    h = hashlib.sha256()
+    h.update(stage.name.encode())
+    for name in code_files(stage.code):
+        h.update(name.encode())
+        sha256_file(REPO / name, h)
+    for path in stage.inputs(artifacts):
+        h.update(path.name.encode())
+        sha256_file(path, h)
+    return h.hexdigest()
+
+
+class PipelineState:
+    # Last successful run of each stage: input hash, finish time and the artifacts it produced
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self.stages: Dict[str, dict] = {}
+        if path.exists():
+            try:
+                self.stages = json.loads(path.read_text(encoding="utf-8")).get("stages", {})
+            except (OSError, ValueError):
+                self.stages = {}
+
+    def fresh(self, stage: Stage, digest: str) -> Optional[Artifacts]:
+        entry = self.stages.get(stage.name)
+        if not entry or entry.get("hash") != digest:
+            return None
+        if stage.max_age_s is not None and time.time() - entry.get("finished", 0) > stage.max_age_s:
+            return None
+        artifacts = entry.get("artifacts", {})
+        if not all(Path(p).exists() for p in artifacts.values()):
+            return None
+        return artifacts
+
+    def record(self, stage: Stage, digest: str, artifacts: Artifacts, seconds: float) -> None:
+        with self._lock:
+            self.stages[stage.name] = {"hash": digest, "finished": time.time(), "seconds": round(seconds, 3), "artifacts": artifacts}
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_name(self.path.name + ".tmp")
+            tmp.write_text(json.dumps({"stages": self.stages}, indent=2), encoding="utf-8")
+            os.replace(tmp, self.path)
+
+
+def run_logged(cmd: List[str], log: Path) -> None:
+    log.parent.mkdir(parents=True, exist_ok=True)
+    with log.open("wb") as f:
+        rc = subprocess.call(cmd, stdout=f, stderr=subprocess.STDOUT)
+    if rc != 0:
+        raise RuntimeError(f"exit code {rc}, see {log}")
+
+
+# Stage bodies: each runs one of the existing scripts and returns the artifacts it produced
+
+def download_stage(kind: str, table_name: str, sql: Path, out_dir: Path, args: argparse.Namespace) -> Callable[[Artifacts, Path], Artifacts]:
+    def run(_artifacts: Artifacts, work: Path) -> Artifacts:
+        zip_path = work / "downloads" / f"{kind}.zip"
+        cmd = [sys.executable, str(REPO / "gbif_sql_download.py"), str(sql), "--poll", "--poll-interval", str(args.poll_interval),
+               "--max-wait", str(args.max_wait), "--download", "--output", str(zip_path), "--cache-max-age", str(args.max_age)]
+        run_logged(cmd, work / "logs" / f"download_{kind}.log")
+        # Publish the table under the download key, as the checked-in outputs are
+        with zipfile.ZipFile(zip_path) as zf:
+            member = zip_member(zf)
+            out_dir.mkdir(parents=True, exist_ok=True)
+            table = out_dir / Path(member.filename).name
+            with zf.open(member) as src, table.open("wb") as dst:
+                shutil.copyfileobj(src, dst, 1 << 20)
+        return {f"{kind}Zip": str(zip_path), table_name: str(table)}
+    return run
+
+
+def preload_stage(out_dir: Path) -> Callable[[Artifacts, Path], Artifacts]:
+    def run(_artifacts: Artifacts, work: Path) -> Artifacts:
+        registry = out_dir / registry_db.REGISTRY_NAME
+        run_logged([sys.executable, str(REPO / "preload_nodes.py"), "--out-dir", str(out_dir), "--registry", str(registry)], work / "logs" / "preload_nodes.log")
+        return {"nodesMap": str(out_dir / "nodes.json"), "nodeOrgMap": str(out_dir / "node-org-map.csv"), "registry": str(registry)}
+    return run
+
+
+def enrich_stage(out_dir: Path) -> Callable[[Artifacts, Path], Artifacts]:
+    def run(artifacts: Artifacts, work: Path) -> Artifacts:
+        src = Path(artifacts["hostingRaw"])
+        out = out_dir / f"{src.stem}-enriched.csv"
+        run_logged([sys.executable, str(REPO / "enrich_hostingorg.py"), str(src), str(out), "--registry", artifacts["registry"]], work / "logs" / "enrich_hosting.log")
+        return {"hosting": str(out)}
+    return run
+
+
+def aggregate_stage(out_csv: Path) -> Callable[[Artifacts, Path], Artifacts]:
+    def run(artifacts: Artifacts, work: Path) -> Artifacts:
+        cmd = [sys.executable, str(REPO / "aggregate_by_node.py"), "--node-org-map", artifacts["nodeOrgMap"], "--publisher-stats-tsv", artifacts["publisher"],
+               "--nodes-json", artifacts["nodesMap"], "--registry", artifacts["registry"], "--out-csv", str(out_csv)]
+        run_logged(cmd, work / "logs" / "aggregate_nodes.log")
+        return {"nodeAgg": str(out_csv)}
+    return run
+
+
+def bundle_stage(out_dir: Path) -> Callable[[Artifacts, Path], Artifacts]:
+    def run(artifacts: Artifacts, work: Path) -> Artifacts:
+        cmd = [sys.executable, str(REPO / "build_web_bundle.py"), "--publisher", artifacts["publisher"], "--hosting", artifacts["hosting"],
+               "--node", artifacts["nodeAgg"], "--nodes-json", artifacts["nodesMap"], "--datasets", artifacts["datasets"], "--out-dir", str(out_dir)]
+        run_logged(cmd, work / "logs" / "web_bundle.log")
+        produced = {"bundle": out_dir / "bundle.json", "bundleGz": out_dir / "bundle.json.gz",
+                    "searchIndex": out_dir / "search.json", "searchIndexGz": out_dir / "search.json.gz", "drilldown": out_dir / "drilldown" / "index.json"}
+        return {k: str(p) for k, p in produced.items() if p.exists()}
+    return run
+
+
+def build_stages(args: argparse.Namespace) -> List[Stage]:
+    remote_age = args.max_age * 3600
+    return [
+        Stage("download_publisher", [], ["gbif_sql_download.py"], lambda a: [args.publisher_sql],
+              download_stage("publisher", "publisher", args.publisher_sql, Path("out-recordedby_publisher"), args), max_age_s=remote_age),
+        Stage("download_hosting", [], ["gbif_sql_download.py"], lambda a: [args.hosting_sql],
+              download_stage("hosting", "hostingRaw", args.hosting_sql, Path("out-recordedby_hostingorg"), args), max_age_s=remote_age),
+        Stage("download_datasets", [], ["gbif_sql_download.py"], lambda a: [args.datasets_sql],
+              download_stage("datasets", "datasets", args.datasets_sql, Path("out-recordedby_dataset"), args), max_age_s=remote_age),
+        Stage("preload_nodes", [], ["preload_nodes.py"], lambda a: [],
+              preload_stage(Path("out-nodes")), max_age_s=remote_age),
+        # After the preload, so organizations come from the registry mirror instead of the API
+        Stage("enrich_hosting", ["download_hosting", "preload_nodes"], ["enrich_hostingorg.py"],
+              lambda a: [Path(a["hostingRaw"]), Path(a["nodeOrgMap"]), Path(a["registry"])],
+              enrich_stage(Path("out-recordedby_hostingorg"))),
+        Stage("aggregate_nodes", ["download_publisher", "preload_nodes"], ["aggregate_by_node.py"],
+              lambda a: [Path(a["publisher"]), Path(a["nodeOrgMap"]), Path(a["nodesMap"]), Path(a["registry"])],
+              aggregate_stage(Path("out-by-node/recordedby_by_node.csv"))),
+        # The per-dataset table is an input too, so a new download rewrites the drill-down shards
+        Stage("web_bundle", ["download_publisher", "enrich_hosting", "aggregate_nodes", "preload_nodes", "download_datasets"],
+              ["build_web_bundle.py"],
+              lambda a: [Path(a["publisher"]), Path(a["hosting"]), Path(a["nodeAgg"]), Path(a["nodesMap"]), Path(a["datasets"])],
+              bundle_stage(args.manifest.parent)),
+    ]
+
+
+def download_keys(artifacts: Artifacts) -> Dict[str, str]:
+    return {kind: Path(artifacts[name]).stem for kind, name in (("publisher", "publisher"), ("hosting", "hostingRaw"), ("datasets", "datasets")) if name in artifacts}
+
+
+class Runner:
+    def __init__(self, stages: List[Stage], state: PipelineState, work: Path, force: List[str], jobs: int, dry_run: bool) -> None:
+        self.stages = {s.name: s for s in stages}
+        self.order = [s.name for s in stages]
+        self.state = state
+        self.work = work
+        self.force = set(self.order) if "all" in force else set(force)
+        self.jobs = jobs
+        self.dry_run = dry_run
+        self.artifacts: Artifacts = {}
+        self.status: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def _snapshot(self) -> Artifacts:
+        with self._lock:
+            return dict(self.artifacts)
+
+    def _execute(self, stage: Stage) -> str:
+        artifacts = self._snapshot()
+        digest = stage_hash(stage, artifacts)
+        cached = None if stage.name in self.force else self.state.fresh(stage, digest)
+        if cached is not None:
+            with self._lock:
+                self.artifacts.update(cached)
+            return "skipped"
+        if self.dry_run:
+            return "would run"
+        print(f"[{stage.name}] running", flush=True)
+        start = time.perf_counter()
+        produced = stage.run(artifacts, self.work)
+        seconds = time.perf_counter() - start
+        self.state.record(stage, digest, produced, seconds)
+        with self._lock:
+            self.artifacts.update(produced)
+        print(f"[{stage.name}] done in {seconds:.1f}s", flush=True)
+        return "ran"
+
+    def _plan(self, stage: Stage) -> str:
+        # Dry run: a stage downstream of one that would run cannot be hashed yet
+        if any(self.status.get(d) == "would run" for d in stage.deps):
+            return "would run"
+        return self._execute(stage)
+
+    def run(self) -> bool:
+        pending = list(self.order)
+        running: Dict[Future, str] = {}
+        with ThreadPoolExecutor(max_workers=self.jobs) as pool:
+            while pending or running:
+                for name in list(pending):
+                    deps = self.stages[name].deps
+                    if any(self.status.get(d) in ("failed", "blocked") for d in deps):
+                        self.status[name] = "blocked"
+                        pending.remove(name)
+                    elif all(self.status.get(d) in ("ran", "skipped", "would run") for d in deps):
+                        fn = self._plan if self.dry_run else self._execute
+                        running[pool.submit(fn, self.stages[name])] = name
+                        pending.remove(name)
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    name = running.pop(fut)
+                    try:
+                        self.status[name] = fut.result()
+                    except Exception as e:
+                        self.status[name] = "failed"
+                        print(f"[{name}] failed: {e}", file=sys.stderr, flush=True)
+        return all(self.status.get(n) in ("ran", "skipped", "would run") for n in self.order)
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Run the stats pipeline as a DAG: SQL downloads, org enrichment, node preload, node aggregation, web bundle")
+    sub = p.add_subparsers(dest="command", required=True)
+    for name, help_text in (("run", "Run every stage whose inputs or code changed"), ("plan", "Show which stages would run, without running them")):
+        sp = sub.add_parser(name, help=help_text)
+        sp.add_argument("--publisher-sql", type=Path, default=Path("recordedby-by-publishingorg.sql"), help="SQL for the per-publisher table")
+        sp.add_argument("--hosting-sql", type=Path, default=Path("recordedby-by-hostingorg.sql"), help="SQL for the per-hosting-org table")
+        sp.add_argument("--datasets-sql", type=Path, default=Path("recordedby-by-dataset.sql"), help="SQL for the per-dataset table used by the drill-down")
+        sp.add_argument("--work-dir", type=Path, default=Path(".pipeline"), help="Stage state, logs and downloaded ZIPs (default: .pipeline)")
+        sp.add_argument("--manifest", type=Path, default=DEFAULT_MANIFEST, help="Artifact manifest read by the viewer; the bundle goes to the same directory (default: out-web/manifest.json)")
+        sp.add_argument("--force", nargs="*", default=[], help="Stages to rerun regardless of their hashes, or 'all'")
+        sp.add_argument("--jobs", type=int, default=4, help="Stages run concurrently (default: 4)")
+        sp.add_argument("--max-age", type=float, default=48, help="Hours before GBIF downloads and the registry preload are redone (default: 48)")
+        sp.add_argument("--poll-interval", type=int, default=30, help="Seconds between download status checks (default: 30)")
+        sp.add_argument("--max-wait", type=int, default=3600, help="Max seconds to wait for each download (default: 3600)")
+    return p.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    stages = build_stages(args)
+    unknown = [f for f in args.force if f != "all" and f not in {s.name for s in stages}]
+    if unknown:
+        print(f"Unknown stages: {', '.join(unknown)}", file=sys.stderr)
+        return 2
+
+    state = PipelineState(args.work_dir / "state.json")
+    runner = Runner(stages, state, args.work_dir, args.force, args.jobs, dry_run=args.command == "plan")
+    ok = runner.run()
+    for name in runner.order:
+        print(f"{name:<20} {runner.status.get(name, 'not run')}")
+    if not ok:
+        return 1
+    if args.command == "run":
+        write_manifest(args.manifest, {k: v for k, v in runner.artifacts.items() if not k.endswith("Zip")}, download_keys(runner.artifacts))
+        print(f"Wrote {args.manifest}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,92 +1,78 @@
 #!/usr/bin/env python3
 import argparse
 import json
+import os
 import sys
 import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Dict, List, Optional, Any
 
 import requests
+from requests.adapters import HTTPAdapter
 
+import http_cache
+import registry_db
+import tracing
+from http_cache import HttpCache, cached_get
 
-GBIF_API_BASE = "https://api.gbif.org/v1"
 
+# Overridable so the scripts can run against mock_gbif.py
+GBIF_API_BASE = os.environ.get("GBIF_API_BASE", "https://api.gbif.org/v1")
 
-def request_with_retry(url: str, headers: Optional[Dict[str, str]] = None, timeout: int = 20, retries: int = 4, backoff: float = 0.8) -> requests.Response:
+
+def make_session(pool_size: int = 8) -> requests.Session:
+    # One keep-alive pool shared by all crawl workers
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def request_with_retry(url: str, headers: Optional[Dict[str, str]] = None, timeout: int = 20, retries: int = 4, backoff: float = 0.8, session: Optional[requests.Session] = None) -> requests.Response:
     attempt = 0
+    getter = session.get if session is not None else requests.get
     while True:
         try:
-            resp = requests.get(url, headers=headers or {}, timeout=timeout)
+            resp = getter(url, headers=headers or {}, timeout=timeout)
+            tracing.add(http_calls=1)
             return resp
         except requests.RequestException:
             attempt += 1
             if attempt > retries:
                 raise
+            tracing.add(http_calls=1, retries=1)
             time.sleep(backoff * (2 ** (attempt - 1)))
 
 
-def fetch_json(url: str, etag_cache: Dict[str, str], timeout: int = 20) -> Any:
-    headers: Dict[str, str] = {}
-    if url in etag_cache and etag_cache[url]:
-        headers["If-None-Match"] = etag_cache[url]
-
-    resp = request_with_retry(url, headers=headers, timeout=timeout)
-    if resp.status_code == 304:
-        # Not modified; caller should use prior cached body (handled by caller)
-        return None
+def fetch_json(url: str, cache: Optional[HttpCache], timeout: int = 20, session: Optional[requests.Session] = None) -> Any:
+    resp = cached_get(cache, url, lambda headers: request_with_retry(url, headers=headers, timeout=timeout, session=session))
     resp.raise_for_status()
-    etag = resp.headers.get("ETag")
-    if etag:
-        etag_cache[url] = etag
+    if not resp.from_cache:
+        tracing.add(bytes=len(resp.content))
     return resp.json()
 
 
-def load_cache(cache_file: Path) -> Dict[str, Any]:
-    if cache_file.exists():
-        try:
-            return json.loads(cache_file.read_text(encoding="utf-8"))
-        except Exception:
-            return {"etag": {}, "bodies": {}}
-    return {"etag": {}, "bodies": {}}
-
-
-def save_cache(cache_file: Path, cache: Dict[str, Any]) -> None:
-    cache_file.parent.mkdir(parents=True, exist_ok=True)
-    cache_file.write_text(json.dumps(cache, ensure_ascii=False, indent=2), encoding="utf-8")
-
-
-def get_active_nodes(base: str, cache: Dict[str, Any], timeout: int) -> List[Dict[str, Any]]:
+def get_active_nodes(base: str, cache: Optional[HttpCache], timeout: int, session: Optional[requests.Session] = None) -> List[Dict[str, Any]]:
     url = f"{base}/node?limit=1000&status=ACTIVE"
-    data = fetch_json(url, cache.setdefault("etag", {}), timeout=timeout)
-    if data is None:
-        body = cache.get("bodies", {}).get(url)
-        if body is None:
-            raise RuntimeError("ETag indicated not modified, but cache body missing for nodes list")
-        data = body
+    data = fetch_json(url, cache, timeout=timeout, session=session)
     # Registry lists often return objects with 'results'; sometimes APIs return arrays. Handle both
     if isinstance(data, dict) and "results" in data:
-        results = data.get("results") or []
-    elif isinstance(data, list):
-        results = data
-    else:
-        results = []
-    cache.setdefault("bodies", {})[url] = data
-    return results
+        return data.get("results") or []
+    if isinstance(data, list):
+        return data
+    return []
 
 
-def get_node_orgs(base: str, node_key: str, cache: Dict[str, Any], timeout: int) -> List[Dict[str, Any]]:
+def get_node_orgs(base: str, node_key: str, cache: Optional[HttpCache], timeout: int, session: Optional[requests.Session] = None) -> List[Dict[str, Any]]:
     # Handle pagination defensively
     all_orgs: List[Dict[str, Any]] = []
     offset = 0
     limit = 1000
     while True:
         url = f"{base}/node/{node_key}/organization?limit={limit}&offset={offset}"
-        data = fetch_json(url, cache.setdefault("etag", {}), timeout=timeout)
-        if data is None:
-            body = cache.get("bodies", {}).get(url)
-            if body is None:
-                raise RuntimeError(f"ETag not modified but cache missing for {url}")
-            data = body
+        data = fetch_json(url, cache, timeout=timeout, session=session)
         # Results may be dict with results or array
         if isinstance(data, dict) and "results" in data:
             results = data.get("results") or []
@@ -97,7 +83,6 @@ def get_node_orgs(base: str, node_key: str, cache: Dict[str, Any], timeout: int)
         else:
             results = []
             end_of_records = True
-        cache.setdefault("bodies", {})[url] = data
 
         all_orgs.extend(results)
         if end_of_records or len(results) == 0:
@@ -138,28 +123,48 @@ def parse_args(argv=None) -> argparse.Namespace:
     p = argparse.ArgumentParser(description="Preload GBIF active nodes and endorsed organizations")
     p.add_argument("--base-url", default=GBIF_API_BASE)
     p.add_argument("--timeout", type=int, default=20)
-    p.add_argument("--cache-file", type=Path, default=Path("out-nodes/.registry_cache.json"))
     p.add_argument("--out-dir", type=Path, default=Path("out-nodes"))
-    p.add_argument("--no-cache", action="store_true", help="Ignore ETag cache and fetch fresh")
+    p.add_argument("--max-workers", type=int, default=8, help="Nodes crawled concurrently (default: 8)")
+    p.add_argument("--registry", type=Path, help="SQLite registry mirror to refresh (default: registry.sqlite in --out-dir)")
+    p.add_argument("--no-registry", action="store_true", help="Only write nodes.json and node-org-map.csv")
+    http_cache.add_cache_arguments(p)
+    tracing.add_trace_argument(p)
     return p.parse_args(argv)
 
 
 def main(argv=None) -> int:
     args = parse_args(argv)
-    cache = {"etag": {}, "bodies": {}}
-    if not args.no_cache:
-        cache = load_cache(args.cache_file)
+    if args.registry is None:
+        args.registry = args.out_dir / registry_db.REGISTRY_NAME
+    # Shared by the crawl workers; entries are per URL and written atomically
+    cache = http_cache.from_args(args)
+    session = make_session(pool_size=max(1, args.max_workers))
 
+    tracing.configure(args.trace, "preload_nodes")
     try:
-        nodes = get_active_nodes(args.base_url, cache, timeout=args.timeout)
-        node_orgs: Dict[str, List[Dict[str, Any]]] = {}
-        for n in nodes:
-            key = str(n.get("key"))
-            orgs = get_node_orgs(args.base_url, key, cache, timeout=args.timeout)
-            node_orgs[key] = orgs
-        write_outputs(nodes, node_orgs, args.out_dir)
+        with tracing.span("nodes_list"):
+            nodes = get_active_nodes(args.base_url, cache, timeout=args.timeout, session=session)
+        node_keys = [str(n.get("key")) for n in nodes]
+        with tracing.span("node_organizations", nodes=len(node_keys), workers=args.max_workers):
+            with ThreadPoolExecutor(max_workers=max(1, args.max_workers)) as ex:
+                results = ex.map(tracing.bind(lambda k: get_node_orgs(args.base_url, k, cache, timeout=args.timeout, session=session)), node_keys)
+                # Keyed by node, and write_outputs walks `nodes` in API order, so completion order doesn't matter
+                node_orgs: Dict[str, List[Dict[str, Any]]] = dict(zip(node_keys, results))
+        with tracing.span("write_outputs") as sp:
+            write_outputs(nodes, node_orgs, args.out_dir)
+            sp.add(rows=sum(len(v) for v in node_orgs.values()))
+        if not args.no_registry:
+            with tracing.span("registry_mirror") as sp:
+                conn = registry_db.connect(args.registry)
+                try:
+                    changed = registry_db.load_preload(conn, nodes, node_orgs)
+                finally:
+                    registry_db.close(conn)
+                sp.set(**changed)
+            print(f"Registry mirror {args.registry}: {changed['organizations']} organizations written, "
+                  f"{changed['nodes_changed']} nodes relinked, {changed['nodes_removed']} removed")
     finally:
-        save_cache(args.cache_file, cache)
+        tracing.finish()
 
     return 0
 
@@ -65,6 +65,3 @@ FROM occurrence
 WHERE hostingOrganizationKey IS NOT NULL
 GROUP BY hostingOrganizationKey
 ORDER BY pct_with_recordedByID DESC;
-
-
-
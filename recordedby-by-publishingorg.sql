@@ -68,4 +68,3 @@ FROM occurrence
 WHERE publishingOrgKey IS NOT NULL
 GROUP BY publishingOrgKey, publisher
 ORDER BY pct_with_recordedByID DESC;
-
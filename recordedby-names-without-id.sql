@@ -0,0 +1,7 @@
+SELECT
+  publishingOrgKey,
+  hostingOrganizationKey,
+  /* recordedBy is multi-valued; joined the same way as the viewer's "Top recordedBy names" query */
+  CONCAT_WS(' | ', recordedBy) AS recordedBy
+FROM occurrence
+WHERE recordedByID IS NULL AND recordedBy IS NOT NULL;
@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import re
+import sys
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+
+# Single source of truth for the recordedByID schemes counted as "valid".
+# Each prefix is matched as GBIF_StringArrayLike(recordedByID, '<prefix>*', FALSE).
+SCHEMES: List[Tuple[str, str, Tuple[str, ...]]] = [
+    ("orcid", "ORCID", ("https://orcid.org/", "http://orcid.org/")),
+    ("google_scholar", "Google Scholar", ("https://scholar.google.com/citations?user=", "http://scholar.google.com/citations?user=")),
+    ("researcherid", "ResearcherID", ("https://www.researcherid.com/rid/", "http://www.researcherid.com/rid/")),
+    ("wikidata", "Wikidata", ("https://www.wikidata.org/entity/", "http://www.wikidata.org/entity/")),
+    ("linkedin", "LinkedIn", ("https://www.linkedin.com/profile/view?id=", "http://www.linkedin.com/profile/view?id=")),
+]
+
+SCHEME_NAMES = [name for name, _label, _prefixes in SCHEMES]
+
+# Query shapes of the checked-in recordedby-by-*.sql files
+PRESETS: Dict[str, Dict[str, object]] = {
+    "publisher": {
+        "group_by": ["publishingOrgKey", "publisher"],
+        "headers": ["publishingorgkey", "publishername", "publisherurl"],
+        "url_prefix": "https://www.gbif.org/publisher/",
+        "select": [
+            "publishingOrgKey",
+            "/* Publisher name provided by GBIF occurrence column */",
+            "publisher AS publisherName",
+            "CONCAT('https://www.gbif.org/publisher/', publishingOrgKey) AS publisherUrl",
+        ],
+        "sql_file": "recordedby-by-publishingorg.sql",
+    },
+    "hosting": {
+        "group_by": ["hostingOrganizationKey"],
+        "headers": ["hostingorganizationkey"],
+        "url_prefix": None,
+        "select": ["hostingOrganizationKey"],
+        "sql_file": "recordedby-by-hostingorg.sql",
+    },
+    # Finest grain the viewer's drill-down uses; every publisher, hosting org and node total is a sum of these rows
+    "dataset": {
+        "group_by": ["datasetKey", "datasetName", "publishingOrgKey", "hostingOrganizationKey"],
+        "headers": ["datasetkey", "datasetname", "publishingorgkey", "hostingorganizationkey"],
+        "url_prefix": None,
+        "select": ["datasetKey", "datasetName", "publishingOrgKey", "hostingOrganizationKey"],
+        "sql_file": "recordedby-by-dataset.sql",
+    },
+}
+
+ARRAY_DELIMITER = "|"
+
+# Bit 0 flags a non-null recordedByID array, bit i+1 flags a match for SCHEMES[i]
+HAS_ID = 1
+VALID_MASK = ((1 << len(SCHEMES)) - 1) << 1
+
+
+def count_columns() -> List[str]:
+    # Counter columns of the stats tables, in output order
+    cols = [
+        "total_records",
+        "records_with_recordedbyid",
+        "records_with_valid_recordedbyid",
+        "records_with_invalid_recordedbyid",
+    ]
+    return cols + [f"records_with_{name}" for name in SCHEME_NAMES]
+
+
+def pct_column(count_column: str) -> str:
+    return {
+        "records_with_recordedbyid": "pct_with_recordedbyid",
+        "records_with_valid_recordedbyid": "pct_valid_recordedbyid",
+        "records_with_invalid_recordedbyid": "pct_invalid_recordedbyid",
+    }.get(count_column, count_column.replace("records_with_", "pct_with_", 1))
+
+
+def stat_headers() -> List[str]:
+    # Every counter but total_records is followed by its percentage of total_records
+    headers = []
+    for col in count_columns():
+        headers.append(col)
+        if col != "total_records":
+            headers.append(pct_column(col))
+    return headers
+
+
+def scheme_bit(index: int) -> int:
+    return 1 << (index + 1)
+
+
+def patterns() -> List[str]:
+    return [f"{prefix}*" for _name, _label, prefixes in SCHEMES for prefix in prefixes]
+
+
+def _trie_regex(prefixes: Sequence[Tuple[str, int]]) -> Tuple[str, List[int]]:
+    # Factor all prefixes into one trie and emit it as a regex; each terminal becomes an
+    # empty capture group whose mask also carries the bits of shorter prefixes on its path.
+    trie: Dict[str, dict] = {}
+    for prefix, bit in prefixes:
+        node = trie
+        for ch in prefix.lower():
+            node = node.setdefault(ch, {})
+        node[""] = node.get("", 0) | bit
+
+    group_masks: List[int] = []
+
+    def emit(node: Dict[str, dict], inherited: int) -> str:
+        here = inherited | node.get("", 0)
+        alts = [re.escape(ch) + emit(child, here) for ch, child in sorted(node.items()) if ch != ""]
+        if "" in node:
+            group_masks.append(here)
+            alts.append("()")
+        if len(alts) == 1:
+            return alts[0]
+        return "(?:" + "|".join(alts) + ")"
+
+    return emit(trie, 0), group_masks
+
+
+def _compile_matcher() -> Tuple["re.Pattern[str]", List[int]]:
+    prefixes = [(prefix, scheme_bit(i)) for i, (_name, _label, ps) in enumerate(SCHEMES) for prefix in ps]
+    body, group_masks = _trie_regex(prefixes)
+    # Anchor at the start of every array element, ignoring surrounding whitespace
+    pattern = re.compile(r"(?:^|\|)\s*" + body, re.IGNORECASE)
+    return pattern, group_masks
+
+
+_MATCHER, _GROUP_MASKS = _compile_matcher()
+_NON_EMPTY = re.compile(r"[^|\s]")
+
+
+def classify_value(value: Optional[str]) -> int:
+    if not value or not _NON_EMPTY.search(value):
+        return 0
+    mask = HAS_ID
+    for m in _MATCHER.finditer(value):
+        mask |= _GROUP_MASKS[m.lastindex - 1]
+    return mask
+
+
+def classify_batch(values: Sequence[str], memo: Optional[Dict[str, int]] = None) -> List[int]:
+    # recordedByID values repeat heavily (one ORCID per collector), so classify each distinct
+    # value once and map the column back through the memo.
+    if memo is None:
+        memo = {}
+    for value in set(values).difference(memo):
+        memo[value] = classify_value(value)
+    return [memo[v] for v in values]
+
+
+# Identifier syntax behind the prefix, checked by local_stats.py --check-syntax. GBIF SQL can only
+# match prefixes, so `https://orcid.org/garbage` counts as valid there; schemes without an entry
+# (LinkedIn) are not checked.
+_ORCID = re.compile(r"\d{4}-\d{4}-\d{4}-\d{3}[\dX]")
+_WIKIDATA = re.compile(r"Q[1-9]\d*")
+_SCHOLAR = re.compile(r"[A-Za-z0-9_-]{12}")
+_RESEARCHERID = re.compile(r"[A-Z]{1,3}-\d{4}-(?:19|20)\d{2}")
+
+
+def orcid_checksum_ok(orcid: str) -> bool:
+    # ISO 7064 MOD 11-2 over the 15 base digits; a check value of 10 is written as X
+    digits = orcid.replace("-", "")
+    total = 0
+    for ch in digits[:-1]:
+        total = (total + int(ch)) * 2
+    check = (12 - total % 11) % 11
+    return digits[-1] == ("X" if check == 10 else str(check))
+
+
+def _valid_orcid(ident: str) -> bool:
+    return _ORCID.fullmatch(ident) is not None and orcid_checksum_ok(ident)
+
+
+def _valid_scholar(ident: str) -> bool:
+    # citations?user=<id>, possibly followed by other query parameters
+    return _SCHOLAR.fullmatch(ident.split("&", 1)[0]) is not None
+
+
+SYNTAX: Dict[str, Callable[[str], bool]] = {
+    "orcid": _valid_orcid,
+    "google_scholar": _valid_scholar,
+    "researcherid": lambda ident: _RESEARCHERID.fullmatch(ident) is not None,
+    "wikidata": lambda ident: _WIKIDATA.fullmatch(ident) is not None,
+}
+
+SYNTAX_SCHEMES = [name for name in SCHEME_NAMES if name in SYNTAX]
+
+# Bit 0 flags any malformed identifier, bit i+1 a malformed one behind a SCHEMES[i] prefix
+MALFORMED = 1
+
+# Distinct identifiers kept by the syntax check memo, per process
+DEFAULT_SYNTAX_CACHE = 1 << 18
+
+_PREFIXES = sorted(((prefix.lower(), i) for i, (_name, _label, ps) in enumerate(SCHEMES) for prefix in ps), key=lambda p: -len(p[0]))
+
+
+def malformed_columns() -> List[str]:
+    return ["records_with_malformed_recordedbyid"] + [f"records_with_malformed_{name}" for name in SYNTAX_SCHEMES]
+
+
+def _element_malformed(element: str) -> int:
+    lowered = element.lower()
+    for prefix, i in _PREFIXES:
+        if lowered.startswith(prefix):
+            check = SYNTAX.get(SCHEMES[i][0])
+            if check is None or check(element[len(prefix):]):
+                return 0
+            return MALFORMED | scheme_bit(i)
+    return 0
+
+
+_element_cached = lru_cache(maxsize=DEFAULT_SYNTAX_CACHE)(_element_malformed)
+
+
+def set_syntax_cache_size(size: int) -> None:
+    # Also used as the ProcessPoolExecutor initializer, so every worker gets the same bound
+    global _element_cached
+    _element_cached = lru_cache(maxsize=size)(_element_malformed)
+
+
+def malformed_value(value: Optional[str]) -> int:
+    if not value:
+        return 0
+    mask = 0
+    for element in value.split(ARRAY_DELIMITER):
+        element = element.strip()
+        if element:
+            mask |= _element_cached(element)
+    return mask
+
+
+def malformed_batch(values: Sequence[str], memo: Optional[Dict[str, int]] = None) -> List[int]:
+    # Same dedup as classify_batch; identifiers shared across values are memoized by _element_cached
+    if memo is None:
+        memo = {}
+    for value in set(values).difference(memo):
+        memo[value] = malformed_value(value)
+    return [memo[v] for v in values]
+
+
+def iter_scheme_hits(mask: int) -> Iterable[int]:
+    for i in range(len(SCHEMES)):
+        if mask & scheme_bit(i):
+            yield i
+
+
+def sql_scheme_predicate(index: int) -> str:
+    _name, _label, prefixes = SCHEMES[index]
+    return " OR ".join(f"GBIF_StringArrayLike(recordedByID, '{p}*', FALSE)" for p in prefixes)
+
+
+def sql_valid_predicate(indent: str = "      ") -> str:
+    lines = [f"{indent}GBIF_StringArrayLike(recordedByID, '{p}', FALSE)" for p in patterns()]
+    return " OR\n".join(lines)
+
+
+def render_stats_sql(preset_name: str) -> str:
+    preset = PRESETS[preset_name]
+    select: List[str] = list(preset["select"])
+    group_by: List[str] = list(preset["group_by"])
+    valid = sql_valid_predicate()
+
+    cols = [
+        "COUNT(*) AS total_records",
+        "SUM(CASE WHEN recordedByID IS NOT NULL THEN 1 ELSE 0 END) AS records_with_recordedByID",
+        "100.0 * SUM(CASE WHEN recordedByID IS NOT NULL THEN 1 ELSE 0 END) / COUNT(*) AS pct_with_recordedByID",
+        f"SUM(CASE WHEN (\n{valid}\n    ) THEN 1 ELSE 0 END) AS records_with_valid_recordedByID",
+        f"100.0 * SUM(CASE WHEN (\n{valid}\n    ) THEN 1 ELSE 0 END) / COUNT(*) AS pct_valid_recordedByID",
+        f"SUM(CASE WHEN recordedByID IS NOT NULL AND NOT (\n{valid}\n    ) THEN 1 ELSE 0 END) AS records_with_invalid_recordedByID",
+        f"100.0 * SUM(CASE WHEN recordedByID IS NOT NULL AND NOT (\n{valid}\n    ) THEN 1 ELSE 0 END) / COUNT(*) AS pct_invalid_recordedByID",
+    ]
+    for i, name in enumerate(SCHEME_NAMES):
+        pred = sql_scheme_predicate(i)
+        cols.append(f"SUM(CASE WHEN {pred} THEN 1 ELSE 0 END) AS records_with_{name}")
+        cols.append(f"100.0 * SUM(CASE WHEN {pred} THEN 1 ELSE 0 END) / COUNT(*) AS pct_with_{name}")
+
+    lines = ["SELECT"]
+    for item in select:
+        # Comment lines carry no trailing comma
+        lines.append(f"  {item}" if item.startswith("/*") else f"  {item},")
+    lines.extend(f"  {c}," for c in cols[:-1])
+    lines.append(f"  {cols[-1]}")
+    lines.append("FROM occurrence")
+    lines.append(f"WHERE {group_by[0]} IS NOT NULL")
+    lines.append(f"GROUP BY {', '.join(group_by)}")
+    lines.append("ORDER BY pct_with_recordedByID DESC;")
+    return "\n".join(lines) + "\n"
+
+
+def render_js() -> str:
+    schemes = [{"name": name, "label": label, "patterns": [f"{p}*" for p in prefixes]} for name, label, prefixes in SCHEMES]
+    return (
+        "// Generated by recordedby_schemes.py; do not edit by hand.\n"
+        f"window.RECORDEDBY_SCHEMES = {json.dumps(schemes, ensure_ascii=False)};\n"
+    )
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Generate SQL queries and the viewer scheme list from the recordedByID scheme definitions")
+    p.add_argument("--sql-dir", type=Path, default=Path("."), help="Where to write recordedby-by-*.sql (default: repo root)")
+    p.add_argument("--js-out", type=Path, default=Path("scripts/recordedby_schemes.js"), help="Where to write the viewer scheme list")
+    p.add_argument("--check", action="store_true", help="Exit non-zero if generated files are out of date instead of writing them")
+    return p.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    outputs = {args.sql_dir / str(preset["sql_file"]): render_stats_sql(name) for name, preset in PRESETS.items()}
+    outputs[args.js_out] = render_js()
+
+    stale = []
+    for path, text in outputs.items():
+        current = path.read_text(encoding="utf-8") if path.exists() else None
+        if current == text:
+            continue
+        stale.append(path)
+        if not args.check:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(text, encoding="utf-8")
+            print(f"Wrote {path}")
+
+    if args.check and stale:
+        for path in stale:
+            print(f"Out of date: {path}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+import hashlib
+import sqlite3
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Local mirror of the registry: written by preload_nodes.py, read by enrich_hostingorg.py and aggregate_by_node.py
+# preload_nodes.py writes it next to nodes.json in its --out-dir; readers only use it when given --registry
+REGISTRY_NAME = "registry.sqlite"
+DEFAULT_REGISTRY = Path("out-nodes") / REGISTRY_NAME
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS nodes (
+    key TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    orgs_digest TEXT,
+    fetched REAL
+);
+CREATE TABLE IF NOT EXISTS organizations (
+    key TEXT PRIMARY KEY,
+    title TEXT,
+    country TEXT,
+    endorsing_node_key TEXT,
+    type TEXT,
+    modified TEXT,
+    fetched REAL
+);
+CREATE TABLE IF NOT EXISTS node_organizations (
+    node_key TEXT NOT NULL,
+    org_key TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (node_key, org_key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS node_organizations_org ON node_organizations (org_key);
+"""
+
+# organizations column -> registry JSON field
+ORG_COLUMNS = {
+    "title": "title",
+    "country": "country",
+    "endorsing_node_key": "endorsingNodeKey",
+    "type": "type",
+    "modified": "modified",
+}
+
+
+def connect(path: Path = DEFAULT_REGISTRY) -> sqlite3.Connection:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(path))
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def close(conn: sqlite3.Connection) -> None:
+    # Writers checkpoint and leave the mirror in rollback-journal mode: read-only connections to a WAL
+    # database create -wal/-shm files they cannot remove. Skipped while another connection is open
+    try:
+        conn.execute("PRAGMA journal_mode=DELETE")
+    except sqlite3.OperationalError:
+        pass
+    conn.close()
+
+
+def _org_row(org: Dict[str, Any], now: float) -> Tuple:
+    title = org.get("title") or org.get("name") or str(org.get("key"))
+    values = [str(org.get(field) or "") for col, field in ORG_COLUMNS.items() if col != "title"]
+    return (str(org.get("key")), title, *values, now)
+
+
+_UPSERT_ORG = f"""
+INSERT INTO organizations (key, {", ".join(ORG_COLUMNS)}, fetched) VALUES (?, {", ".join("?" for _ in ORG_COLUMNS)}, ?)
+ON CONFLICT (key) DO UPDATE SET {", ".join(f"{c} = excluded.{c}" for c in ORG_COLUMNS)}, fetched = excluded.fetched
+WHERE organizations.modified IS NOT excluded.modified OR organizations.modified = ''
+"""
+
+
+def upsert_orgs(conn: sqlite3.Connection, orgs: Iterable[Dict[str, Any]]) -> int:
+    # Rows whose `modified` stamp is unchanged are left alone; returns how many were written
+    before = conn.total_changes
+    now = time.time()
+    with conn:
+        conn.executemany(_UPSERT_ORG, (_org_row(o, now) for o in orgs if o.get("key")))
+    return conn.total_changes - before
+
+
+def load_preload(conn: sqlite3.Connection, nodes: List[Dict[str, Any]], node_orgs: Dict[str, List[Dict[str, Any]]]) -> Dict[str, int]:
+    # Incremental: organizations by `modified`, node memberships by a digest of each node's org list
+    stats = {"organizations": upsert_orgs(conn, (o for orgs in node_orgs.values() for o in orgs)), "nodes_changed": 0, "nodes_removed": 0}
+    now = time.time()
+    digests = dict(conn.execute("SELECT key, orgs_digest FROM nodes"))
+    with conn:
+        for position, n in enumerate(nodes):
+            key = str(n.get("key"))
+            title = n.get("title") or n.get("name") or key
+            org_keys = [str(o.get("key")) for o in node_orgs.get(key, [])]
+            digest = hashlib.sha1("\n".join(org_keys).encode()).hexdigest()
+            conn.execute(
+                "INSERT INTO nodes (key, title, position, orgs_digest, fetched) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET title = excluded.title, position = excluded.position, orgs_digest = excluded.orgs_digest, fetched = excluded.fetched",
+                (key, title, position, digest, now),
+            )
+            if digests.get(key) == digest:
+                continue
+            stats["nodes_changed"] += 1
+            conn.execute("DELETE FROM node_organizations WHERE node_key = ?", (key,))
+            # An org listed twice under one node keeps its first position
+            conn.executemany("INSERT OR IGNORE INTO node_organizations (node_key, org_key, position) VALUES (?, ?, ?)",
+                             ((key, org_key, i) for i, org_key in enumerate(org_keys)))
+        gone = set(digests) - {str(n.get("key")) for n in nodes}
+        for key in gone:
+            conn.execute("DELETE FROM node_organizations WHERE node_key = ?", (key,))
+            conn.execute("DELETE FROM nodes WHERE key = ?", (key,))
+        stats["nodes_removed"] = len(gone)
+    return stats
+
+
+def lookup_orgs(conn: sqlite3.Connection, keys: Iterable[str]) -> Dict[str, Dict[str, str]]:
+    # Join the wanted keys against the primary key index; returns registry JSON field names
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS wanted_orgs (key TEXT PRIMARY KEY)")
+    conn.execute("DELETE FROM wanted_orgs")
+    conn.executemany("INSERT OR IGNORE INTO wanted_orgs (key) VALUES (?)", ((k,) for k in keys))
+    cols = list(ORG_COLUMNS)
+    rows = conn.execute(f"SELECT o.key, {', '.join('o.' + c for c in cols)} FROM wanted_orgs w JOIN organizations o ON o.key = w.key")
+    return {row[0]: {ORG_COLUMNS[c]: v or "" for c, v in zip(cols, row[1:])} for row in rows}
+
+
+def node_org_map(conn: sqlite3.Connection) -> Dict[str, List[Tuple[str, str]]]:
+    # Same shape and order as rollup.read_node_org_map over the CSV written by the same preload
+    node_to_orgs: Dict[str, List[Tuple[str, str]]] = {}
+    rows = conn.execute(
+        "SELECT n.key, n.title, no.org_key FROM nodes n JOIN node_organizations no ON no.node_key = n.key ORDER BY n.position, no.position"
+    )
+    for node_key, title, org_key in rows:
+        node_to_orgs.setdefault(node_key, []).append((org_key, title))
+    return node_to_orgs
+
+
+def node_titles(conn: sqlite3.Connection) -> Dict[str, str]:
+    return dict(conn.execute("SELECT key, title FROM nodes"))
+
+
+def open_existing(path: Optional[Path]) -> Optional[sqlite3.Connection]:
+    # For writers into a mirror the preload has built (enrich_hostingorg.py's write-through); None if
+    # there is none yet. Read-only consumers use open_readonly()
+    if path is None or not path.exists():
+        return None
+    return connect(path)
+
+
+def open_readonly(path: Optional[Path]) -> Optional[sqlite3.Connection]:
+    # For processes that only read the mirror: no journal mode switch and no schema writes
+    if path is None or not path.exists():
+        return None
+    return sqlite3.connect(f"{path.resolve().as_uri()}?mode=ro", uri=True)
@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+import argparse
+import csv
+import json
+import sqlite3
+import sys
+from array import array
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import registry_db
+from recordedby_schemes import count_columns, stat_headers
+from stats_reader import RecordBatch, iter_batches, iter_records, to_int
+
+
+COUNT_COLS = count_columns()
+WIDTH = len(COUNT_COLS)
+_ZERO_ROW = array("q", [0] * WIDTH)
+
+# Grain columns recognised in the finest stats table (lowercase, as GBIF writes them)
+PUBLISHER_COL = "publishingorgkey"
+HOSTING_COL = "hostingorganizationkey"
+HOSTING_NAME_COL = "hostingorgname"
+
+
+class Level:
+    # One rollup level: interned keys plus a flat int64 accumulator of WIDTH counters per key
+    def __init__(self, name: str, key_header: str, title_header: str, with_org_count: bool = False) -> None:
+        self.name = name
+        self.key_header = key_header
+        self.title_header = title_header
+        self.with_org_count = with_org_count
+        self.index: Dict[str, int] = {}
+        self.keys: List[str] = []
+        self.titles: List[str] = []
+        self.acc = array("q")
+        self.org_count = array("q")
+
+    def intern(self, key: str, title: str = "") -> int:
+        idx = self.index.get(key)
+        if idx is None:
+            idx = self.index[key] = len(self.keys)
+            self.keys.append(key)
+            self.titles.append(title)
+            self.acc.extend(_ZERO_ROW)
+            self.org_count.append(0)
+        elif title and not self.titles[idx]:
+            self.titles[idx] = title
+        return idx
+
+    def add(self, idx: int, counts: Sequence[int]) -> None:
+        acc = self.acc
+        base = idx * WIDTH
+        for j in range(WIDTH):
+            acc[base + j] += counts[j]
+
+    def counts(self, idx: int) -> array:
+        return self.acc[idx * WIDTH:(idx + 1) * WIDTH]
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+
+def pct(num: int, total: int) -> float:
+    return (100.0 * num / total) if total > 0 else 0.0
+
+
+def read_node_org_map(path: Path) -> Dict[str, List[Tuple[str, str]]]:
+    node_to_orgs: Dict[str, List[Tuple[str, str]]] = defaultdict(list)
+    with path.open("r", encoding="utf-8", newline="") as f:
+        r = csv.DictReader(f)
+        for row in r:
+            node_key = row.get("nodeKey") or ""
+            node_title = row.get("nodeTitle") or ""
+            org_key = row.get("publishingOrgKey") or ""
+            if node_key and org_key:
+                node_to_orgs[node_key].append((org_key, node_title))
+    return node_to_orgs
+
+
+def read_org_country(path: Path) -> Dict[str, str]:
+    # Any CSV/TSV with an organization key column and a country column, e.g. the enriched hosting-org CSV
+    with path.open("r", encoding="utf-8", newline="") as f:
+        header = f.readline()
+        f.seek(0)
+        r = csv.DictReader(f, delimiter="\t" if "\t" in header else ",")
+        cols = {c.lower(): c for c in (r.fieldnames or [])}
+        key_col = next((cols[c] for c in ("organizationkey", "publishingorgkey", "hostingorganizationkey", "key") if c in cols), None)
+        country_col = next((cols[c] for c in ("country", "publishercountry") if c in cols), None)
+        if not key_col or not country_col:
+            raise ValueError(f"{path} needs an organization key column and a country column")
+        return {row[key_col]: row[country_col] for row in r if row.get(key_col) and row.get(country_col)}
+
+
+def iter_stats_rows(path: Path) -> Iterable[Dict[str, str]]:
+    # GBIF TSV (quotes are literal), the enriched CSV, or the TSV inside a result ZIP
+    return iter_records(path)
+
+
+# One input record of the rollup: publisher key, hosting org key, publisher name, hosting org name, counters
+Record = Tuple[str, str, str, str, Sequence[int]]
+
+
+def hosting_name_col(columns: Iterable[str]) -> Optional[str]:
+    # A level's title only comes from that level's own name column. enrich_hostingorg.py writes the hosting
+    # org's title as publisherName into a table without publisher keys; anywhere else publishername names
+    # the publisher, and the hosting title is left for the registry to fill
+    cols = set(columns)
+    if HOSTING_NAME_COL in cols:
+        return HOSTING_NAME_COL
+    if PUBLISHER_COL not in cols and "publishername" in cols:
+        return "publishername"
+    return None
+
+
+def rollup(
+    stats_path: Path,
+    node_to_orgs: Optional[Dict[str, List[Tuple[str, str]]]] = None,
+    node_titles: Optional[Dict[str, str]] = None,
+    org_country: Optional[Dict[str, str]] = None,
+) -> Dict[str, Level]:
+    return rollup_batches(iter_batches(stats_path), node_to_orgs, node_titles, org_country)
+
+
+def rollup_rows(
+    rows: Iterable[Dict[str, object]],
+    node_to_orgs: Optional[Dict[str, List[Tuple[str, str]]]] = None,
+    node_titles: Optional[Dict[str, str]] = None,
+    org_country: Optional[Dict[str, str]] = None,
+) -> Dict[str, Level]:
+    def records() -> Iterable[Record]:
+        for row in rows:
+            host_name = hosting_name_col(row)
+            yield (
+                str(row.get(PUBLISHER_COL) or "").strip(),
+                str(row.get(HOSTING_COL) or "").strip(),
+                str(row.get("publishername") or ""),
+                str(row.get(host_name) or "") if host_name else "",
+                [to_int(row.get(c)) for c in COUNT_COLS],
+            )
+    return _rollup(records(), node_to_orgs, node_titles, org_country)
+
+
+def rollup_batches(
+    batches: Iterable[RecordBatch],
+    node_to_orgs: Optional[Dict[str, List[Tuple[str, str]]]] = None,
+    node_titles: Optional[Dict[str, str]] = None,
+    org_country: Optional[Dict[str, str]] = None,
+) -> Dict[str, Level]:
+    def records() -> Iterable[Record]:
+        for batch in batches:
+            counts = list(zip(*(batch.column(c) for c in COUNT_COLS)))
+            pubs = [k.strip() for k in batch.column(PUBLISHER_COL)]
+            hosts = [k.strip() for k in batch.column(HOSTING_COL)]
+            host_name = hosting_name_col(batch.columns)
+            host_names = batch.column(host_name) if host_name else [""] * len(batch)
+            yield from zip(pubs, hosts, batch.column("publishername"), host_names, counts)
+    return _rollup(records(), node_to_orgs, node_titles, org_country)
+
+
+def _rollup(
+    records: Iterable[Record],
+    node_to_orgs: Optional[Dict[str, List[Tuple[str, str]]]],
+    node_titles: Optional[Dict[str, str]],
+    org_country: Optional[Dict[str, str]],
+) -> Dict[str, Level]:
+    publisher = Level("publisher", "publishingOrgKey", "publisherName")
+    hosting = Level("hostingorg", "hostingOrganizationKey", "publisherName")
+    node = Level("node", "nodeKey", "nodeTitle", with_org_count=True)
+    country = Level("country", "country", "country", with_org_count=True)
+    total = Level("global", "scope", "title", with_org_count=True)
+    g = total.intern("global", "All GBIF")
+
+    # Nodes keep the order of the node-org map; each org may roll into several nodes
+    org_nodes: Dict[str, List[int]] = defaultdict(list)
+    for node_key, orgs in (node_to_orgs or {}).items():
+        title = (node_titles or {}).get(node_key) or (orgs[0][1] if orgs else node_key)
+        n = node.intern(node_key, title)
+        for org_key, _node_title in orgs:
+            org_nodes[org_key].append(n)
+    org_country = org_country or {}
+
+    has_publisher = has_hosting = False
+    for pub_key, host_key, pub_name, host_name, counts in records:
+        if pub_key:
+            has_publisher = True
+            publisher.add(publisher.intern(pub_key, pub_name), counts)
+            for n in org_nodes.get(pub_key, ()):
+                node.add(n, counts)
+            c = org_country.get(pub_key)
+            if c:
+                country.add(country.intern(c, c), counts)
+        if host_key:
+            has_hosting = True
+            hosting.add(hosting.intern(host_key, host_name), counts)
+        total.add(g, counts)
+
+    # orgCount: organizations of each parent that appear in the stats
+    for node_key, orgs in (node_to_orgs or {}).items():
+        n = node.index[node_key]
+        node.org_count[n] = sum(1 for org_key, _t in orgs if org_key in publisher.index)
+    for org_key in publisher.keys:
+        c = org_country.get(org_key)
+        if c:
+            country.org_count[country.index[c]] += 1
+    total.org_count[g] = len(publisher)
+
+    levels = {"global": total}
+    if has_publisher:
+        levels["publisher"] = publisher
+        if node_to_orgs:
+            levels["node"] = node
+        if org_country:
+            levels["country"] = country
+    if has_hosting:
+        levels["hostingorg"] = hosting
+    return levels
+
+
+def write_level(level: Level, out_csv: Path) -> None:
+    out_csv.parent.mkdir(parents=True, exist_ok=True)
+    with out_csv.open("w", encoding="utf-8", newline="") as f:
+        w = csv.writer(f)
+        headers = [level.key_header, level.title_header] if level.title_header != level.key_header else [level.key_header]
+        headers += stat_headers()
+        if level.with_org_count:
+            headers.append("orgCount")
+        w.writerow(headers)
+
+        for idx, key in enumerate(level.keys):
+            counts = level.counts(idx)
+            row: List[object] = [key] if level.title_header == level.key_header else [key, level.titles[idx] or key]
+            # Percentages are derived from the summed counters only at the very end
+            total = counts[0]
+            row.append(total)
+            for j in range(1, WIDTH):
+                row.append(counts[j])
+                row.append(pct(counts[j], total))
+            if level.with_org_count:
+                row.append(level.org_count[idx])
+            w.writerow(row)
+
+
+def fill_org_titles(levels: Dict[str, Level], conn: sqlite3.Connection) -> int:
+    # Organizations whose stats table carried no name of their own get the registry title
+    filled = 0
+    for name in ("publisher", "hostingorg"):
+        level = levels.get(name)
+        if level is None:
+            continue
+        missing = [key for key, title in zip(level.keys, level.titles) if not title]
+        for key, org in registry_db.lookup_orgs(conn, missing).items():
+            if org.get("title"):
+                level.titles[level.index[key]] = org["title"]
+                filled += 1
+    return filled
+
+
+def load_node_titles(nodes_json_path: Optional[Path]) -> Dict[str, str]:
+    if not nodes_json_path or not nodes_json_path.exists():
+        return {}
+    nodes = json.loads(nodes_json_path.read_text(encoding="utf-8"))
+    return {str(n.get("nodeKey")): n.get("nodeTitle") for n in nodes}
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Roll one finest-grain stats table up to publisher, hosting org, node, country and global levels")
+    p.add_argument("stats", type=Path, help="Stats TSV/CSV (or the downloaded result ZIP) with publishingorgkey and/or hostingorganizationkey plus count columns")
+    p.add_argument("--node-org-map", type=Path, default=Path("out-nodes/node-org-map.csv"), help="Node to organization mapping CSV")
+    p.add_argument("--nodes-json", type=Path, default=Path("out-nodes/nodes.json"), help="Nodes JSON for node titles")
+    p.add_argument("--org-country", type=Path, help="CSV/TSV mapping organization keys to countries")
+    p.add_argument("--registry", type=Path, help="SQLite registry mirror from preload_nodes.py; fills publisher and hosting org titles the stats table has no name column for")
+    p.add_argument("--out-dir", type=Path, default=Path("out-rollup"), help="Directory for recordedby_by_<level>.csv files")
+    return p.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    node_to_orgs = read_node_org_map(args.node_org_map) if args.node_org_map.exists() else None
+    org_country = read_org_country(args.org_country) if args.org_country else None
+    levels = rollup(args.stats, node_to_orgs, load_node_titles(args.nodes_json), org_country)
+    conn = registry_db.open_readonly(args.registry)
+    if args.registry is not None and conn is None:
+        print(f"Registry mirror not found: {args.registry}", file=sys.stderr)
+        return 2
+    if conn is not None:
+        try:
+            print(f"Filled {fill_org_titles(levels, conn)} organization titles from {args.registry}")
+        finally:
+            conn.close()
+    for name, level in levels.items():
+        out_csv = args.out_dir / f"recordedby_by_{name}.csv"
+        write_level(level, out_csv)
+        print(f"Wrote {len(level)} rows to {out_csv}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -3,17 +3,62 @@
 // Copied from web/app.js with paths adjusted for root-based hosting
 (function () {
   const PATHS = {
-    // relative to repo root
+    // relative to repo root; pipeline.py writes the current ones to the manifest, these are the fallback
+    manifest: "out-web/manifest.json",
     publisher: "out-recordedby_publisher/0052593-251009101135966.csv",
     hosting: "out-recordedby_hostingorg/0051475-251009101135966-enriched.csv",
     nodeAgg: "out-by-node/recordedby_by_node.csv",
     nodesMap: "out-nodes/nodes.json",
+    // compact bundle written by build_web_bundle.py; the CSVs above are the fallback
+    bundle: "out-web/bundle.json",
+    bundleGz: "out-web/bundle.json.gz",
+    searchIndex: "out-web/search.json",
+    searchIndexGz: "out-web/search.json.gz",
+    searchWorker: "scripts/search_worker.js",
+    // per-entity shards written by top_names.py: <dir>/<tab>/<key>.json
+    topNames: "out-topnames",
+    // drill-down shards written by build_web_bundle.py; the index names <tab>/<bucket>.<hash>.json next to it
+    drilldown: "out-web/drilldown/index.json",
+  };
+
+  // Longer GBIF links are refused by some browsers and servers; the SQL is shown for copying instead
+  const MAX_URL_LENGTH = 8000;
+
+  // Must match .list-item height in scripts/styles.css
+  const ROW_HEIGHT = 44;
+  const OVERSCAN = 8;
+  const SEARCH_DEBOUNCE_MS = 120;
+
+  // Counter columns of the stats tables; the bundle carries its own copy
+  const DEFAULT_COUNT_COLUMNS = [
+    "total_records",
+    "records_with_recordedbyid",
+    "records_with_valid_recordedbyid",
+    "records_with_invalid_recordedbyid",
+    "records_with_orcid",
+    "records_with_google_scholar",
+    "records_with_researcherid",
+    "records_with_wikidata",
+    "records_with_linkedin",
+  ];
+
+  // Key and name columns per tab (lowercased headers), shared with build_web_bundle.py
+  const TAB_FIELDS = {
+    publisher: { key: "publishingorgkey", name: "publishername", extra: [] },
+    hosting: { key: "hostingorganizationkey", name: "publishername", extra: [] },
+    node: { key: "nodekey", name: "nodetitle", extra: ["orgCount"] },
   };
 
   const STATE = {
     activeTab: "publisher",
-    data: { publisher: [], hosting: [] },
+    data: {},
+    countColumns: DEFAULT_COUNT_COLUMNS,
+    nodeOrgs: new Map(),
     filtered: [],
+    windowStart: -1,
+    scrollFrame: 0,
+    search: { id: 0, tab: null, matches: null, timer: 0 },
+    worker: null,
     selection: null,
     chart: null,
   };
@@ -25,8 +70,11 @@
     search: document.getElementById("search-input"),
     sort: document.getElementById("sort-select"),
     list: document.getElementById("entity-list"),
+    spacer: null,
     canvas: document.getElementById("pie-canvas"),
     meta: document.getElementById("detail-meta"),
+    topNames: document.getElementById("top-names"),
+    drilldown: document.getElementById("drilldown"),
     btnInvalid: document.getElementById("btn-invalid"),
     btnValid: document.getElementById("btn-valid"),
     btnMissing: document.getElementById("btn-missing"),
@@ -40,159 +88,309 @@
     return Number.isFinite(n) ? n : 0;
   }
 
-  function normalizeRowPublisher(row) {
-    return {
-      key: row.publishingorgkey || row["publishingorgkey"],
-      name: row.publishername || row["publishername"],
-      url: row.publisherurl || row["publisherurl"],
-      total_records: parseNumber(row.total_records || row["total_records"]),
-      records_with_recordedbyid: parseNumber(row.records_with_recordedbyid || row["records_with_recordedbyid"]),
-      pct_with_recordedbyid: parseNumber(row.pct_with_recordedbyid || row["pct_with_recordedbyid"]),
-      records_with_valid_recordedbyid: parseNumber(row.records_with_valid_recordedbyid || row["records_with_valid_recordedbyid"]),
-      pct_valid_recordedbyid: parseNumber(row.pct_valid_recordedbyid || row["pct_valid_recordedbyid"]),
-      records_with_invalid_recordedbyid: parseNumber(row.records_with_invalid_recordedbyid || row["records_with_invalid_recordedbyid"]),
-      pct_invalid_recordedbyid: parseNumber(row.pct_invalid_recordedbyid || row["pct_invalid_recordedbyid"]),
-      records_with_orcid: parseNumber(row.records_with_orcid || row["records_with_orcid"]),
-      pct_with_orcid: parseNumber(row.pct_with_orcid || row["pct_with_orcid"]),
-      records_with_google_scholar: parseNumber(row.records_with_google_scholar || row["records_with_google_scholar"]),
-      pct_with_google_scholar: parseNumber(row.pct_with_google_scholar || row["pct_with_google_scholar"]),
-      records_with_researcherid: parseNumber(row.records_with_researcherid || row["records_with_researcherid"]),
-      pct_with_researcherid: parseNumber(row.pct_with_researcherid || row["pct_with_researcherid"]),
-      records_with_wikidata: parseNumber(row.records_with_wikidata || row["records_with_wikidata"]),
-      pct_with_wikidata: parseNumber(row.pct_with_wikidata || row["pct_with_wikidata"]),
-      records_with_linkedin: parseNumber(row.records_with_linkedin || row["records_with_linkedin"]),
-      pct_with_linkedin: parseNumber(row.pct_with_linkedin || row["pct_with_linkedin"]),
-    };
+  function pctColumn(col) {
+    if (col === "records_with_recordedbyid") return "pct_with_recordedbyid";
+    if (col === "records_with_valid_recordedbyid") return "pct_valid_recordedbyid";
+    if (col === "records_with_invalid_recordedbyid") return "pct_invalid_recordedbyid";
+    return col.replace("records_with_", "pct_with_");
   }
 
-  function normalizeRowHosting(row) {
+  // A tab is columnar: parallel key/name arrays, one Float64Array per counter and
+  // index permutations per sort option (precomputed by the bundle, lazily otherwise)
+  function makeTab(kind, keys, names, cols) {
     return {
-      key: row.hostingorganizationkey || row["hostingorganizationkey"],
-      name: row.publisherName || row["publisherName"] || row.publishername || row["publishername"] || row.hostingorganizationkey,
-      url: row.publisherUrl || row["publisherUrl"] || (row.hostingorganizationkey ? `https://www.gbif.org/publisher/${row.hostingorganizationkey}` : ""),
-      total_records: parseNumber(row.total_records || row["total_records"]),
-      records_with_recordedbyid: parseNumber(row.records_with_recordedbyid || row["records_with_recordedbyid"]),
-      pct_with_recordedbyid: parseNumber(row.pct_with_recordedbyid || row["pct_with_recordedbyid"]),
-      records_with_valid_recordedbyid: parseNumber(row.records_with_valid_recordedbyid || row["records_with_valid_recordedbyid"]),
-      pct_valid_recordedbyid: parseNumber(row.pct_valid_recordedbyid || row["pct_valid_recordedbyid"]),
-      records_with_invalid_recordedbyid: parseNumber(row.records_with_invalid_recordedbyid || row["records_with_invalid_recordedbyid"]),
-      pct_invalid_recordedbyid: parseNumber(row.pct_invalid_recordedbyid || row["pct_invalid_recordedbyid"]),
-      records_with_orcid: parseNumber(row.records_with_orcid || row["records_with_orcid"]),
-      pct_with_orcid: parseNumber(row.pct_with_orcid || row["pct_with_orcid"]),
-      records_with_google_scholar: parseNumber(row.records_with_google_scholar || row["records_with_google_scholar"]),
-      pct_with_google_scholar: parseNumber(row.pct_with_google_scholar || row["pct_with_google_scholar"]),
-      records_with_researcherid: parseNumber(row.records_with_researcherid || row["records_with_researcherid"]),
-      pct_with_researcherid: parseNumber(row.pct_with_researcherid || row["pct_with_researcherid"]),
-      records_with_wikidata: parseNumber(row.records_with_wikidata || row["records_with_wikidata"]),
-      pct_with_wikidata: parseNumber(row.pct_with_wikidata || row["pct_with_wikidata"]),
-      records_with_linkedin: parseNumber(row.records_with_linkedin || row["records_with_linkedin"]),
-      pct_with_linkedin: parseNumber(row.pct_with_linkedin || row["pct_with_linkedin"]),
+      kind,
+      n: keys.length,
+      keys,
+      names,
+      lowerNames: names.map(s => (s || "").toLowerCase()),
+      keyIndex: new Map(keys.map((k, i) => [k, i])),
+      cols,
+      order: {},
     };
   }
 
-  function normalizeRowNode(row) {
-    return {
-      key: row.nodeKey || row["nodeKey"],
-      name: row.nodeTitle || row["nodeTitle"],
-      total_records: parseNumber(row.total_records || row["total_records"]),
-      records_with_recordedbyid: parseNumber(row.records_with_recordedbyid || row["records_with_recordedbyid"]),
-      pct_with_recordedbyid: parseNumber(row.pct_with_recordedbyid || row["pct_with_recordedbyid"]),
-      records_with_valid_recordedbyid: parseNumber(row.records_with_valid_recordedbyid || row["records_with_valid_recordedbyid"]),
-      pct_valid_recordedbyid: parseNumber(row.pct_valid_recordedbyid || row["pct_valid_recordedbyid"]),
-      records_with_invalid_recordedbyid: parseNumber(row.records_with_invalid_recordedbyid || row["records_with_invalid_recordedbyid"]),
-      pct_invalid_recordedbyid: parseNumber(row.pct_invalid_recordedbyid || row["pct_invalid_recordedbyid"]),
-      records_with_orcid: parseNumber(row.records_with_orcid || row["records_with_orcid"]),
-      pct_with_orcid: parseNumber(row.pct_with_orcid || row["pct_with_orcid"]),
-      records_with_google_scholar: parseNumber(row.records_with_google_scholar || row["records_with_google_scholar"]),
-      pct_with_google_scholar: parseNumber(row.pct_with_google_scholar || row["pct_with_google_scholar"]),
-      records_with_researcherid: parseNumber(row.records_with_researcherid || row["records_with_researcherid"]),
-      pct_with_researcherid: parseNumber(row.pct_with_researcherid || row["pct_with_researcherid"]),
-      records_with_wikidata: parseNumber(row.records_with_wikidata || row["records_with_wikidata"]),
-      pct_with_wikidata: parseNumber(row.pct_with_wikidata || row["pct_with_wikidata"]),
-      records_with_linkedin: parseNumber(row.records_with_linkedin || row["records_with_linkedin"]),
-      pct_with_linkedin: parseNumber(row.pct_with_linkedin || row["pct_with_linkedin"]),
-      orgCount: parseNumber(row.orgCount || row["orgCount"]),
-    };
+  function tabFromBundle(kind, src, strings) {
+    const cols = {};
+    Object.keys(src.cols).forEach(c => { cols[c] = Float64Array.from(src.cols[c]); });
+    const tab = makeTab(kind, src.key.map(i => strings[i]), src.name.map(i => strings[i]), cols);
+    Object.keys(src.order || {}).forEach(opt => { tab.order[opt] = Uint32Array.from(src.order[opt]); });
+    return tab;
   }
 
-  function toDisplayRows(kind) {
-    const src = STATE.data[kind] || [];
-    const rows = src.map(r => ({ ...r }));
-    return rows;
+  function tabFromCsvRows(kind, rows) {
+    const fields = TAB_FIELDS[kind];
+    const numeric = STATE.countColumns.concat(fields.extra);
+    const keep = rows.filter(r => r[fields.key]);
+    const cols = {};
+    numeric.forEach(c => {
+      const lc = c.toLowerCase();
+      cols[c] = Float64Array.from(keep, r => parseNumber(r[lc]));
+    });
+    const keys = keep.map(r => r[fields.key]);
+    const names = keep.map(r => r[fields.name] || r[fields.key]);
+    return makeTab(kind, keys, names, cols);
+  }
+
+  function pctOf(tab, col, i) {
+    const total = tab.cols.total_records[i];
+    return total > 0 ? (100 * tab.cols[col][i]) / total : 0;
   }
 
-  function sortRows(rows, sortKey, dir) {
+  function rowAt(tab, i) {
+    const row = { key: tab.keys[i], name: tab.names[i] };
+    if (tab.kind !== "node") row.url = `https://www.gbif.org/publisher/${row.key}`;
+    Object.keys(tab.cols).forEach(c => {
+      row[c] = tab.cols[c][i];
+      if (c !== "total_records" && c !== "orgCount") row[pctColumn(c)] = pctOf(tab, c, i);
+    });
+    return row;
+  }
+
+  function sortOrder(tab, option) {
+    if (tab.order[option]) return tab.order[option];
+    // Same ordering as build_web_bundle.sort_orders: primary column, ties by valid desc, then total desc
+    const [sortKey, dir] = option.split("-");
     const mul = dir === "asc" ? 1 : -1;
-    rows.sort((a, b) => {
-      const av = parseNumber(a[sortKey]);
-      const bv = parseNumber(b[sortKey]);
-      if (av === bv) {
-        const a2 = parseNumber(a.records_with_valid_recordedbyid);
-        const b2 = parseNumber(b.records_with_valid_recordedbyid);
-        if (a2 === b2) {
-          const a3 = parseNumber(a.total_records);
-          const b3 = parseNumber(b.total_records);
-          return b3 - a3;
-        }
-        return b2 - a2;
-      }
-      return (av - bv) * mul;
+    const total = tab.cols.total_records;
+    const valid = tab.cols.records_with_valid_recordedbyid;
+    const primary = sortKey === "pct_valid_recordedbyid"
+      ? Float64Array.from({ length: tab.n }, (_, i) => pctOf(tab, "records_with_valid_recordedbyid", i))
+      : tab.cols[sortKey];
+    const idx = Array.from({ length: tab.n }, (_, i) => i);
+    idx.sort((a, b) => {
+      if (primary[a] !== primary[b]) return (primary[a] - primary[b]) * mul;
+      if (valid[a] !== valid[b]) return valid[b] - valid[a];
+      return total[b] - total[a];
     });
+    tab.order[option] = Uint32Array.from(idx);
+    return tab.order[option];
   }
 
-  function renderList() {
-    const query = (els.search.value || "").toLowerCase();
-    const [sortKey, sortDir] = (els.sort.value || "pct_valid_recordedbyid-desc").split("-");
-    const rows = toDisplayRows(STATE.activeTab).filter(r => !query || (r.name || "").toLowerCase().includes(query));
-    sortRows(rows, sortKey, sortDir);
-    STATE.filtered = rows;
+  function filterOrder(tab, order, matches) {
+    if (!matches) return order;
+    const mark = new Uint8Array(tab.n);
+    for (let k = 0; k < matches.length; k++) mark[matches[k]] = 1;
+    return order.filter(i => mark[i]);
+  }
 
-    els.list.innerHTML = "";
-    rows.forEach((r, idx) => {
-      const item = document.createElement("div");
-      item.className = "list-item" + (STATE.selection && STATE.selection.key === r.key ? " active" : "");
-      item.setAttribute("role", "button");
-      item.setAttribute("tabindex", "0");
-      item.addEventListener("click", () => selectRow(r));
-      item.addEventListener("keydown", (ev) => { if (ev.key === "Enter" || ev.key === " ") { ev.preventDefault(); selectRow(r); } });
-
-      const title = document.createElement("div");
-      title.className = "item-title";
-      title.textContent = r.name || r.key || `Item ${idx+1}`;
-
-      const pct = document.createElement("div");
-      pct.className = "pill accent";
-      pct.textContent = `${(parseNumber(r.pct_valid_recordedbyid)).toFixed(2)}% valid`;
-
-      const counts = document.createElement("div");
-      counts.className = "pill";
-      counts.textContent = `${r.records_with_valid_recordedbyid} / ${r.total_records}`;
-
-      const invalidCount = parseNumber(r.records_with_invalid_recordedbyid);
-      const invalid = document.createElement("div");
-      invalid.className = "pill danger";
-      invalid.textContent = `${invalidCount} invalid`;
-
-      item.appendChild(title);
-      item.appendChild(pct);
-      item.appendChild(counts);
-      if (invalidCount > 0) item.appendChild(invalid);
-      els.list.appendChild(item);
-    });
+  // Recompute the visible row ids (sort order restricted to the current search matches)
+  function renderList() {
+    const tab = STATE.data[STATE.activeTab];
+    if (!tab) return;
+    const order = sortOrder(tab, els.sort.value || "pct_valid_recordedbyid-desc");
+    const matches = STATE.search.tab === tab.kind ? STATE.search.matches : null;
+    STATE.filtered = filterOrder(tab, order, matches);
+    els.spacer.style.height = `${STATE.filtered.length * ROW_HEIGHT}px`;
+    STATE.windowStart = -1;
+    renderWindow();
+
+    if (!STATE.selection && STATE.filtered.length) {
+      selectRow(tab, STATE.filtered[0]);
+    }
+  }
 
-    if (!STATE.selection && rows.length) {
-      selectRow(rows[0]);
+  // Only the rows inside the scroll viewport (plus a small overscan) exist in the DOM
+  function renderWindow(force = true) {
+    const tab = STATE.data[STATE.activeTab];
+    if (!tab) return;
+    const rows = STATE.filtered;
+    const first = Math.max(0, Math.floor(els.list.scrollTop / ROW_HEIGHT) - OVERSCAN);
+    const count = Math.ceil(els.list.clientHeight / ROW_HEIGHT) + 2 * OVERSCAN;
+    if (!force && first === STATE.windowStart) return;
+    STATE.windowStart = first;
+
+    const total = tab.cols.total_records;
+    const valid = tab.cols.records_with_valid_recordedbyid;
+    const invalidCol = tab.cols.records_with_invalid_recordedbyid;
+    const selectedKey = STATE.selection ? STATE.selection.key : null;
+    const html = [];
+    for (let k = first; k < Math.min(rows.length, first + count); k++) {
+      const i = rows[k];
+      const key = tab.keys[i];
+      const invalidCount = invalidCol[i];
+      html.push(
+        `<div class="list-item${key === selectedKey ? " active" : ""}" role="button" tabindex="0" ` +
+        `data-key="${escapeHtml(key)}" style="top:${k * ROW_HEIGHT}px">` +
+        `<div class="item-title">${escapeHtml(tab.names[i] || key || `Item ${k + 1}`)}</div>` +
+        `<div class="pill accent">${pctOf(tab, "records_with_valid_recordedbyid", i).toFixed(2)}% valid</div>` +
+        `<div class="pill">${valid[i]} / ${total[i]}</div>` +
+        (invalidCount > 0 ? `<div class="pill danger">${invalidCount} invalid</div>` : "") +
+        `</div>`
+      );
     }
+    els.spacer.innerHTML = html.join("");
   }
 
-  function selectRow(row) {
+  function selectRow(tab, i) {
+    const row = rowAt(tab, i);
     STATE.selection = row;
-    Array.from(els.list.children).forEach((el) => el.classList.remove("active"));
-    const match = Array.from(els.list.children).find(el => (el.querySelector(".item-title")?.textContent || "") === (row.name || row.key));
-    if (match) match.classList.add("active");
+    els.spacer.querySelectorAll(".list-item").forEach((el) => el.classList.toggle("active", el.dataset.key === row.key));
 
     renderChart(row);
     renderMeta(row);
+    loadTopNames(STATE.activeTab, row.key);
+    loadDrilldown(STATE.activeTab, row.key);
+  }
+
+  // Fetched shards by "<tab>/<key>"; null marks a shard that does not exist
+  const TOP_NAMES = new Map();
+
+  async function loadTopNames(kind, key) {
+    if (!els.topNames) return;
+    const id = `${kind}/${key}`;
+    els.topNames.dataset.id = id;
+    if (!TOP_NAMES.has(id)) {
+      els.topNames.innerHTML = "";
+      let shard = null;
+      try {
+        const res = await fetch(`${PATHS.topNames}/${encodeURIComponent(kind)}/${encodeURIComponent(key)}.json`);
+        if (res.ok) shard = await res.json();
+      } catch (e) {
+        // no shards published; the SQL link stays the way to get names
+      }
+      TOP_NAMES.set(id, shard);
+    }
+    // Selection may have moved on while the shard was loading
+    if (els.topNames.dataset.id === id) renderTopNames(TOP_NAMES.get(id));
+  }
+
+  function renderTopNames(shard) {
+    if (!shard || !shard.names || !shard.names.length) {
+      els.topNames.innerHTML = "";
+      return;
+    }
+    const items = shard.names.map(n =>
+      // Count first so it floats right of the ellipsized name
+      `<li><span class="count" title="${n.error ? `may be high by up to ${n.error.toLocaleString()}` : "exact"}">` +
+      `${n.count.toLocaleString()}${n.error ? ` −${n.error.toLocaleString()}` : ""}${n.guaranteed ? "" : " ?"}</span>` +
+      `<span class="name">${escapeHtml(n.name)}</span></li>`
+    ).join("");
+    els.topNames.innerHTML =
+      `<h3>Top recordedBy names without ID</h3>` +
+      `<p class="muted">${shard.records.toLocaleString()} records. Counts are upper bounds, high by at most ${shard.maxError.toLocaleString()}; "?" marks names not certain to be in the top ${shard.names.length}.</p>` +
+      `<ol>${items}</ol>`;
+  }
+
+  // Index promise, and shard promises by path; hashed shard names never go stale, so both live for the session
+  const DRILLDOWN = { index: null, shards: new Map() };
+
+  function bucketOf(key, prefix) {
+    // Must match drilldown.bucket_of
+    const bucket = String(key).slice(0, prefix).toLowerCase();
+    return bucket.length === prefix && /^[0-9a-z]+$/.test(bucket) ? bucket : "_";
+  }
+
+  function fetchJson(path) {
+    return fetch(path).then(res => (res.ok ? res.json() : null)).catch(() => null);
+  }
+
+  async function loadDrilldown(kind, key) {
+    if (!els.drilldown) return;
+    const id = `${kind}/${key}`;
+    els.drilldown.dataset.id = id;
+    els.drilldown.innerHTML = "";
+    if (!DRILLDOWN.index) DRILLDOWN.index = fetchJson(PATHS.drilldown);
+    const index = await DRILLDOWN.index;
+    const file = index && index.tabs && index.tabs[kind] && index.tabs[kind][bucketOf(key, index.prefix)];
+    let entry = null;
+    if (file) {
+      const path = PATHS.drilldown.replace(/[^/]*$/, "") + file;
+      if (!DRILLDOWN.shards.has(path)) DRILLDOWN.shards.set(path, fetchJson(path));
+      const shard = await DRILLDOWN.shards.get(path);
+      entry = (shard && shard[key]) || null;
+    }
+    // Selection may have moved on while the shard was loading
+    if (els.drilldown.dataset.id === id) renderDrilldown(entry);
+  }
+
+  function renderChildren(title, children, urlPrefix) {
+    if (!children || !children.top.length) return "";
+    const items = children.top.map(([key, name, total, withId, valid]) =>
+      `<li><span class="count">${pctText(valid, total)} valid of ${total.toLocaleString()}</span>` +
+      `<a class="name" href="${urlPrefix}${encodeURIComponent(key)}" target="_blank" rel="noreferrer noopener">${escapeHtml(name || key)}</a></li>`
+    ).join("");
+    const more = children.count > children.top.length ? ` (top ${children.top.length} of ${children.count.toLocaleString()})` : "";
+    return `<h3>${title}${more}</h3><ol>${items}</ol>`;
+  }
+
+  function pctText(num, total) {
+    return `${(total > 0 ? (100 * num) / total : 0).toFixed(1)}%`;
+  }
+
+  function renderDrilldown(entry) {
+    if (!entry) {
+      els.drilldown.innerHTML = "";
+      return;
+    }
+    const labels = new Map((window.RECORDEDBY_SCHEMES || []).map(s => [s.name, s.label]));
+    const schemes = Object.entries(entry.schemes || {}).map(([name, count]) =>
+      `<li><span class="count">${count.toLocaleString()} · ${pctText(count, entry.withId)} of IDs</span>` +
+      `<span class="name">${escapeHtml(labels.get(name) || name)}</span></li>`
+    ).join("");
+    const url = buildGbifSqlUrl(entry.sql);
+    const sqlLink = url.length <= MAX_URL_LENGTH
+      ? `<a href="${url}" target="_blank" rel="noreferrer noopener">Run on GBIF</a>`
+      : `<span class="muted">Too long for a link; copy it into the GBIF SQL form.</span>`;
+    els.drilldown.innerHTML =
+      `<h3>recordedByID schemes</h3><ul>${schemes}</ul>` +
+      renderChildren("Datasets", entry.datasets, "https://www.gbif.org/dataset/") +
+      renderChildren("Publishers", entry.publishers, "https://www.gbif.org/publisher/") +
+      `<h3>Per-dataset SQL</h3><pre>${escapeHtml(entry.sql)}</pre>${sqlLink}`;
+  }
+
+  function selectKey(key) {
+    const tab = STATE.data[STATE.activeTab];
+    const i = tab && tab.keyIndex.get(key);
+    if (i !== undefined) selectRow(tab, i);
+  }
+
+  function startSearchWorker() {
+    if (typeof Worker === "undefined") return;
+    try {
+      STATE.worker = new Worker(PATHS.searchWorker);
+    } catch (e) {
+      console.warn("Search worker unavailable, filtering on the main thread", e);
+      return;
+    }
+    STATE.worker.onmessage = (ev) => {
+      const msg = ev.data;
+      // Drop answers to queries that were superseded while the worker was busy
+      if (msg.type !== "result" || msg.id !== STATE.search.id) return;
+      STATE.search.tab = msg.tab;
+      STATE.search.matches = msg.matches;
+      renderList();
+    };
+    const tabs = {};
+    Object.keys(STATE.data).forEach(kind => { tabs[kind] = STATE.data[kind].lowerNames; });
+    STATE.worker.postMessage({ type: "init", indexUrls: [PATHS.searchIndexGz, PATHS.searchIndex], tabs });
+  }
+
+  function runSearch() {
+    const query = (els.search.value || "").toLowerCase();
+    const kind = STATE.activeTab;
+    const id = ++STATE.search.id;
+    if (!query) {
+      STATE.search.tab = kind;
+      STATE.search.matches = null;
+      renderList();
+      return;
+    }
+    if (STATE.worker) {
+      STATE.worker.postMessage({ type: "query", id, tab: kind, query });
+      return;
+    }
+    const tab = STATE.data[kind];
+    const out = [];
+    for (let i = 0; i < tab.n; i++) if (tab.lowerNames[i].includes(query)) out.push(i);
+    STATE.search.tab = kind;
+    STATE.search.matches = Uint32Array.from(out);
+    renderList();
+  }
+
+  function scheduleSearch() {
+    clearTimeout(STATE.search.timer);
+    STATE.search.timer = setTimeout(runSearch, SEARCH_DEBOUNCE_MS);
   }
 
   function renderMeta(row) {
@@ -213,24 +411,16 @@
     } else if (STATE.activeTab === "hosting") {
       where = `hostingOrganizationKey = '${row.key}'`;
     } else if (STATE.activeTab === "node") {
-      // Build IN (...) from nodes.json
-      const node = (STATE.nodes || []).find(n => String(n.nodeKey) === String(row.key));
-      const orgKeys = (node?.organizations || []).map(o => `'${o.key}'`);
+      // Build IN (...) from the node -> organization keys map
+      const orgKeys = (STATE.nodeOrgs.get(String(row.key)) || []).map(k => `'${k}'`);
       where = orgKeys.length ? `publishingOrgKey IN (${orgKeys.join(",")})` : "1=0";
     }
 
-    const validPredicate = `(${[
-      "GBIF_StringArrayLike(recordedByID, 'https://orcid.org/*', FALSE)",
-      "GBIF_StringArrayLike(recordedByID, 'http://orcid.org/*', FALSE)",
-      "GBIF_StringArrayLike(recordedByID, 'https://scholar.google.com/citations?user=*', FALSE)",
-      "GBIF_StringArrayLike(recordedByID, 'http://scholar.google.com/citations?user=*', FALSE)",
-      "GBIF_StringArrayLike(recordedByID, 'https://www.researcherid.com/rid/*', FALSE)",
-      "GBIF_StringArrayLike(recordedByID, 'http://www.researcherid.com/rid/*', FALSE)",
-      "GBIF_StringArrayLike(recordedByID, 'https://www.wikidata.org/entity/*', FALSE)",
-      "GBIF_StringArrayLike(recordedByID, 'http://www.wikidata.org/entity/*', FALSE)",
-      "GBIF_StringArrayLike(recordedByID, 'https://www.linkedin.com/profile/view?id=*', FALSE)",
-      "GBIF_StringArrayLike(recordedByID, 'http://www.linkedin.com/profile/view?id=*', FALSE)",
-    ].join(" OR ")})`;
+    // Patterns come from scripts/recordedby_schemes.js, generated by recordedby_schemes.py
+    const patterns = (window.RECORDEDBY_SCHEMES || []).flatMap(s => s.patterns);
+    const validPredicate = `(${patterns
+      .map(p => `GBIF_StringArrayLike(recordedByID, '${p}', FALSE)`)
+      .join(" OR ")})`;
 
     const selectCols = [
       "datasetName",
@@ -345,7 +535,7 @@
   }
 
   function escapeHtml(s) {
-    return String(s).replace(/[&<>"]+/g, (c) => ({"&":"&amp;","<":"&lt;",">":"&gt;","\"":"&quot;"}[c]));
+    return String(s).replace(/[&<>"]/g, (c) => ({"&":"&amp;","<":"&lt;",">":"&gt;","\"":"&quot;"}[c]));
   }
 
   function setActiveTab(tab) {
@@ -354,15 +544,30 @@
     els.tabPublisher.classList.toggle("active", tab === "publisher");
     els.tabHosting.classList.toggle("active", tab === "hosting");
     els.tabNode.classList.toggle("active", tab === "node");
-    renderList();
+    els.list.scrollTop = 0;
+    runSearch();
   }
 
   function wireEvents() {
     els.tabPublisher.addEventListener("click", () => setActiveTab("publisher"));
     els.tabHosting.addEventListener("click", () => setActiveTab("hosting"));
     els.tabNode.addEventListener("click", () => setActiveTab("node"));
-    els.search.addEventListener("input", () => renderList());
+    els.search.addEventListener("input", scheduleSearch);
     els.sort.addEventListener("change", () => renderList());
+    // One delegated listener set for all (recycled) list rows
+    els.list.addEventListener("click", (ev) => {
+      const item = ev.target.closest(".list-item");
+      if (item) selectKey(item.dataset.key);
+    });
+    els.list.addEventListener("keydown", (ev) => {
+      const item = ev.target.closest(".list-item");
+      if (item && (ev.key === "Enter" || ev.key === " ")) { ev.preventDefault(); selectKey(item.dataset.key); }
+    });
+    els.list.addEventListener("scroll", () => {
+      if (STATE.scrollFrame) return;
+      STATE.scrollFrame = requestAnimationFrame(() => { STATE.scrollFrame = 0; renderWindow(false); });
+    }, { passive: true });
+    window.addEventListener("resize", () => renderWindow());
     [els.btnInvalid, els.btnValid, els.btnMissing, els.btnTopNames].forEach(a => a && a.addEventListener('click', (e) => {
       // ensure href is present; if not (no selection yet), prevent navigation
       if (!e.currentTarget.href || e.currentTarget.href.endsWith('#')) {
@@ -371,41 +576,98 @@
     }));
   }
 
-  function loadCsv(path, normalizeFn, configOverrides = {}) {
+  function loadCsv(path, configOverrides = {}) {
     return new Promise((resolve, reject) => {
       Papa.parse(path, {
         header: true,
         dynamicTyping: false,
         skipEmptyLines: true,
         download: true,
+        transformHeader: (h) => h.toLowerCase(),
         ...configOverrides,
-        complete: (res) => {
-          const rows = (res.data || []).map(normalizeFn).filter(r => r && r.key);
-          resolve(rows);
-        },
+        complete: (res) => resolve(res.data || []),
         error: (err) => reject(err),
       });
     });
   }
 
+  // Artifact paths and download keys of the last pipeline.py run
+  const MANIFEST_KEYS = ["publisher", "hosting", "nodeAgg", "nodesMap", "bundle", "bundleGz", "searchIndex", "searchIndexGz", "topNames", "drilldown"];
+
+  async function applyManifest() {
+    try {
+      const res = await fetch(PATHS.manifest);
+      if (!res.ok) return;
+      const manifest = await res.json();
+      const paths = manifest.paths || {};
+      MANIFEST_KEYS.forEach(k => { if (paths[k]) PATHS[k] = paths[k]; });
+    } catch (e) {
+      console.warn("Manifest not available, using built-in paths", e);
+    }
+  }
+
+  async function fetchBundle() {
+    // Static hosts serve the .gz as an opaque file, so decompress it in the browser when possible
+    if (typeof DecompressionStream !== "undefined") {
+      try {
+        const res = await fetch(PATHS.bundleGz);
+        if (res.ok) {
+          const stream = res.body.pipeThrough(new DecompressionStream("gzip"));
+          return await new Response(stream).json();
+        }
+      } catch (e) {
+        // fall through to the uncompressed bundle
+      }
+    }
+    const res = await fetch(PATHS.bundle);
+    return res.ok ? res.json() : null;
+  }
+
+  async function loadFromBundle() {
+    const bundle = await fetchBundle();
+    if (!bundle) return false;
+    const strings = bundle.strings;
+    STATE.countColumns = bundle.countColumns || DEFAULT_COUNT_COLUMNS;
+    Object.keys(bundle.tabs).forEach(kind => { STATE.data[kind] = tabFromBundle(kind, bundle.tabs[kind], strings); });
+    STATE.nodeOrgs = new Map((bundle.nodeOrgs || []).map(([n, orgs]) => [strings[n], orgs.map(i => strings[i])]));
+    return true;
+  }
+
+  async function loadFromCsv() {
+    const [pubRows, hostRows, nodeAggRows, nodesJson] = await Promise.all([
+      loadCsv(PATHS.publisher, { delimiter: "\t", quoteChar: '', escapeChar: '' }),
+      loadCsv(PATHS.hosting),
+      loadCsv(PATHS.nodeAgg),
+      fetch(PATHS.nodesMap).then(r => r.ok ? r.json() : []),
+    ]);
+    STATE.data.publisher = tabFromCsvRows("publisher", pubRows);
+    STATE.data.hosting = tabFromCsvRows("hosting", hostRows);
+    STATE.data.node = tabFromCsvRows("node", nodeAggRows);
+    STATE.nodeOrgs = new Map(nodesJson.map(n => [String(n.nodeKey), (n.organizations || []).map(o => o.key)]));
+  }
+
   async function init() {
+    // Scroll container keeps the full virtual height; rows are positioned inside the spacer
+    els.spacer = document.createElement("div");
+    els.spacer.className = "list-spacer";
+    els.list.innerHTML = "";
+    els.list.appendChild(els.spacer);
     wireEvents();
 
     try {
-      const [pubRows, hostRows, nodeAggRows, nodesJson] = await Promise.all([
-        loadCsv(PATHS.publisher, normalizeRowPublisher, { delimiter: "\t", quoteChar: '', escapeChar: '' }),
-        loadCsv(PATHS.hosting, normalizeRowHosting),
-        loadCsv(PATHS.nodeAgg, normalizeRowNode),
-        fetch(PATHS.nodesMap).then(r => r.ok ? r.json() : []),
-      ]);
-      STATE.data.publisher = pubRows;
-      STATE.data.hosting = hostRows;
-      STATE.data.node = nodeAggRows;
-      STATE.nodes = nodesJson;
+      await applyManifest();
+      let loaded = false;
+      try {
+        loaded = await loadFromBundle();
+      } catch (e) {
+        console.warn("Bundle not available, falling back to CSVs", e);
+      }
+      if (!loaded) await loadFromCsv();
+      startSearchWorker();
       renderList();
     } catch (e) {
-      console.error("Failed to load CSVs", e);
-      els.list.innerHTML = `<div style="padding:12px;color:#f88">Failed to load CSVs. Check paths in scripts/app.js.</div>`;
+      console.error("Failed to load data", e);
+      els.list.innerHTML = `<div style="padding:12px;color:#f88">Failed to load data. Run pipeline.py run or check out-web/manifest.json.</div>`;
     }
   }
 
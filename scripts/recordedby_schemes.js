@@ -0,0 +1,2 @@
+// Generated by recordedby_schemes.py; do not edit by hand.
+window.RECORDEDBY_SCHEMES = [{"name": "orcid", "label": "ORCID", "patterns": ["https://orcid.org/*", "http://orcid.org/*"]}, {"name": "google_scholar", "label": "Google Scholar", "patterns": ["https://scholar.google.com/citations?user=*", "http://scholar.google.com/citations?user=*"]}, {"name": "researcherid", "label": "ResearcherID", "patterns": ["https://www.researcherid.com/rid/*", "http://www.researcherid.com/rid/*"]}, {"name": "wikidata", "label": "Wikidata", "patterns": ["https://www.wikidata.org/entity/*", "http://www.wikidata.org/entity/*"]}, {"name": "linkedin", "label": "LinkedIn", "patterns": ["https://www.linkedin.com/profile/view?id=*", "http://www.linkedin.com/profile/view?id=*"]}];
@@ -0,0 +1,124 @@
+/* Name search for the viewer, off the main thread.
+ *
+ * Messages in:
+ *   { type: "init", indexUrls: [...], tabs: { <kind>: [lowercased names] } }
+ *   { type: "query", id, tab, query }
+ * Messages out:
+ *   { type: "result", id, tab, query, matches }  matches: ascending row ids, or null for "all rows"
+ */
+(function () {
+  let N = 3;
+  const TABS = {};     // kind -> { names, grams: Map(gram -> Uint32Array of row ids) }
+  let ready = null;
+
+  function decodePostings(deltas) {
+    const rows = new Uint32Array(deltas.length);
+    let acc = 0;
+    for (let i = 0; i < deltas.length; i++) {
+      acc += deltas[i];
+      rows[i] = acc;
+    }
+    return rows;
+  }
+
+  function buildGrams(names) {
+    // Same index as build_web_bundle.build_search_index, for when search.json is missing or stale
+    const postings = new Map();
+    names.forEach((name, row) => {
+      const seen = new Set();
+      for (let i = 0; i + N <= name.length; i++) {
+        const g = name.slice(i, i + N);
+        if (seen.has(g)) continue;
+        seen.add(g);
+        let list = postings.get(g);
+        if (!list) postings.set(g, list = []);
+        list.push(row);
+      }
+    });
+    const grams = new Map();
+    postings.forEach((rows, g) => grams.set(g, Uint32Array.from(rows)));
+    return grams;
+  }
+
+  async function fetchIndex(urls) {
+    for (const url of urls) {
+      try {
+        const res = await fetch(url);
+        if (!res.ok) continue;
+        if (url.endsWith(".gz")) {
+          if (typeof DecompressionStream === "undefined") continue;
+          return await new Response(res.body.pipeThrough(new DecompressionStream("gzip"))).json();
+        }
+        return await res.json();
+      } catch (e) {
+        // try the next variant
+      }
+    }
+    return null;
+  }
+
+  async function init(msg) {
+    const index = await fetchIndex(msg.indexUrls || []);
+    if (index && index.n) N = index.n;
+    Object.keys(msg.tabs).forEach(kind => {
+      const names = msg.tabs[kind];
+      const prebuilt = index && index.tabs && index.tabs[kind];
+      let grams;
+      if (prebuilt && prebuilt.rows === names.length) {
+        grams = new Map();
+        Object.keys(prebuilt.grams).forEach(g => grams.set(g, decodePostings(prebuilt.grams[g])));
+      } else {
+        grams = buildGrams(names);
+      }
+      TABS[kind] = { names, grams };
+    });
+  }
+
+  function intersect(a, b) {
+    const out = [];
+    let i = 0, j = 0;
+    while (i < a.length && j < b.length) {
+      if (a[i] === b[j]) { out.push(a[i]); i++; j++; }
+      else if (a[i] < b[j]) i++;
+      else j++;
+    }
+    return Uint32Array.from(out);
+  }
+
+  function search(tab, query) {
+    if (!query) return null;
+    const names = tab.names;
+    if (query.length < N) {
+      const out = [];
+      for (let i = 0; i < names.length; i++) if (names[i].includes(query)) out.push(i);
+      return Uint32Array.from(out);
+    }
+    // Intersect the rarest postings first, then verify the candidates with a substring check
+    const lists = [];
+    for (let i = 0; i + N <= query.length; i++) {
+      const rows = tab.grams.get(query.slice(i, i + N));
+      if (!rows) return new Uint32Array(0);
+      lists.push(rows);
+    }
+    lists.sort((a, b) => a.length - b.length);
+    let candidates = lists[0];
+    for (let k = 1; k < lists.length && candidates.length; k++) candidates = intersect(candidates, lists[k]);
+    return candidates.filter(i => names[i].includes(query));
+  }
+
+  self.onmessage = async (ev) => {
+    const msg = ev.data;
+    if (msg.type === "init") {
+      ready = init(msg);
+      await ready;
+      return;
+    }
+    if (msg.type === "query") {
+      await ready;
+      const tab = TABS[msg.tab];
+      const matches = tab ? search(tab, msg.query) : null;
+      const transfer = matches ? [matches.buffer] : [];
+      self.postMessage({ type: "result", id: msg.id, tab: msg.tab, query: msg.query, matches }, transfer);
+    }
+  };
+})();
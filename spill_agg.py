@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+import heapq
+import os
+import pickle
+import shutil
+import tempfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+Key = Tuple[str, ...]
+Item = Tuple[Key, List[int]]
+
+DEFAULT_PARTITIONS = 64
+# Groups per pickle frame in run files
+_FRAME = 1024
+# Partitions still over budget are split again with a new hash salt, up to this depth
+_MAX_LEVEL = 4
+
+
+def entry_bytes(key: Key, width: int) -> int:
+    # Rough CPython footprint of one group: dict slot, key tuple and its strings, counter list and ints
+    return 100 + 8 * len(key) + sum(49 + len(s) for s in key) + 36 * width
+
+
+def partition_of(key: Key, level: int, partitions: int) -> int:
+    # hash() is salted per process; crc32 gives the same partition in every worker
+    data = "\x1f".join(key).encode("utf-8", "surrogatepass")
+    return zlib.crc32(data, (level * 0x9E3779B1) & 0xFFFFFFFF) % partitions
+
+
+def write_frames(path: Path, items: Iterable[Item], mode: str = "ab") -> None:
+    with path.open(mode) as f:
+        batch: List[Item] = []
+        for item in items:
+            batch.append(item)
+            if len(batch) >= _FRAME:
+                pickle.dump(batch, f, pickle.HIGHEST_PROTOCOL)
+                batch = []
+        if batch:
+            pickle.dump(batch, f, pickle.HIGHEST_PROTOCOL)
+
+
+def read_frames(path: Path) -> Iterator[Item]:
+    with path.open("rb") as f:
+        while True:
+            try:
+                batch = pickle.load(f)
+            except EOFError:
+                return
+            yield from batch
+
+
+class SpillingAggregator:
+    # Sums fixed-width counter lists per key tuple. Groups stay in a dict until their estimated size
+    # passes budget_bytes; the dict is then appended to one run file per key-hash partition and emptied.
+    # Every partial sum of a key lands in the same partition, so partitions are merged independently.
+    def __init__(self, width: int, budget_bytes: Optional[int] = None, partitions: int = DEFAULT_PARTITIONS, spill_dir: Optional[Path] = None, level: int = 0) -> None:
+        self.width = width
+        self.budget_bytes = budget_bytes
+        self.partitions = partitions
+        self.spill_dir = spill_dir
+        self.level = level
+        self.groups: Dict[Key, List[int]] = {}
+        self.used = 0
+        self.spills = 0
+        self._dir: Optional[Path] = None
+
+    @property
+    def spilled(self) -> bool:
+        return self._dir is not None
+
+    def add(self, key: Key, counts: List[int]) -> None:
+        # Takes ownership of a new key's counts list
+        acc = self.groups.get(key)
+        if acc is None:
+            self.groups[key] = counts
+            self.used += entry_bytes(key, self.width)
+            if self.budget_bytes is not None and self.used > self.budget_bytes:
+                self.spill()
+            return
+        for i, v in enumerate(counts):
+            acc[i] += v
+
+    def merge(self, part: Dict[Key, List[int]]) -> None:
+        for key, counts in part.items():
+            self.add(key, counts)
+
+    def run_path(self, partition: int) -> Path:
+        assert self._dir is not None
+        return self._dir / f"part-{partition:03d}.run"
+
+    def spill(self) -> None:
+        if not self.groups:
+            return
+        if self._dir is None:
+            if self.spill_dir is not None:
+                self.spill_dir.mkdir(parents=True, exist_ok=True)
+            self._dir = Path(tempfile.mkdtemp(prefix=f"spill-{self.level}-", dir=self.spill_dir))
+        buckets: List[List[Item]] = [[] for _ in range(self.partitions)]
+        for item in self.groups.items():
+            buckets[partition_of(item[0], self.level, self.partitions)].append(item)
+        self.groups = {}
+        self.used = 0
+        for p, items in enumerate(buckets):
+            if items:
+                write_frames(self.run_path(p), items)
+            buckets[p] = []
+        self.spills += 1
+
+    def sorted_items(self, sort_key: Callable[[Item], Any], workers: int = 1) -> Iterator[Item]:
+        # Every group once, in sort_key order. Without a spill this is sorted(); otherwise each partition is
+        # summed and sorted into a run (in worker processes when workers > 1) and the runs are heap-merged
+        if not self.spilled:
+            items = sorted(self.groups.items(), key=sort_key)
+            self.groups = {}
+            yield from items
+            return
+        try:
+            self.spill()
+            runs = self._sort_partitions(sort_key, workers)
+            yield from heapq.merge(*(read_frames(run) for run in runs), key=sort_key)
+        finally:
+            self.close()
+
+    def _sort_partitions(self, sort_key: Callable[[Item], Any], workers: int) -> List[Path]:
+        parts = [self.run_path(p) for p in range(self.partitions) if self.run_path(p).exists()]
+        budget = self.budget_bytes if self.level + 1 < _MAX_LEVEL else None
+        args = [(str(path), self.width, budget, self.partitions, self.level + 1, sort_key) for path in parts]
+        if workers > 1 and len(args) > 1:
+            with ProcessPoolExecutor(max_workers=workers) as ex:
+                nested = list(ex.map(sort_partition, *zip(*args)))
+        else:
+            nested = [sort_partition(*a) for a in args]
+        return [Path(run) for runs in nested for run in runs]
+
+    def close(self) -> None:
+        if self._dir is not None:
+            shutil.rmtree(self._dir, ignore_errors=True)
+            self._dir = None
+
+
+def sort_partition(path: str, width: int, budget_bytes: Optional[int], partitions: int, level: int, sort_key: Callable[[Item], Any]) -> List[str]:
+    # Sum one partition's runs and write its groups back sorted. A partition that is itself over budget
+    # spills into sub-partitions next to it, which are sorted the same way
+    run = Path(path)
+    agg = SpillingAggregator(width, budget_bytes, partitions, run.parent, level)
+    for key, counts in read_frames(run):
+        agg.add(key, counts)
+    os.unlink(run)
+    if not agg.spilled:
+        out = run.with_suffix(".sorted")
+        write_frames(out, sorted(agg.groups.items(), key=sort_key), "wb")
+        return [str(out)]
+    agg.spill()
+    return [str(p) for p in agg._sort_partitions(sort_key, 1)]
+
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+import argparse
+import re
+import sys
+import time
+from decimal import Decimal
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from local_stats import format_pct
+from recordedby_schemes import count_columns, malformed_columns, pct_column
+from stats_reader import iter_batches, read_header
+
+
+STRATEGIES = ("year", "basis", "key")
+
+# GBIF's BasisOfRecord vocabulary; rows outside it (or NULL) go to the last shard
+BASIS_OF_RECORD = [
+    "PRESERVED_SPECIMEN",
+    "FOSSIL_SPECIMEN",
+    "LIVING_SPECIMEN",
+    "OBSERVATION",
+    "HUMAN_OBSERVATION",
+    "MACHINE_OBSERVATION",
+    "MATERIAL_SAMPLE",
+    "MATERIAL_CITATION",
+    "OCCURRENCE",
+]
+
+DEFAULT_YEARS = (1900, time.localtime().tm_year)
+
+# Strings and comments are single tokens, so keywords inside them are never matched
+_TOKEN = re.compile(r"'(?:[^']|'')*'|--[^\n]*|/\*.*?\*/|\s+|[A-Za-z_][A-Za-z0-9_]*|.", re.DOTALL)
+_CLAUSE_END = ("GROUP", "ORDER", "HAVING", "LIMIT")
+
+
+def _top_level_words(sql: str) -> List[Tuple[str, int, int]]:
+    # (uppercased word, start, end) of identifiers and keywords outside parentheses
+    words = []
+    depth = 0
+    for m in _TOKEN.finditer(sql):
+        tok = m.group()
+        if tok == "(":
+            depth += 1
+        elif tok == ")":
+            depth -= 1
+        elif depth == 0 and (tok[0].isalpha() or tok[0] == "_"):
+            words.append((tok.upper(), m.start(), m.end()))
+    return words
+
+
+def group_by_column(sql: str) -> str:
+    words = _top_level_words(sql)
+    for i, (word, _s, _e) in enumerate(words[:-2]):
+        if word == "GROUP" and words[i + 1][0] == "BY":
+            return sql[words[i + 2][1]:words[i + 2][2]]
+    raise ValueError("Query has no GROUP BY column to shard by key")
+
+
+def with_predicate(sql: str, predicate: str) -> str:
+    # AND the predicate into the top-level WHERE clause, or add one before GROUP BY / ORDER BY / ...
+    body = sql.rstrip().rstrip(";").rstrip()
+    words = _top_level_words(body)
+    where = next((w for w in words if w[0] == "WHERE"), None)
+    after = [w for w in words if w[0] in _CLAUSE_END and (where is None or w[1] > where[2])]
+    end = after[0][1] if after else len(body)
+    if where is None:
+        return f"{body[:end].rstrip()}\nWHERE {predicate}\n{body[end:]}".rstrip() + ";\n"
+    condition = body[where[2]:end].strip()
+    return f"{body[:where[2]]} ({predicate}) AND ({condition})\n{body[end:]}".rstrip() + ";\n"
+
+
+def year_predicates(shards: int, first: int, last: int) -> List[str]:
+    # Equal-width year ranges; the first also takes NULL and earlier years, the last everything later
+    bounds = [first + (last - first) * i // shards for i in range(1, shards)]
+    preds = []
+    for i in range(shards):
+        lo = bounds[i - 1] if i > 0 else None
+        hi = bounds[i] if i < shards - 1 else None
+        if lo is None and hi is None:
+            preds.append("1 = 1")
+        elif lo is None:
+            preds.append(f"year IS NULL OR year < {hi}")
+        elif hi is None:
+            preds.append(f"year >= {lo}")
+        else:
+            preds.append(f"year >= {lo} AND year < {hi}")
+    return preds
+
+
+def basis_predicates(shards: int) -> List[str]:
+    groups = [BASIS_OF_RECORD[i::shards] for i in range(shards)]
+    everything = ", ".join(f"'{b}'" for b in BASIS_OF_RECORD)
+    preds = [f"basisOfRecord IN ({', '.join(repr(b) for b in g)})" for g in groups if g]
+    preds[-1] += f" OR basisOfRecord IS NULL OR basisOfRecord NOT IN ({everything})"
+    return preds
+
+
+def key_predicates(shards: int, column: str) -> List[str]:
+    # Registry keys are UUIDs, so equal ranges of the leading hex digits hold about equally many
+    # groups, and each group lands in exactly one shard. The outer ranges are open, so keys that are
+    # not lowercase hex still fall somewhere; NULL keys go to the last shard.
+    bounds = [f"{256 * i // shards:02x}" for i in range(1, shards)]
+    preds = [f"{column} < '{bounds[0]}'"]
+    preds += [f"{column} >= '{lo}' AND {column} < '{hi}'" for lo, hi in zip(bounds, bounds[1:])]
+    preds.append(f"{column} >= '{bounds[-1]}' OR {column} IS NULL")
+    return preds
+
+
+def shard_predicates(sql: str, strategy: str, shards: int, years: Tuple[int, int] = DEFAULT_YEARS, column: Optional[str] = None) -> List[str]:
+    if strategy == "year":
+        return year_predicates(shards, *years)
+    if strategy == "basis":
+        return basis_predicates(min(shards, len(BASIS_OF_RECORD)))
+    if strategy == "key":
+        return key_predicates(min(shards, 256), column or group_by_column(sql))
+    raise ValueError(f"Unknown shard strategy: {strategy}")
+
+
+def shard_sql(sql: str, strategy: str, shards: int, years: Tuple[int, int] = DEFAULT_YEARS, column: Optional[str] = None) -> List[str]:
+    if shards < 2:
+        return [sql]
+    return [with_predicate(sql, p) for p in shard_predicates(sql, strategy, shards, years, column)]
+
+
+def merge_tables(paths: Sequence[Path]) -> Tuple[List[str], List[List[str]]]:
+    # Partial aggregates of the same query: counters are summed per group and every pct_* column is
+    # recomputed from the sums, never averaged
+    header = read_header(paths[0])
+    names = [h.lower() for h in header]
+    for path in paths[1:]:
+        if [h.lower() for h in read_header(path)] != names:
+            raise ValueError(f"{path} has a different header than {paths[0]}")
+    counters = set(count_columns() + malformed_columns())
+    count_idx = [i for i, n in enumerate(names) if n in counters]
+    pct_of = {names.index(pct_column(names[i])): i for i in count_idx if names[i] != "total_records" and pct_column(names[i]) in names}
+    key_idx = [i for i, n in enumerate(names) if i not in pct_of and n not in counters]
+    if "total_records" not in names:
+        raise ValueError("Partial results need a total_records column")
+    total_i = names.index("total_records")
+
+    groups: Dict[Tuple[str, ...], List[int]] = {}
+    for path in paths:
+        for batch in iter_batches(path):
+            keys = list(zip(*(batch.column(names[i]) for i in key_idx))) if key_idx else [()] * len(batch)
+            cols = [batch.column(names[i]) for i in count_idx]
+            for r, key in enumerate(keys):
+                acc = groups.get(key)
+                if acc is None:
+                    acc = groups[key] = [0] * len(count_idx)
+                for j, col in enumerate(cols):
+                    acc[j] += col[r]
+
+    slot = {i: j for j, i in enumerate(count_idx)}
+    rows = []
+    for key, acc in groups.items():
+        row = [""] * len(names)
+        for i, v in zip(key_idx, key):
+            row[i] = v
+        for i, j in slot.items():
+            row[i] = str(acc[j])
+        total = acc[slot[total_i]]
+        for p, c in pct_of.items():
+            row[p] = format_pct(acc[slot[c]], total)
+        rows.append(row)
+
+    # Same order as the single query and local_stats.py: pct_with_recordedbyid descending, then key
+    if "records_with_recordedbyid" in names:
+        with_id = names.index("records_with_recordedbyid")
+        rows.sort(key=lambda r: (-Decimal(int(r[with_id])) / max(1, int(r[total_i])), [r[i] for i in key_idx]))
+    return header, rows
+
+
+def write_table(header: List[str], rows: List[List[str]], out_path: Path) -> None:
+    # GBIF SQL_TSV_ZIP layout: tab separated, unquoted, LF line endings
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    with out_path.open("w", encoding="utf-8", newline="") as f:
+        f.write("\t".join(header) + "\n")
+        for row in rows:
+            f.write("\t".join(row) + "\n")
+
+
+def parse_years(value: str) -> Tuple[int, int]:
+    first, _, last = value.partition(":")
+    return int(first), int(last)
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Split a stats query into shard queries, or merge the shards' results back into one table")
+    sub = p.add_subparsers(dest="command", required=True)
+    sp = sub.add_parser("split", help="Write one .sql file per shard, e.g. for gbif_sql_batch.py")
+    sp.add_argument("sql_file", type=Path)
+    sp.add_argument("--by", choices=STRATEGIES, default="key", help="Partition by year range, basisOfRecord, or ranges of the GROUP BY key (default: key)")
+    sp.add_argument("--shards", type=int, default=4)
+    sp.add_argument("--years", type=parse_years, default=DEFAULT_YEARS, help="FIRST:LAST year spanned by --by year shards (default: 1900:this year)")
+    sp.add_argument("--out-dir", type=Path, default=Path("shards"))
+    mp = sub.add_parser("merge", help="Sum partial results (TSV or result ZIPs) and recompute the percentages")
+    mp.add_argument("parts", type=Path, nargs="+")
+    mp.add_argument("--output", "-o", type=Path, required=True)
+    return p.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    if args.command == "split":
+        sql = args.sql_file.read_text(encoding="utf-8")
+        args.out_dir.mkdir(parents=True, exist_ok=True)
+        for i, text in enumerate(shard_sql(sql, args.by, args.shards, years=args.years)):
+            path = args.out_dir / f"{args.sql_file.stem}.{args.by}-{i:02d}.sql"
+            path.write_text(text, encoding="utf-8")
+            print(f"Wrote {path}")
+        return 0
+    try:
+        header, rows = merge_tables(args.parts)
+    except ValueError as exc:
+        print(f"Error: {exc}", file=sys.stderr)
+        return 1
+    write_table(header, rows, args.output)
+    print(f"Merged {len(args.parts)} parts into {len(rows)} rows: {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
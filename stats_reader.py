@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+import csv
+import io
+import itertools
+import zipfile
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, TextIO, Tuple
+
+import tracing
+from recordedby_schemes import count_columns, malformed_columns
+
+
+# Rows per batch; bounds memory regardless of file size
+DEFAULT_BATCH_ROWS = 50_000
+
+# Columns parsed to int in batches (lowercased); pct_* and text columns stay strings
+INT_COLUMNS = frozenset(count_columns() + malformed_columns() + ["orgcount"])
+
+_DATA_SUFFIXES = (".csv", ".tsv", ".txt")
+
+
+def to_int(value: object) -> int:
+    if not value:
+        return 0
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        try:
+            return int(float(value))
+        except (TypeError, ValueError):
+            return 0
+
+
+def zip_member(zf: zipfile.ZipFile) -> zipfile.ZipInfo:
+    # GBIF SQL results hold a single <key>.csv; fall back to the largest data-looking member
+    members = [i for i in zf.infolist() if not i.is_dir()]
+    data = [i for i in members if i.filename.lower().endswith(_DATA_SUFFIXES)] or members
+    if not data:
+        raise ValueError(f"No data file in {zf.filename}")
+    return max(data, key=lambda i: i.file_size)
+
+
+@contextmanager
+def open_text(path: Path) -> Iterator[TextIO]:
+    # A stats table on disk, or the table inside a downloaded result ZIP, read without extracting
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as zf:
+            with zf.open(zip_member(zf)) as raw:
+                yield io.TextIOWrapper(raw, encoding="utf-8", newline="")
+    else:
+        with path.open("r", encoding="utf-8", newline="") as f:
+            yield f
+
+
+def _reader(f: TextIO) -> Tuple[List[str], Iterator[List[str]]]:
+    # GBIF TSV (quotes are literal) or a CSV written by the enrichment/rollup scripts
+    first = f.readline()
+    lines = itertools.chain([first], f)
+    if "\t" in first:
+        reader = csv.reader(lines, delimiter="\t", quoting=csv.QUOTE_NONE)
+    else:
+        reader = csv.reader(lines)
+    header = next(reader, [])
+    return header, reader
+
+
+def iter_records(path: Path) -> Iterator[Dict[str, str]]:
+    with open_text(path) as f:
+        header, reader = _reader(f)
+        names = [h.lower() for h in header]
+        for row in reader:
+            if row:
+                yield dict(zip(names, row))
+
+
+class RecordBatch:
+    # Column-oriented slice of a stats table: name -> list of values, all the same length
+    def __init__(self, columns: Dict[str, list], size: int) -> None:
+        self.columns = columns
+        self.size = size
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.columns
+
+    def column(self, name: str) -> list:
+        col = self.columns.get(name)
+        if col is None:
+            return [0 if name in INT_COLUMNS else ""] * self.size
+        return col
+
+    def rows(self) -> Iterator[Dict[str, object]]:
+        names = list(self.columns)
+        for values in zip(*(self.columns[n] for n in names)):
+            yield dict(zip(names, values))
+
+
+def _typed(name: str, values: List[str]) -> list:
+    if name not in INT_COLUMNS:
+        return values
+    try:
+        return list(map(int, values))
+    except ValueError:
+        return [to_int(v) for v in values]
+
+
+def iter_batches(path: Path, batch_size: int = DEFAULT_BATCH_ROWS, columns: Optional[Sequence[str]] = None) -> Iterator[RecordBatch]:
+    # Headers are lowercased; `columns` restricts which ones are materialized
+    with open_text(path) as f:
+        header, reader = _reader(f)
+        names = [h.lower() for h in header]
+        wanted = [(i, n) for i, n in enumerate(names) if columns is None or n in columns]
+        bufs: List[List[str]] = [[] for _ in wanted]
+        width = len(names)
+        n = 0
+        for row in reader:
+            if not row:
+                continue
+            if len(row) < width:
+                row = row + [""] * (width - len(row))
+            for buf, (i, _name) in zip(bufs, wanted):
+                buf.append(row[i])
+            n += 1
+            if n >= batch_size:
+                yield RecordBatch({name: _typed(name, buf) for buf, (_i, name) in zip(bufs, wanted)}, n)
+                bufs = [[] for _ in wanted]
+                n = 0
+        if n:
+            yield RecordBatch({name: _typed(name, buf) for buf, (_i, name) in zip(bufs, wanted)}, n)
+
+
+def read_header(path: Path) -> List[str]:
+    with open_text(path) as f:
+        header, _reader_rows = _reader(f)
+        return header
+
+
+def count_rows(batches: Iterable[RecordBatch]) -> Iterator[RecordBatch]:
+    # Pass-through that reports batch sizes to the current trace span
+    for batch in batches:
+        tracing.add(rows=len(batch))
+        yield batch
@@ -0,0 +1,497 @@
+#!/usr/bin/env python3
+import argparse
+import bisect
+import gzip
+import hashlib
+import heapq
+import json
+import re
+import sys
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+import registry_db
+from build_web_bundle import build_bundle, pct
+from manifest import DEFAULT_MANIFEST, artifact, load_manifest
+from recordedby_schemes import count_columns, pct_column
+from rollup import read_org_country
+
+
+COUNT_COLS = count_columns()
+# pct_* column -> counter it is derived from; total_records has none
+PCT_COLS = {pct_column(c): c for c in COUNT_COLS[1:]}
+SORT_COLUMNS = ["name"] + COUNT_COLS + list(PCT_COLS) + ["orgCount"]
+DEFAULT_SORT = "pct_valid_recordedbyid"
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 1000
+DEFAULT_PORT = 8766
+
+# Same inputs and fallbacks as build_web_bundle.py; looked up in the manifest again on every reload
+SOURCES = {
+    "publisher": ("publisher", Path("out-recordedby_publisher/0052593-251009101135966.csv")),
+    "hosting": ("hosting", Path("out-recordedby_hostingorg/0051475-251009101135966-enriched.csv")),
+    "node": ("nodeAgg", Path("out-by-node/recordedby_by_node.csv")),
+    "nodes_json": ("nodesMap", Path("out-nodes/nodes.json")),
+}
+
+_WORD_START = re.compile(r"\b\w")
+
+
+class Table:
+    # One tab as columns: string ids into the snapshot's string list, int64 counters, float64 percentages.
+    # Secondary indexes map a node, a country or a name prefix to ascending row ids.
+    def __init__(self, kind: str, tab: dict, strings: List[str], node_orgs: List[Tuple[str, List[str]]], org_country: Dict[str, str]) -> None:
+        self.kind = kind
+        self.strings = strings
+        self.key = array("l", tab["key"])
+        self.name = array("l", tab["name"])
+        self.cols: Dict[str, array] = {c: array("q", v) for c, v in tab["cols"].items()}
+        total = self.cols["total_records"]
+        for p, c in PCT_COLS.items():
+            self.cols[p] = array("d", (pct(n, t) for n, t in zip(self.cols[c], total)))
+        self.row_of = {strings[k]: i for i, k in enumerate(self.key)}
+
+        self.country: Dict[int, str] = {}
+        by_country: Dict[str, List[int]] = {}
+        self.nodes: Dict[int, List[str]] = {}
+        by_node: Dict[str, List[int]] = {}
+        if kind != "node":
+            for i, k in enumerate(self.key):
+                c = org_country.get(strings[k])
+                if c:
+                    self.country[i] = c
+                    by_country.setdefault(c, []).append(i)
+            for node_key, orgs in node_orgs:
+                rows = sorted({self.row_of[o] for o in orgs if o in self.row_of})
+                if rows:
+                    by_node[node_key] = rows
+                    for i in rows:
+                        self.nodes.setdefault(i, []).append(node_key)
+        else:
+            # A node "contains" itself, so ?node= works on every tab
+            by_node = {strings[k]: [i] for i, k in enumerate(self.key)}
+        self.by_country = {c: array("l", rows) for c, rows in by_country.items()}
+        self.by_node = {n: array("l", rows) for n, rows in by_node.items()}
+
+        # Name prefix index: every word start of the lowercased name, sorted, with its row
+        self.lname = [strings[n].lower() for n in self.name]
+        entries = sorted((name[m.start():], i) for i, name in enumerate(self.lname) for m in _WORD_START.finditer(name))
+        self.name_keys = [e[0] for e in entries]
+        self.name_rows = array("l", (e[1] for e in entries))
+
+    def __len__(self) -> int:
+        return len(self.key)
+
+    def name_prefix(self, prefix: str) -> List[int]:
+        prefix = prefix.lower()
+        lo = bisect.bisect_left(self.name_keys, prefix)
+        hi = bisect.bisect_left(self.name_keys, prefix + "\U0010ffff", lo)
+        return sorted(set(self.name_rows[lo:hi]))
+
+    def select(self, q: dict) -> List[int]:
+        candidates: List[Iterable[int]] = []
+        if q.get("key"):
+            candidates.append(sorted(self.row_of[k] for k in q["key"] if k in self.row_of))
+        if q.get("node"):
+            candidates.append(sorted({i for n in q["node"] for i in self.by_node.get(n, ())}))
+        if q.get("country"):
+            candidates.append(sorted({i for c in q["country"] for i in self.by_country.get(c, ())}))
+        if q.get("name"):
+            candidates.append(self.name_prefix(q["name"]))
+        if candidates:
+            # Intersect starting from the most selective index
+            candidates.sort(key=len)
+            rows = list(candidates[0])
+            for other in candidates[1:]:
+                keep = set(other)
+                rows = [i for i in rows if i in keep]
+        else:
+            rows = list(range(len(self)))
+        for col, (lo, hi) in q["range"].items():
+            v = self.cols[col]
+            rows = [i for i in rows if (lo is None or v[i] >= lo) and (hi is None or v[i] <= hi)]
+        return rows
+
+    def page(self, rows: List[int], sort: str, desc: bool, offset: int, limit: int) -> List[int]:
+        # Only the first offset + limit rows are ordered; ties like sortRows in scripts/app.js
+        n = offset + limit
+        if sort == "name":
+            lname = self.lname
+            pick = heapq.nlargest if desc else heapq.nsmallest
+            return pick(n, rows, key=lambda i: (lname[i], -i if desc else i))[offset:]
+        v = self.cols[sort]
+        valid = self.cols["records_with_valid_recordedbyid"]
+        total = self.cols["total_records"]
+        sign = -1 if desc else 1
+        return heapq.nsmallest(n, rows, key=lambda i: (sign * v[i], -valid[i], -total[i], i))[offset:]
+
+    def row(self, i: int) -> dict:
+        out = {"key": self.strings[self.key[i]], "name": self.strings[self.name[i]]}
+        if self.kind != "node":
+            out["country"] = self.country.get(i)
+            out["nodes"] = self.nodes.get(i, [])
+        for c in COUNT_COLS:
+            out[c] = self.cols[c][i]
+            if c in PCT_COLS.values():
+                out[pct_column(c)] = self.cols[pct_column(c)][i]
+        if "orgCount" in self.cols:
+            out["orgCount"] = self.cols["orgCount"][i]
+        return out
+
+
+class Snapshot:
+    def __init__(self, sig: Tuple, generated: str, tables: Dict[str, Table]) -> None:
+        self.sig = sig
+        self.id = hashlib.sha1(repr(sig).encode("utf-8")).hexdigest()[:12]
+        self.generated = generated
+        self.loaded = time.time()
+        self.tables = tables
+
+
+def resolve_sources(manifest: Path, registry: Optional[Path], org_country: Optional[Path], no_registry: bool = False) -> Dict[str, Optional[Path]]:
+    sources: Dict[str, Optional[Path]] = {name: artifact(key, fallback, manifest) for name, (key, fallback) in SOURCES.items()}
+    sources["manifest"] = manifest
+    sources["registry"] = None if no_registry else registry or artifact("registry", registry_db.DEFAULT_REGISTRY, manifest)
+    sources["org_country"] = org_country
+    return sources
+
+
+def signature(sources: Dict[str, Optional[Path]]) -> Tuple:
+    sig = []
+    for name, path in sorted(sources.items()):
+        try:
+            st = path.stat() if path is not None else None
+        except OSError:
+            st = None
+        sig.append((name, str(path), st.st_mtime_ns if st else None, st.st_size if st else None))
+    return tuple(sig)
+
+
+def load_countries(keys: List[str], registry: Optional[Path], org_country: Optional[Path], hosting: Path) -> Dict[str, str]:
+    if org_country is not None:
+        return read_org_country(org_country)
+    # enrich_hostingorg.py writes each hosting org's publisherCountry; older enriched CSVs lack the column
+    try:
+        countries = read_org_country(hosting)
+    except ValueError:
+        countries = {}
+    conn = registry_db.open_readonly(registry)
+    if conn is not None:
+        try:
+            orgs = registry_db.lookup_orgs(conn, keys)
+        finally:
+            conn.close()
+        countries.update((k, o["country"]) for k, o in orgs.items() if o.get("country"))
+    return countries
+
+
+def load_snapshot(sources: Dict[str, Optional[Path]]) -> Snapshot:
+    sig = signature(sources)
+    for name in ("publisher", "hosting", "node"):
+        if not sources[name].exists():
+            raise FileNotFoundError(f"Input not found: {sources[name]}")
+    bundle = build_bundle(sources["publisher"], sources["hosting"], sources["node"], sources["nodes_json"])
+    strings = bundle["strings"]
+    node_orgs = [(strings[n], [strings[o] for o in orgs]) for n, orgs in bundle["nodeOrgs"]]
+    org_keys = sorted({strings[k] for kind in ("publisher", "hosting") for k in bundle["tabs"][kind]["key"]})
+    countries = load_countries(org_keys, sources["registry"], sources["org_country"], sources["hosting"])
+    if not countries:
+        print("Warning: no organization countries found (no --org-country, registry mirror or publisherCountry column); country filters are rejected", file=sys.stderr)
+    tables = {kind: Table(kind, tab, strings, node_orgs, countries) for kind, tab in bundle["tabs"].items()}
+    return Snapshot(sig, load_manifest(sources["manifest"]).get("generated", ""), tables)
+
+
+class ResultCache:
+    # LRU of rendered responses, keyed by snapshot id and normalized query
+    def __init__(self, entries: int) -> None:
+        self.entries = entries
+        self.lock = threading.Lock()
+        self.items: "OrderedDict[str, bytes]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self.lock:
+            body = self.items.get(key)
+            if body is None:
+                self.misses += 1
+                return None
+            self.items.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def put(self, key: str, body: bytes) -> None:
+        with self.lock:
+            self.items[key] = body
+            self.items.move_to_end(key)
+            while len(self.items) > self.entries:
+                self.items.popitem(last=False)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.items.clear()
+
+
+class StatsState:
+    def __init__(self, args: argparse.Namespace) -> None:
+        self.args = args
+        self.cache = ResultCache(args.cache_entries)
+        self.lock = threading.Lock()
+        self.reloads = 0
+        self._failed: Optional[Tuple] = None
+        self.snapshot = load_snapshot(self.sources())
+
+    def sources(self) -> Dict[str, Optional[Path]]:
+        return resolve_sources(self.args.manifest, self.args.registry, self.args.org_country, self.args.no_registry)
+
+    def maybe_reload(self) -> bool:
+        # pipeline.py rewrites the manifest last, but inputs may also change on their own; a snapshot is
+        # only swapped in if the inputs did not change again while it was being built
+        sources = self.sources()
+        sig = signature(sources)
+        if sig in (self.snapshot.sig, self._failed):
+            return False
+        try:
+            snap = load_snapshot(sources)
+        except Exception as exc:
+            # Any failure keeps the old snapshot (and the watch thread) alive; reported once per state of the inputs
+            self._failed = sig
+            print(f"Reload failed, still serving snapshot {self.snapshot.id}: {exc}", file=sys.stderr)
+            return False
+        if signature(self.sources()) != snap.sig:
+            return False
+        with self.lock:
+            self.snapshot = snap
+            self.reloads += 1
+        self.cache.clear()
+        print(f"Loaded snapshot {snap.id} ({', '.join(f'{len(t)} {k}' for k, t in snap.tables.items())})", file=sys.stderr)
+        return True
+
+    def watch(self, stop: threading.Event) -> None:
+        while not stop.wait(self.args.reload_interval):
+            self.maybe_reload()
+
+
+def _one(qs: Dict[str, List[str]], name: str) -> Optional[str]:
+    values = qs.get(name)
+    if not values:
+        return None
+    if len(values) > 1:
+        raise ValueError(f"'{name}' may be given once")
+    return values[0]
+
+
+def _list(qs: Dict[str, List[str]], name: str) -> List[str]:
+    return sorted({v.strip() for value in qs.get(name, []) for v in value.split(",") if v.strip()})
+
+
+def _number(name: str, value: str) -> float:
+    try:
+        return float(value)
+    except ValueError:
+        raise ValueError(f"'{name}' must be a number") from None
+
+
+def parse_query(qs: Dict[str, List[str]], table: Table) -> dict:
+    # Normalized form of a query: equal queries give equal dicts, which key the cache and the ETag
+    known = {"key", "node", "country", "name", "sort", "order", "limit", "offset"}
+    ranges: Dict[str, List[Optional[float]]] = {}
+    for name in qs:
+        bound, _, col = name.partition("_")
+        if bound in ("min", "max") and col in table.cols:
+            r = ranges.setdefault(col, [None, None])
+            r[0 if bound == "min" else 1] = _number(name, _one(qs, name))
+        elif name not in known:
+            raise ValueError(f"Unknown parameter '{name}'")
+    sort = _one(qs, "sort") or DEFAULT_SORT
+    if sort not in table.cols and sort != "name":
+        raise ValueError(f"'sort' must be one of: {', '.join(c for c in SORT_COLUMNS if c == 'name' or c in table.cols)}")
+    order = _one(qs, "order") or ("asc" if sort == "name" else "desc")
+    if order not in ("asc", "desc"):
+        raise ValueError("'order' must be asc or desc")
+    try:
+        limit = int(_one(qs, "limit") or DEFAULT_LIMIT)
+        offset = int(_one(qs, "offset") or 0)
+    except ValueError:
+        raise ValueError("'limit' and 'offset' must be integers") from None
+    if not 0 <= limit <= MAX_LIMIT or offset < 0:
+        raise ValueError(f"'limit' must be 0..{MAX_LIMIT} and 'offset' non-negative")
+    country = [c.upper() for c in _list(qs, "country")]
+    if country and not table.by_country:
+        # An empty index would silently match nothing
+        raise ValueError(f"No organization countries are loaded for the {table.kind} tab; 'country' can't be used")
+    return {
+        "key": _list(qs, "key"),
+        "node": _list(qs, "node"),
+        "country": country,
+        "name": (_one(qs, "name") or "").strip(),
+        "range": {c: tuple(r) for c, r in sorted(ranges.items())},
+        "sort": sort,
+        "order": order,
+        "limit": limit,
+        "offset": offset,
+    }
+
+
+def run_query(snap: Snapshot, kind: str, q: dict) -> dict:
+    table = snap.tables[kind]
+    rows = table.select(q)
+    page = table.page(rows, q["sort"], q["order"] == "desc", q["offset"], q["limit"])
+    return {
+        "snapshot": snap.id,
+        "generated": snap.generated,
+        "tab": kind,
+        "offset": q["offset"],
+        "limit": q["limit"],
+        "count": len(rows),
+        "endOfRecords": q["offset"] + len(page) >= len(rows),
+        "results": [table.row(i) for i in page],
+    }
+
+
+def describe(snap: Snapshot) -> dict:
+    return {
+        "snapshot": snap.id,
+        "generated": snap.generated,
+        "tabs": {
+            kind: {
+                "rows": len(t),
+                "countries": len(t.by_country),
+                "nodes": len(t.by_node),
+                "sort": [c for c in SORT_COLUMNS if c == "name" or c in t.cols],
+            }
+            for kind, t in snap.tables.items()
+        },
+        "filters": ["key", "node", "country", "name", "min_<column>", "max_<column>"],
+    }
+
+
+def make_handler(state: StatsState):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        server_version = "GbifStats/1"
+        # Headers and body are separate writes; without this keep-alive clients wait on delayed ACKs
+        disable_nagle_algorithm = True
+
+        def log_message(self, fmt, *args) -> None:
+            if state.args.verbose:
+                sys.stderr.write("%s - %s\n" % (self.address_string(), fmt % args))
+
+        def _send(self, code: int, body: bytes = b"", headers: Optional[Dict[str, str]] = None) -> None:
+            headers = dict(headers or {})
+            if body and len(body) > 1024 and "gzip" in (self.headers.get("Accept-Encoding") or ""):
+                body = gzip.compress(body, compresslevel=5, mtime=0)
+                headers["Content-Encoding"] = "gzip"
+            self.send_response(code)
+            if code != 304:
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            for k, v in headers.items():
+                self.send_header(k, v)
+            self.end_headers()
+            if self.command != "HEAD" and body:
+                self.wfile.write(body)
+
+        def _error(self, code: int, message: str) -> None:
+            self._send(code, json.dumps({"message": message}).encode("utf-8"), {"Cache-Control": "no-store"})
+
+        def _cached(self, snap: Snapshot, cache_key: str, render) -> None:
+            # The ETag depends only on the snapshot and the normalized request, so a revalidation is
+            # answered before any query runs
+            etag = '"' + hashlib.sha1(f"{snap.id}|{cache_key}".encode("utf-8")).hexdigest()[:20] + '"'
+            headers = {"ETag": etag, "Cache-Control": f"public, max-age={state.args.max_age}", "Vary": "Accept-Encoding"}
+            if etag in (self.headers.get("If-None-Match") or ""):
+                return self._send(304, headers=headers)
+            full_key = f"{snap.id}|{cache_key}"
+            body = state.cache.get(full_key)
+            if body is None:
+                body = json.dumps(render(), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+                state.cache.put(full_key, body)
+            self._send(200, body, headers)
+
+        def do_HEAD(self) -> None:
+            self.do_GET()
+
+        def do_GET(self) -> None:
+            parts = urlsplit(self.path)
+            path = parts.path.rstrip("/")
+            snap = state.snapshot
+
+            if path == "/__stats":
+                data = {"snapshot": snap.id, "loaded": snap.loaded, "reloads": state.reloads, "cacheHits": state.cache.hits,
+                        "cacheMisses": state.cache.misses, "cacheEntries": len(state.cache.items)}
+                return self._send(200, json.dumps(data).encode("utf-8"), {"Cache-Control": "no-store"})
+            if path in ("", "/v1"):
+                return self._cached(snap, "describe", lambda: describe(snap))
+
+            m = re.fullmatch(r"/v1/([a-z]+)(?:/([^/]+))?", path)
+            if not m or m.group(1) not in snap.tables:
+                return self._error(404, f"Unknown path; tabs are {', '.join(f'/v1/{k}' for k in snap.tables)}")
+            kind, key = m.group(1), m.group(2)
+            table = snap.tables[kind]
+            if key is not None:
+                i = table.row_of.get(key)
+                if i is None:
+                    return self._error(404, f"No {kind} with key {key}")
+                return self._cached(snap, f"{kind}/{key}", lambda: {"snapshot": snap.id, "generated": snap.generated, "tab": kind, "result": table.row(i)})
+            try:
+                q = parse_query(parse_qs(parts.query), table)
+            except ValueError as exc:
+                return self._error(400, str(exc))
+            cache_key = f"{kind}?{json.dumps(q, sort_keys=True)}"
+            self._cached(snap, cache_key, lambda: run_query(snap, kind, q))
+
+    return Handler
+
+
+def make_server(args: argparse.Namespace) -> Tuple[ThreadingHTTPServer, StatsState]:
+    state = StatsState(args)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(state))
+    server.daemon_threads = True
+    return server, state
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Serve the aggregated stats as a filterable, paginated JSON API, reloading when the pipeline writes a new snapshot")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=DEFAULT_PORT)
+    p.add_argument("--manifest", type=Path, default=DEFAULT_MANIFEST, help="Pipeline manifest naming the stats files (default: out-web/manifest.json)")
+    p.add_argument("--registry", type=Path, help="SQLite registry mirror from preload_nodes.py, for organization countries (default: the manifest's, else out-nodes/registry.sqlite); opened read-only")
+    p.add_argument("--no-registry", action="store_true", help="Don't read countries from the registry mirror")
+    p.add_argument("--org-country", type=Path, help="CSV/TSV mapping organization keys to countries, instead of the registry mirror")
+    p.add_argument("--reload-interval", type=float, default=5.0, help="Seconds between checks for a new snapshot (default: 5)")
+    p.add_argument("--max-age", type=int, default=60, help="Cache-Control max-age of responses in seconds (default: 60)")
+    p.add_argument("--cache-entries", type=int, default=512, help="Rendered responses kept in the LRU (default: 512)")
+    p.add_argument("--verbose", action="store_true", help="Log every request")
+    return p.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    try:
+        server, state = make_server(args)
+    except (OSError, ValueError, KeyError) as exc:
+        print(f"Error: {exc}", file=sys.stderr)
+        return 1
+    stop = threading.Event()
+    threading.Thread(target=state.watch, args=(stop,), daemon=True).start()
+    snap = state.snapshot
+    print(f"Serving snapshot {snap.id} ({', '.join(f'{len(t)} {k}' for k, t in snap.tables.items())}) on http://{args.host}:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
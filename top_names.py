@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+import argparse
+import heapq
+import json
+import re
+import sys
+import unicodedata
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import tracing
+from rollup import HOSTING_COL, PUBLISHER_COL, read_node_org_map
+from stats_reader import count_rows, iter_batches
+
+
+NAME_COL = "recordedby"
+ID_COL = "recordedbyid"
+
+# Counters kept per entity; the reported top K come from these
+DEFAULT_CAPACITY = 200
+DEFAULT_TOP = 50
+
+_SPACES = re.compile(r"\s+")
+_SEPARATOR = re.compile(r"\s*\|\s*")
+
+
+@lru_cache(maxsize=1 << 16)
+def normalize_name(raw: str) -> Tuple[str, str]:
+    # (match key, display form); spelling variants that differ only in case, spacing or Unicode form share a key
+    name = unicodedata.normalize("NFKC", raw)
+    name = _SPACES.sub(" ", name).strip()
+    name = _SEPARATOR.sub(" | ", name).strip(" |,;")
+    return name.casefold(), name
+
+
+class SpaceSaving:
+    # Space-Saving heavy hitters (Metwally et al.): at most `capacity` counters. A newcomer takes over the
+    # smallest counter and inherits its count as error, so every estimate overcounts by at most `error`,
+    # which is never above records / capacity
+    __slots__ = ("capacity", "records", "counters", "heap")
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = capacity
+        self.records = 0
+        # key -> [count, error, display]
+        self.counters: Dict[str, list] = {}
+        # (count, key) min-heap; entries go stale as counts grow and are refreshed on eviction
+        self.heap: List[Tuple[int, str]] = []
+
+    def update(self, key: str, display: str, weight: int = 1) -> None:
+        self.records += weight
+        c = self.counters.get(key)
+        if c is not None:
+            c[0] += weight
+            return
+        if len(self.counters) < self.capacity:
+            self.counters[key] = [weight, 0, display]
+            heapq.heappush(self.heap, (weight, key))
+            return
+        heap, counters = self.heap, self.counters
+        while True:
+            count, victim = heap[0]
+            current = counters[victim][0]
+            if current == count:
+                break
+            heapq.heapreplace(heap, (current, victim))
+        del counters[victim]
+        counters[key] = [count + weight, count, display]
+        heapq.heapreplace(heap, (count + weight, key))
+
+    def max_error(self) -> int:
+        # Smallest monitored count: what an unmonitored name could at most have had
+        if len(self.counters) < self.capacity:
+            return 0
+        return min(c[0] for c in self.counters.values())
+
+    def top(self, k: int) -> List[dict]:
+        ranked = sorted(self.counters.values(), key=lambda c: (-c[0], c[2]))
+        # Members whose lower bound beats the (k+1)-th estimate are in the true top k for certain
+        cutoff = ranked[k][0] if len(ranked) > k else 0
+        return [{"name": display, "count": count, "error": error, "guaranteed": count - error >= cutoff}
+                for count, error, display in ranked[:k]]
+
+
+class TopNames:
+    # One Space-Saving summary per publisher, hosting org and node, all fed from a single pass
+    def __init__(self, capacity: int, org_to_nodes: Dict[str, List[str]]) -> None:
+        self.capacity = capacity
+        self.org_to_nodes = org_to_nodes
+        self.levels: Dict[str, Dict[str, SpaceSaving]] = {"publisher": {}, "hosting": {}, "node": {}}
+        self.rows = 0
+        self.skipped_with_id = 0
+
+    def _summary(self, level: str, key: str) -> SpaceSaving:
+        entities = self.levels[level]
+        s = entities.get(key)
+        if s is None:
+            s = entities[key] = SpaceSaving(self.capacity)
+        return s
+
+    def add(self, publisher: str, hosting: str, raw_name: str) -> None:
+        key, display = normalize_name(raw_name)
+        if not key:
+            return
+        self.rows += 1
+        if publisher:
+            self._summary("publisher", publisher).update(key, display)
+            for node in self.org_to_nodes.get(publisher, ()):
+                self._summary("node", node).update(key, display)
+        if hosting:
+            self._summary("hosting", hosting).update(key, display)
+
+    def consume(self, path: Path) -> None:
+        for batch in count_rows(iter_batches(path, columns=(PUBLISHER_COL, HOSTING_COL, NAME_COL, ID_COL))):
+            publishers = batch.column(PUBLISHER_COL)
+            hostings = batch.column(HOSTING_COL)
+            names = batch.column(NAME_COL)
+            # The SQL export is already filtered; a full occurrence export still carries the ID column
+            ids = batch.column(ID_COL) if ID_COL in batch else None
+            for i, name in enumerate(names):
+                if ids is not None and ids[i]:
+                    self.skipped_with_id += 1
+                    continue
+                if name:
+                    self.add(publishers[i], hostings[i], name)
+
+
+def write_shards(top: TopNames, out_dir: Path, k: int) -> int:
+    written = 0
+    index = {"capacity": top.capacity, "top": k, "rows": top.rows, "levels": {}}
+    for level, entities in top.levels.items():
+        level_dir = out_dir / level
+        level_dir.mkdir(parents=True, exist_ok=True)
+        for key, s in entities.items():
+            shard = {
+                "key": key,
+                "level": level,
+                "records": s.records,
+                "distinctTracked": len(s.counters),
+                "capacity": s.capacity,
+                # Any count may be high by at most maxError; the a-priori Space-Saving bound is records / capacity
+                "maxError": s.max_error(),
+                "errorBound": round(s.records / s.capacity, 3),
+                "names": s.top(k),
+            }
+            (level_dir / f"{key}.json").write_text(json.dumps(shard, ensure_ascii=False, separators=(",", ":")), encoding="utf-8")
+            written += 1
+        index["levels"][level] = sorted(entities)
+    (out_dir / "index.json").write_text(json.dumps(index, separators=(",", ":")), encoding="utf-8")
+    return written
+
+
+def org_nodes(node_org_map: Optional[Path]) -> Dict[str, List[str]]:
+    if not node_org_map or not node_org_map.exists():
+        return {}
+    org_to_nodes: Dict[str, List[str]] = {}
+    for node_key, orgs in read_node_org_map(node_org_map).items():
+        for org_key, _title in orgs:
+            org_to_nodes.setdefault(org_key, []).append(node_key)
+    return org_to_nodes
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="One pass over an occurrence export: most frequent recordedBy names without recordedByID per publisher, hosting org and node")
+    p.add_argument("export", type=Path, help="Result of recordedby-names-without-id.sql (TSV or ZIP), or any occurrence export with publishingOrgKey, hostingOrganizationKey and recordedBy columns")
+    p.add_argument("--node-org-map", type=Path, default=Path("out-nodes/node-org-map.csv"), help="Node -> publishing org mapping from preload_nodes.py; without it no node shards are written")
+    p.add_argument("--out-dir", type=Path, default=Path("out-topnames"), help="Shard directory read by the viewer (default: out-topnames)")
+    p.add_argument("--top", type=int, default=DEFAULT_TOP, help=f"Names written per entity (default: {DEFAULT_TOP})")
+    p.add_argument("--capacity", type=int, default=DEFAULT_CAPACITY, help=f"Counters kept per entity; memory is entities x capacity and the error bound records / capacity (default: {DEFAULT_CAPACITY})")
+    tracing.add_trace_argument(p)
+    return p.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    if args.capacity < args.top:
+        print("--capacity must be at least --top", file=sys.stderr)
+        return 2
+    tracing.configure(args.trace, "top_names")
+    try:
+        top = TopNames(args.capacity, org_nodes(args.node_org_map))
+        with tracing.span("scan"):
+            top.consume(args.export)
+        with tracing.span("write_shards"):
+            written = write_shards(top, args.out_dir, args.top)
+    finally:
+        tracing.finish()
+    if top.skipped_with_id:
+        print(f"Skipped {top.skipped_with_id} rows that have a recordedByID")
+    print(f"Counted {top.rows} names; wrote {written} shards to {args.out_dir}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+import argparse
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Counters a span can carry; anything else passed to span()/add() is kept as a plain attribute
+COUNTERS = ("rows", "bytes", "http_calls", "retries", "cache_hits")
+
+
+class Span:
+    def __init__(self, name: str, parent: Optional[str], attrs: Dict[str, object]) -> None:
+        self.name = name
+        self.parent = parent
+        self.thread = threading.get_ident()
+        self.start = time.time()
+        self.end: Optional[float] = None
+        self.attrs: Dict[str, object] = dict(attrs)
+        self._lock = threading.Lock()
+
+    def add(self, **counters: int) -> None:
+        # Called from worker threads as well
+        with self._lock:
+            for k, v in counters.items():
+                self.attrs[k] = self.attrs.get(k, 0) + v
+
+    def set(self, **attrs: object) -> None:
+        with self._lock:
+            self.attrs.update(attrs)
+
+    @property
+    def duration(self) -> float:
+        return (self.end or time.time()) - self.start
+
+
+class _NullSpan:
+    def add(self, **counters: int) -> None:
+        pass
+
+    def set(self, **attrs: object) -> None:
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Tracer:
+    def __init__(self) -> None:
+        self.path: Optional[Path] = None
+        self.enabled = False
+        self.process = ""
+        self.spans: List[Span] = []
+        # Open spans of the current thread or task, innermost last; worker threads get their
+        # submitter's stack through bind()
+        self._stack: contextvars.ContextVar[Tuple[Span, ...]] = contextvars.ContextVar("tracing_stack", default=())
+        self._lock = threading.Lock()
+        self._root = None
+        self._root_span: Optional[Span] = None
+        self.origin = time.time()
+
+    def configure(self, path: Optional[Path], process: str) -> None:
+        self.path = path
+        self.enabled = path is not None
+        self.process = process
+        self.origin = time.time()
+        if self.enabled:
+            self._root = self.span(process)
+            self._root_span = self._root.__enter__()
+
+    def current(self):
+        if not self.enabled:
+            return _NULL_SPAN
+        stack = self._stack.get()
+        if stack:
+            return stack[-1]
+        # A thread started without bind(): count towards the process, not whichever span is open elsewhere
+        return self._root_span or _NULL_SPAN
+
+    @contextmanager
+    def span(self, name: str, **attrs: object) -> Iterator:
+        if not self.enabled:
+            yield _NULL_SPAN
+            return
+        stack = self._stack.get()
+        sp = Span(name, stack[-1].name if stack else None, attrs)
+        token = self._stack.set(stack + (sp,))
+        try:
+            yield sp
+        finally:
+            sp.end = time.time()
+            self._stack.reset(token)
+            with self._lock:
+                self.spans.append(sp)
+
+    def bind(self, fn: Callable) -> Callable:
+        # Wrap fn so that, on whatever thread it runs, spans and counters nest under the caller's current span
+        stack = self._stack.get()
+
+        def run(*args, **kwargs):
+            token = self._stack.set(stack)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self._stack.reset(token)
+        return run
+
+    def add(self, **counters: int) -> None:
+        if self.enabled:
+            self.current().add(**counters)
+
+    def finish(self) -> None:
+        if not self.enabled:
+            return
+        if self._root is not None:
+            self._root.__exit__(None, None, None)
+            self._root = None
+            self._root_span = None
+        self.write(self.path)
+        print_summary(self.spans, sys.stderr)
+        self.enabled = False
+
+    def write(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        spans = sorted(self.spans, key=lambda s: s.start)
+        if path.suffix == ".json":
+            # Chrome trace event format (chrome://tracing, Perfetto)
+            events = [{
+                "name": s.name,
+                "cat": self.process,
+                "ph": "X",
+                "ts": round((s.start - self.origin) * 1e6),
+                "dur": round(s.duration * 1e6),
+                "pid": os.getpid(),
+                "tid": s.thread,
+                "args": s.attrs,
+            } for s in spans]
+            path.write_text(json.dumps({"traceEvents": events, "displayTimeUnit": "ms"}), encoding="utf-8")
+        else:
+            with path.open("a", encoding="utf-8") as f:
+                for s in spans:
+                    record = {"process": self.process, "pid": os.getpid(), "span": s.name, "parent": s.parent, "thread": s.thread,
+                              "start": s.start, "end": s.end, "duration_s": round(s.duration, 6)}
+                    record.update(s.attrs)
+                    f.write(json.dumps(record) + "\n")
+
+
+def print_summary(spans: Iterable[Span], out) -> None:
+    totals: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+    order: List[str] = []
+    for s in sorted(spans, key=lambda s: s.start):
+        t = totals[s.name]
+        if not t:
+            order.append(s.name)
+        t["count"] += 1
+        t["seconds"] += s.duration
+        for c in COUNTERS:
+            v = s.attrs.get(c)
+            if isinstance(v, (int, float)):
+                t[c] += v
+    print(f"{'stage':<22} {'n':>4} {'seconds':>9} {'rows':>10} {'MB':>9} {'http':>6} {'retry':>6} {'cached':>6} {'rate':>14}", file=out)
+    for name in order:
+        t = totals[name]
+        secs = t["seconds"]
+        if t["bytes"] and secs > 0:
+            rate = f"{t['bytes'] / secs / 1e6:.1f} MB/s"
+        elif t["rows"] and secs > 0:
+            rate = f"{t['rows'] / secs:.0f} rows/s"
+        elif t["http_calls"] and secs > 0:
+            rate = f"{t['http_calls'] / secs:.1f} req/s"
+        else:
+            rate = ""
+        print(f"{name:<22} {int(t['count']):>4} {secs:>9.2f} {int(t['rows']):>10} {t['bytes'] / 1e6:>9.1f} {int(t['http_calls']):>6} {int(t['retries']):>6} {int(t['cache_hits']):>6} {rate:>14}", file=out)
+
+
+TRACER = Tracer()
+
+
+def span(name: str, **attrs: object):
+    return TRACER.span(name, **attrs)
+
+
+def add(**counters: int) -> None:
+    TRACER.add(**counters)
+
+
+def bind(fn: Callable) -> Callable:
+    return TRACER.bind(fn)
+
+
+def counted(rows: Iterable, counter: str = "rows") -> Iterator:
+    # Pass-through iterator that reports how many items went through it to the current span
+    n = 0
+    try:
+        for item in rows:
+            n += 1
+            yield item
+    finally:
+        TRACER.add(**{counter: n})
+
+
+def add_trace_argument(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--trace", type=Path, help="Record stage spans to this file: .json writes a Chrome trace, anything else appends JSON lines. Prints a summary table at exit")
+
+
+def configure(path: Optional[Path], process: str) -> None:
+    TRACER.configure(path, process)
+
+
+def finish() -> None:
+    TRACER.finish()